@@ -1,11 +1,13 @@
-import datetime
 import logging
 
-from api.lastfm.user.library import get_library_data
-from api.lastfm.user.profile import get_user_data
-from pypresence.presence import Presence
-from pypresence import exceptions
+from api.discord.templates import PresenceTemplates, presence_templates
+from api.lastfm.enrichment import Enricher, stages_for
+from utils.cache_manager import cache_manager
 from utils.url_utils import url_encoder
+from utils.metrics import metrics
+from utils.tracing import tracer
+from utils.clock import clock
+from utils.startup import startup
 from constants.project import (
     CLIENT_ID, 
     DAY_MODE_COVER, NIGHT_MODE_COVER,
@@ -17,6 +19,13 @@ from constants.project import (
 logger = logging.getLogger('rpc')
 
 class DiscordRPC:
+    # Display options kept in the warm-start snapshot
+    DISPLAY_OPTIONS = (
+        'show_scrobbles', 'show_artists', 'show_loved', 'show_small_image',
+        'use_custom_profile_image', 'use_default_icon', 'use_lastfm_icon',
+        'show_username', 'show_artist_scrobbles_large'
+    )
+
     def __init__(self):
         """
         Initializes the DiscordRPC class.
@@ -25,6 +34,10 @@ class DiscordRPC:
         when enable() is called.
         """
         self.RPC = None
+        self.presence_factory = self._create_presence # Replaced when recording or replaying
+        self.discord_enabled = True # False publishes to the sinks only
+        self.sinks = [] # Additional outputs, see core/sinks.py
+        self._sinks_published = False
         self._enabled = False
         self._disabled = True
         self.start_time = None
@@ -51,23 +64,63 @@ class DiscordRPC:
         self.last_fetched_track = None
         self.cached_user_data = None
         self.cached_library_data = None
+        self.cached_extra_data = {} # Optional stage fields such as loved and tags
+        cache_manager.register_slots('stats', self, ('cached_user_data', 'cached_library_data', 'cached_extra_data'))
+
+        self.templates = presence_templates
+        # Only the stages whose fields the templates (or the small image's avatar) use
+        self.enricher = Enricher(stages_for(self.templates.sources | {'avatar_url'}))
+        self._refresh_track = None # Track published with missing stats, rendered once more
+
+    def export_state(self):
+        """Returns the display options and the cached stats for the warm-start snapshot."""
+        return {
+            'display_options': {option: getattr(self, option) for option in self.DISPLAY_OPTIONS},
+            'stats_track': self.last_fetched_track,
+            'user_data': self.cached_user_data,
+            'library_data': self.cached_library_data,
+        }
+
+    def restore_state(self, state, with_stats=True):
+        """
+        Restores a state returned by export_state().
+
+        The stats are only restored with with_stats, since they belong to one user.
+        """
+        options = state.get('display_options')
+        for option, value in (options.items() if isinstance(options, dict) else ()):
+            if option in self.DISPLAY_OPTIONS and isinstance(value, bool):
+                setattr(self, option, value)
+        user_data, library_data = state.get('user_data'), state.get('library_data')
+        if with_stats and user_data and library_data and isinstance(user_data, dict) and isinstance(library_data, dict):
+            self.last_fetched_track = state.get('stats_track')
+            self.cached_user_data = user_data
+            self.cached_library_data = library_data
 
     @property
     def is_connected(self):
         """Returns whether the RPC is currently connected and active."""
         return self._enabled and not self._disabled
 
+    @staticmethod
+    def _create_presence():
+        """Creates the pypresence client. Imported here to keep it off the startup path."""
+        from pypresence.presence import Presence
+        return Presence(CLIENT_ID)
+
     def _connect(self):
         """
         Establishes a connection to Discord.
         """
-        if not self._enabled:
+        if not self._enabled and self.discord_enabled:
+            from pypresence import exceptions
+
             try:
                 if self.RPC is None:
-                    self.RPC = Presence(CLIENT_ID)
+                    self.RPC = self.presence_factory()
                 
                 self.RPC.connect()
-                self.connection_time = datetime.datetime.now()
+                self.connection_time = clock.now()
                 logger.info('Connected with Discord')
                 self._enabled = True
                 self._disabled = False
@@ -110,15 +163,52 @@ class DiscordRPC:
         it clears the current RPC state and closes the connection.
         """
         self._disconnect()
+        if self._sinks_published:
+            self._publish_to_sinks({'event': 'clear', 'time': round(clock.time(), 3), 'discord': self._discord_state()})
+            self._sinks_published = False
+            self.last_track = None
 
-    def _format_image_text(self, lines, limit, xchar):
-        """Processes and formats text for RPC images while strictly preserving comments."""
-        logger.debug(f"Format Text: {list(lines.keys())}")
+    def _discord_state(self):
+        """The Discord connection state included in sink events."""
+        return {
+            'enabled': self.discord_enabled,
+            'connected': self.is_connected,
+            'connected_since': self.connection_time.timestamp() if self.connection_time else None,
+        }
+
+    def _publish_to_sinks(self, event):
+        """Sends an event to every sink. A failing sink is logged and does not affect the others."""
+        published = False
+        for sink in self.sinks:
+            try:
+                with tracer.span(f'sink_{sink.name}'):
+                    sink.publish(event)
+                published = True
+            except Exception as e:
+                logger.error(f"Error publishing to the {sink.name} sink: {e}")
+        return published
+
+    def close_sinks(self):
+        """Closes every sink. Called once on shutdown."""
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                logger.error(f"Error closing the {sink.name} sink: {e}")
+
+    def _format_image_text(self, lines, limit, xchar, large=None):
+        """
+        Processes and formats text for RPC images while strictly preserving comments.
+
+        large selects the large image padding for every line; if None, it is
+        chosen per line by its key.
+        """
+        logger.debug("Format Text: %s", list(lines.keys()))
         result_text = ''
         
         for line_key in lines:
             line = f'{lines[line_key]} '
-            if line_key in ['theme', 'artist_scrobbles', 'first_time']:
+            if large or (large is None and line_key in ['theme', 'artist_scrobbles', 'first_time']):
                 # Processing logic for large image lines
                 if len(lines) == 1: 
                     result_text = line
@@ -139,28 +229,43 @@ class DiscordRPC:
             
         return result_text
 
-    def _prepare_artwork_status(self, artwork, artist_count, library_data):
-        """Handles artwork fallback and library scrobble counts."""
-        large_image_lines = {}
+    def _prepare_artwork_status(self, artwork):
+        """Handles artwork fallback. Returns the artwork and the cover theme, None unless the default cover is used."""
+        cover_theme = None
         
         # artwork
         if artwork is None:
             # if there is no artwork, use the default one
-            now = datetime.datetime.now()
+            now = clock.now()
             #day: false, night: true
             is_day = now.hour >= 18 or now.hour < 9 
             artwork = DAY_MODE_COVER if is_day else NIGHT_MODE_COVER
-            large_image_lines['theme'] = f"{'Night' if is_day else 'Day'} Mode Cover"
-
-        if artist_count:
-            # if the artist is in the library
-            if self.show_artist_scrobbles_large:
-                track_count = library_data["track_count"]
-                large_image_lines["artist_scrobbles"] = f'Scrobbles: {artist_count}/{track_count}' if track_count else f'Scrobbles: {artist_count}'
-        else:
-            large_image_lines['first_time'] = 'First time listening!'
+            cover_theme = 'Night' if is_day else 'Day'
             
-        return artwork, large_image_lines
+        return artwork, cover_theme
+
+    def _template_context(self, username, title, artist, album, cover_theme, time_remaining, user_data, library_data):
+        """Collects the template fields (see api/discord/templates.py). Fields that were not fetched are None."""
+        scrobbles, artists, loved_tracks = user_data.get("header_status") or (None, None, None)
+        artist_count = library_data.get("artist_count")
+        return {
+            'title': title,
+            'artist': artist,
+            # The pollers pass str(album), so a track without one arrives as 'None'
+            'album': album if album and album != 'None' else None,
+            'username': username,
+            'cover_theme': cover_theme,
+            'time_remaining': time_remaining > 0,
+            'display_name': user_data.get("display_name"),
+            'scrobbles': scrobbles,
+            'artists': artists,
+            'loved_tracks': loved_tracks,
+            'artist_scrobbles': artist_count,
+            'first_listen': artist_count == 0,
+            'track_scrobbles': library_data.get("track_count"),
+            'loved': self.cached_extra_data.get('loved'),
+            'tags': self.cached_extra_data.get('tags'),
+        }
 
     def _prepare_buttons(self, username, artist, title, album):
         """
@@ -176,121 +281,170 @@ class DiscordRPC:
             {"label": "Search on YouTube Music", "url": str(YT_MUSIC_SEARCH_TEMPLATE.format(query=url_encoder(album)))}
         ]
 
-    def update_status(self, track, title, artist, album, time_remaining, username, artwork):
-        # logger.debug(f"Update: track={track}, title={title}, artist={artist}, album={album}, time={time_remaining}")
-
-        if len(title) < 2:
-            title = title + ' '
-
-        if self.last_track == track and self.current_artist is not None:
-            # if the track is the same as the last track AND we already have stats, don't update
-            return
-
-        # Pre-process status flags
+    def _build_update_assets(self, username, title, artist, album, artwork, time_remaining, user_data, library_data):
+        """Renders the presence payload passed to Presence.update()."""
         album_bool = album is not None
         time_remaining_bool = time_remaining > 0
-        if time_remaining_bool:
-            time_remaining = float(str(time_remaining)[0:3])
-
-        logger.info(f'Album: {album} | Time Remaining: {time_remaining_bool} - {time_remaining} | Now Playing: {track}')
-
-        self.start_time = datetime.datetime.now().timestamp()
-        self.last_track = track
-        track_artist_album = f'{artist} - {album}'
-        
-        # 1. Fetch Data (with caching)
-        if self.last_fetched_track == track and self.cached_user_data and self.cached_library_data:
-            user_data = self.cached_user_data
-            library_data = self.cached_library_data
-            logger.debug(f"Using cached Last.fm stats for {track}")
-        else:
-            user_data = get_user_data(username)
-            if not user_data:
-                logger.error(f"User data not found for {username}")
-                return
-            
-            logger.info(f"User data found for {username}")
-            logger.debug(f"User data: {user_data}")
-    
-            library_data = get_library_data(username, artist, title)
-            if not library_data:
-                logger.error(f"Library data not found for {username}")
-                return
-            
-            logger.info(f"Library data found for {username}")
-            logger.debug(f"Library data: {library_data}")
-            
-            # Update cache
-            self.last_fetched_track = track
-            self.cached_user_data = user_data
-            self.cached_library_data = library_data
-
-        # 2. Prepare Display Data
         rpc_buttons = self._prepare_buttons(username, artist, title, album)
 
+        # Handle artwork via helper
+        artwork, cover_theme = self._prepare_artwork_status(artwork)
 
-        # Unpack User Info
-        user_display_name = user_data["display_name"]
-        scrobbles, artists, loved_tracks = user_data["header_status"] # unpacking
-        artist_count = library_data["artist_count"]
+        # Any stat may be missing if its stage did not finish in time; lines using it are left out
+        context = self._template_context(username, title, artist, album, cover_theme, time_remaining,
+                                         user_data, library_data)
+        templates = self.templates
 
-        small_image_lines = {}
-        if self.show_username:
-             small_image_lines['name'] = f"{user_display_name} (@{username})"
-        
-        if self.show_scrobbles:
-            small_image_lines["scrobbles"] = f'Scrobbles: {scrobbles}'
-        if self.show_artists:
-            small_image_lines["artists"] = f'Artists: {artists}'
-        if self.show_loved:
-            small_image_lines["loved_tracks"] = f'Loved Tracks: {loved_tracks}'
+        # The tray's display options hide fields from the image texts
+        small_context = dict(context)
+        if not self.show_username:
+            small_context['username'] = small_context['display_name'] = None
+        if not self.show_scrobbles:
+            small_context['scrobbles'] = None
+        if not self.show_artists:
+            small_context['artists'] = None
+        if not self.show_loved:
+            small_context['loved_tracks'] = None
+        large_context = dict(context)
+        if not self.show_artist_scrobbles_large:
+            large_context['artist_scrobbles'] = large_context['track_scrobbles'] = None
 
-        # Handle artwork and large image lines via helper
-        artwork, large_image_lines = self._prepare_artwork_status(artwork, artist_count, library_data)
+        small_image_lines = PresenceTemplates.render_lines(templates.small_text, small_context)
+        large_image_lines = PresenceTemplates.render_lines(templates.large_text, large_context)
 
         # Call the helper for text processing
-        rpc_small_image_text = self._format_image_text(small_image_lines, RPC_LINE_LIMIT, RPC_XCHAR)
-        rpc_large_image_text = self._format_image_text(large_image_lines, RPC_LINE_LIMIT, RPC_XCHAR)
+        rpc_small_image_text = self._format_image_text(small_image_lines, RPC_LINE_LIMIT, RPC_XCHAR, large=False)
+        rpc_large_image_text = self._format_image_text(large_image_lines, RPC_LINE_LIMIT, RPC_XCHAR, large=True)
         
         # Fallback if large text is empty (required by Discord if large_image is present)
         if not rpc_large_image_text or rpc_large_image_text.strip() == "":
-             rpc_large_image_text = album if album else "Listening now"
-
-        self.current_artist = artist
-        self.artist_scrobbles = artist_count
+             rpc_large_image_text = context['album'] or "Listening now"
 
         # Prepare small image logic
         small_image_asset = None
         if self.show_small_image:
              if self.use_custom_profile_image:
-                 small_image_asset = user_data["avatar_url"]
+                 small_image_asset = user_data.get("avatar_url")
              elif self.use_default_icon:
                  small_image_asset = DEFAULT_AVATAR_URL
              elif self.use_lastfm_icon:
                  small_image_asset = LASTFM_ICON_URL
                  
-        update_assets = {
-            'details': title,
+        return {
+            'details': templates.details.render(context) or title,
             'buttons': rpc_buttons,
             'small_image': small_image_asset,
             'small_text': rpc_small_image_text,
             'large_text': rpc_large_image_text,
             # situation-dependent assets
             'large_image': 'artwork' if not time_remaining_bool and not album_bool else artwork,
-            'state': track_artist_album if time_remaining_bool and not album_bool else artist,
+            'state': templates.state.render(context) or artist,
             'end': time_remaining + self.start_time if time_remaining_bool else None}
 
+    def update_status(self, track, title, artist, album, time_remaining, username, artwork):
+        # logger.debug(f"Update: track={track}, title={title}, artist={artist}, album={album}, time={time_remaining}")
+
+        if len(title) < 2:
+            title = title + ' '
+
+        is_refresh = self.last_track == track
+        if is_refresh and self.current_artist is not None:
+            if self._refresh_track != track:
+                # if the track is the same as the last track AND we already have stats, don't update
+                return
+            # The last update went out with missing stats: render once more with the stages that finished since
+            self._refresh_track = None
+
+        # Pre-process status flags
+        album_bool = album is not None
+        time_remaining_bool = time_remaining > 0
+        if time_remaining_bool:
+            time_remaining = float(str(time_remaining)[0:3])
+
+        logger.info(f'Album: {album} | Time Remaining: {time_remaining_bool} - {time_remaining} | Now Playing: {track}')
+
+        if not is_refresh:
+            self.start_time = clock.now().timestamp()
+        self.last_track = track
+        
+        # 1. Fetch Data (with caching)
+        if self.last_fetched_track == track and self.cached_user_data and self.cached_library_data:
+            user_data = self.cached_user_data
+            library_data = self.cached_library_data
+            metrics.inc('cache_hits_total', ('cache', 'stats'))
+            tracer.current().set('stats_cache_hit', True)
+            logger.debug("Using cached Last.fm stats for %s", track)
+        else:
+            metrics.inc('cache_misses_total', ('cache', 'stats'))
+            with tracer.span('enrich'):
+                result = self.enricher.run(username, artist, title, track)
+            user_data = {field: result.get(field) for field in ('display_name', 'avatar_url', 'header_status')}
+            library_data = {field: result.get(field) for field in ('artist_count', 'track_count')}
+            self.cached_extra_data = {field: result.fields[field] for field in ('loved', 'tags') if field in result.fields}
+            logger.debug("User data: %s", user_data)
+            logger.debug("Library data: %s", library_data)
+
+            if result.complete:
+                # Update cache
+                self.last_fetched_track = track
+                self.cached_user_data = user_data
+                self.cached_library_data = library_data
+            else:
+                missing = sorted(result.skipped) + sorted(result.stale)
+                logger.warning(f"Publishing {track} without up-to-date {', '.join(missing)}")
+                if not is_refresh:
+                    self._refresh_track = track
+
+        # 2. Prepare Display Data
+        with tracer.span('render'):
+            update_assets = self._build_update_assets(
+                username, title, artist, album, artwork, time_remaining, user_data, library_data
+            )
+
+        self.current_artist = artist
+        self.artist_scrobbles = library_data.get("artist_count")
+
         # logging
         state = 'with album' if album_bool else 'without album'
         time_state = 'time' if time_remaining_bool else 'no time'
-        logger.debug(f'Update state: {state}, {time_state}')
-        logger.debug(f"RPC update_assets: {update_assets}") # Debug artwork URL
+        logger.debug('Update state: %s, %s', state, time_state)
+        logger.debug("RPC update_assets: %s", update_assets) # Debug artwork URL
 
         if self.RPC:
             try:
-                self.RPC.update(**update_assets)
+                with tracer.span('publish'):
+                    self.RPC.update(**update_assets)
+                startup.mark('first_presence')
             except Exception as e:
                 logger.error(f'Error updating RPC: {e}')
                 # If update fails (e.g. BrokenPipe, Request Terminated), force disconnect
                 # so the app effectively tries to reconnect on next cycle.
                 self._disconnect()
+
+        if self.sinks:
+            scrobbles, artists, loved_tracks = user_data.get("header_status") or (None, None, None)
+            event = {
+                'event': 'presence',
+                'time': round(clock.time(), 3),
+                'username': username,
+                'track': track,
+                'title': title,
+                'artist': artist,
+                'album': album,
+                'artwork': artwork,
+                'duration': time_remaining,
+                'started_at': self.start_time,
+                'stats': {
+                    'scrobbles': scrobbles,
+                    'artists': artists,
+                    'loved_tracks': loved_tracks,
+                    'artist_scrobbles': library_data.get("artist_count"),
+                    'track_scrobbles': library_data.get("track_count"),
+                },
+                **self.cached_extra_data,
+                'activity': update_assets,
+                'discord': self._discord_state(),
+            }
+            if self._publish_to_sinks(event):
+                self._sinks_published = True
+                startup.mark('first_presence')
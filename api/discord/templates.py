@@ -0,0 +1,218 @@
+import logging
+
+from constants.project import PRESENCE_CONFIG
+
+logger = logging.getLogger('rpc')
+
+# Template fields and the enrichment field each is read from (None: known without enrichment)
+FIELDS = {
+    'title': None,
+    'artist': None,
+    'album': None,
+    'username': None,
+    'cover_theme': None, # 'Day' or 'Night' while the default cover is shown
+    'time_remaining': None, # True while the presence counts down the track's remaining time
+    'display_name': 'display_name',
+    'scrobbles': 'header_status',
+    'artists': 'header_status',
+    'loved_tracks': 'header_status',
+    'artist_scrobbles': 'artist_count',
+    'first_listen': 'artist_count', # True when the artist has no scrobbles yet
+    'track_scrobbles': 'track_count',
+    'loved': 'loved',
+    'tags': 'tags',
+}
+
+# Used for every template that is not set in config.yaml, and for those that do not compile
+DEFAULTS = {
+    'DETAILS': '{title}',
+    'STATE': '{artist}',
+    'LARGE_TEXT': [
+        '{cover_theme} Mode Cover',
+        '{?artist_scrobbles}Scrobbles: {artist_scrobbles}[{?track_scrobbles}/{track_scrobbles}]',
+        '{?first_listen}First time listening!',
+    ],
+    'SMALL_TEXT': [
+        '{display_name} (@{username})',
+        '{!display_name}@{username}',
+        'Scrobbles: {scrobbles}',
+        'Artists: {artists}',
+        'Loved Tracks: {loved_tracks}',
+    ],
+}
+
+class TemplateError(ValueError):
+    """Raised for a template that cannot be parsed or uses an unknown field."""
+
+def _available(value):
+    return value is not None and value is not False and value != '' and value != []
+
+def _text(value):
+    if isinstance(value, (list, tuple)):
+        return ', '.join(str(item) for item in value)
+    return str(value)
+
+class Template:
+    """
+    A template compiled to a format string and the fields that fill it.
+
+    Syntax:
+        {field}   the field's value; the template renders nothing if it is missing
+        {?field}  renders nothing itself, but requires the field to be truthy (0 is not)
+        {!field}  renders nothing itself, but requires the field to be falsy or missing
+        [...]     an optional part, left out when a field inside it is missing
+        {{ }} [[ ]]  literal braces and brackets
+
+    A field is missing when it is None, False, empty, or was not fetched
+    in time. Lists such as the tags are joined with commas.
+    """
+
+    __slots__ = ('source', '_format', '_slots', '_required', '_conditions', '_negations', 'fields')
+
+    def __init__(self, source, _parts=None):
+        self.source = source
+        if _parts is None:
+            _parts, end = self._parse(source, 0)
+            if end != len(source):
+                raise TemplateError(f"Unmatched ']' in {source!r}")
+        pieces = []
+        self._slots = [] # field names and nested optional Templates, in format order
+        self._required = []
+        self._conditions = []
+        self._negations = []
+        self.fields = set()
+        for kind, value in _parts:
+            if kind == 'text':
+                pieces.append(value.replace('{', '{{').replace('}', '}}'))
+            elif kind == 'field':
+                pieces.append('{}')
+                self._slots.append(value)
+                self._required.append(value)
+                self.fields.add(value)
+            elif kind == 'condition':
+                self._conditions.append(value)
+                self.fields.add(value)
+            elif kind == 'negation':
+                self._negations.append(value)
+                self.fields.add(value)
+            else:
+                pieces.append('{}')
+                optional = Template(source, value)
+                self._slots.append(optional)
+                self.fields |= optional.fields
+        self._format = ''.join(pieces)
+
+    @classmethod
+    def _parse(cls, source, index, nested=False):
+        parts = []
+        text = []
+        while index < len(source):
+            char = source[index]
+            pair = source[index:index + 2]
+            if pair in ('{{', '}}', '[[', ']]'):
+                text.append(char)
+                index += 2
+            elif char == '{':
+                end = source.find('}', index)
+                if end == -1:
+                    raise TemplateError(f"Unclosed '{{' in {source!r}")
+                name = source[index + 1:end].strip()
+                kind = {'?': 'condition', '!': 'negation'}.get(name[:1], 'field')
+                name = name.lstrip('?!').strip()
+                if name not in FIELDS:
+                    raise TemplateError(f"Unknown field {name!r} in {source!r}")
+                if text:
+                    parts.append(('text', ''.join(text)))
+                    text = []
+                parts.append((kind, name))
+                index = end + 1
+            elif char == '}':
+                raise TemplateError(f"Unmatched '}}' in {source!r}")
+            elif char == '[':
+                if text:
+                    parts.append(('text', ''.join(text)))
+                    text = []
+                optional, index = cls._parse(source, index + 1, nested=True)
+                parts.append(('optional', optional))
+            elif char == ']':
+                if not nested:
+                    break
+                if text:
+                    parts.append(('text', ''.join(text)))
+                return parts, index + 1
+            else:
+                text.append(char)
+                index += 1
+        if nested:
+            raise TemplateError(f"Unclosed '[' in {source!r}")
+        if text:
+            parts.append(('text', ''.join(text)))
+        return parts, index
+
+    def render(self, context):
+        """Returns the rendered text, or None if a required field is missing."""
+        for name in self._conditions:
+            if not context.get(name):
+                return None
+        for name in self._negations:
+            if context.get(name):
+                return None
+        for name in self._required:
+            if not _available(context.get(name)):
+                return None
+        values = []
+        for slot in self._slots:
+            if isinstance(slot, str):
+                values.append(_text(context[slot]))
+            else:
+                values.append(slot.render(context) or '')
+        return self._format.format(*values)
+
+    def __repr__(self):
+        return f'Template({self.source!r})'
+
+class PresenceTemplates:
+    """The compiled details, state, large_text and small_text templates of the presence."""
+
+    def __init__(self, details, state, large_text, small_text):
+        self.details = details
+        self.state = state
+        self.large_text = large_text
+        self.small_text = small_text
+        templates = [details, state, *large_text, *small_text]
+        self.fields = set().union(*(template.fields for template in templates))
+
+    @property
+    def sources(self):
+        """The enrichment fields the templates read."""
+        return {FIELDS[field] for field in self.fields if FIELDS[field] is not None}
+
+    @classmethod
+    def from_config(cls, config=PRESENCE_CONFIG):
+        """Compiles the templates of the PRESENCE section, falling back to the default for any that fails."""
+        compiled = {}
+        for key, default in DEFAULTS.items():
+            value = config.get(key)
+            if value is None:
+                value = default
+            try:
+                if isinstance(default, list):
+                    compiled[key] = [Template(str(line)) for line in value]
+                else:
+                    compiled[key] = Template(str(value))
+            except TemplateError as e:
+                logger.error(f"Invalid PRESENCE.{key} template, using the default: {e}")
+                compiled[key] = [Template(line) for line in default] if isinstance(default, list) else Template(default)
+        return cls(compiled['DETAILS'], compiled['STATE'], compiled['LARGE_TEXT'], compiled['SMALL_TEXT'])
+
+    @staticmethod
+    def render_lines(templates, context):
+        """Renders a list of line templates, leaving out the lines that render nothing."""
+        lines = {}
+        for index, template in enumerate(templates):
+            text = template.render(context)
+            if text:
+                lines[index] = text
+        return lines
+
+presence_templates = PresenceTemplates.from_config()
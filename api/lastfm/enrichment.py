@@ -0,0 +1,345 @@
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from constants.project import ENRICHMENT_BUDGET, ENRICHMENT_STAGES, ENRICHMENT_TIMEOUTS, ENRICHMENT_WORKERS
+from utils.cache_manager import cache_manager
+from utils.clock import clock
+from utils.metrics import metrics
+from utils.tracing import tracer
+
+logger = logging.getLogger('enrichment')
+
+# Stage results, shared by every Enricher and held to the cache manager's budget.
+# An entry costs about one web request to rebuild.
+_cache = cache_manager.cache('enrichment', cost=0.5)
+
+# Counter incremented for each reason a stage is skipped
+SKIP_COUNTERS = {
+    'timeout': 'enrich_timeouts_total', # the stage's own timeout passed
+    'budget': 'enrich_budget_exceeded_total', # the track's budget ran out first
+    'error': 'enrich_errors_total',
+}
+
+class Stage:
+    """
+    One piece of track enrichment, such as the profile counters or the tags.
+
+    func(context) returns a dict of fields; the context holds 'username',
+    'artist', 'title' and 'track'. The cache policy is the key, which says
+    which results can be shared (e.g. per track or per artist), the ttl in
+    seconds (None keeps an entry as long as it is in the cache), and
+    stale_ok, which allows the last result for any key to stand in when
+    the stage fails or runs late. after_play(fields, played, context)
+    corrects a result prefetched while another track played for that
+    track's scrobble; played holds its 'artist', 'title' and the 'fields'
+    gathered while it played.
+    """
+
+    def __init__(self, name, func, provides, timeout, key, ttl=None, stale_ok=False, after_play=None):
+        self.name = name
+        self.func = func
+        self.provides = tuple(provides)
+        self.timeout = timeout
+        self.key = key
+        self.ttl = ttl
+        self.stale_ok = stale_ok
+        self.after_play = after_play
+
+    def __repr__(self):
+        return f'Stage({self.name!r}, timeout={self.timeout})'
+
+def _profile(context):
+    from api.lastfm.user.profile import get_user_data
+    data = get_user_data(context['username'])
+    if not data:
+        raise LookupError(f"no user data for {context['username']}")
+    return data
+
+def _artist_count(context):
+    from api.lastfm.user.library import get_artist_count
+    return {'artist_count': get_artist_count(context['username'], context['artist'])}
+
+def _track_count(context):
+    from api.lastfm.user.library import get_track_count
+    return {'track_count': get_track_count(context['username'], context['artist'], context['title'])}
+
+def _pylast_track(context):
+    import pylast
+    from api.lastfm.user.tracking import get_network
+    return pylast.Track(context['artist'], context['title'], get_network(), username=context['username'])
+
+def _loved(context):
+    return {'loved': bool(_pylast_track(context).get_userloved())}
+
+def _tags(context):
+    return {'tags': [top.item.get_name() for top in _pylast_track(context).get_top_tags(limit=5)]}
+
+def _per_track(context):
+    return (context['username'], context['track'])
+
+def _same(first, second):
+    return str(first).strip().lower() == str(second).strip().lower()
+
+# A prefetched count may or may not include the scrobble of the track that played meanwhile.
+# Counted from when that track started, it must be at least one more.
+
+def _profile_after_play(fields, played, context):
+    header_status = fields.get('header_status')
+    before = played['fields'].get('header_status')
+    if not header_status or not before:
+        return fields
+    scrobbles, artists, loved_tracks = header_status
+    scrobbles = max(scrobbles, before[0] + 1)
+    if played['fields'].get('artist_count') == 0:
+        artists = max(artists, before[1] + 1) # it was the first listen of its artist
+    return {**fields, 'header_status': [scrobbles, artists, loved_tracks]}
+
+def _artist_count_after_play(fields, played, context):
+    before = played['fields'].get('artist_count')
+    if before is None or not _same(played['artist'], context['artist']):
+        return fields
+    return {'artist_count': max(fields['artist_count'], before + 1)}
+
+def _track_count_after_play(fields, played, context):
+    before = played['fields'].get('track_count')
+    if before is None or not (_same(played['artist'], context['artist']) and _same(played['title'], context['title'])):
+        return fields
+    return {'track_count': max(fields['track_count'], before + 1)}
+
+# Counters change with every scrobble: their results only serve refreshes within one play
+PLAY_TTL = 60
+
+# Every stage that can be enabled in ENRICHMENT.STAGES, in display order
+STAGES = {
+    'profile': Stage('profile', _profile, ('display_name', 'avatar_url', 'header_status'),
+                     timeout=4.0, key=_per_track, ttl=PLAY_TTL, stale_ok=True, after_play=_profile_after_play),
+    'artist_count': Stage('artist_count', _artist_count, ('artist_count',), timeout=4.0, key=_per_track,
+                          ttl=PLAY_TTL, after_play=_artist_count_after_play),
+    'track_count': Stage('track_count', _track_count, ('track_count',), timeout=4.0, key=_per_track,
+                         ttl=PLAY_TTL, after_play=_track_count_after_play),
+    'loved': Stage('loved', _loved, ('loved',), timeout=3.0, key=_per_track, ttl=600),
+    'tags': Stage('tags', _tags, ('tags',), timeout=3.0, key=lambda context: (context['track'],), ttl=24 * 3600),
+}
+
+def stages_for(fields):
+    """Returns the names of the stages that provide any of fields, plus those listed in ENRICHMENT.STAGES."""
+    return [name for name, stage in STAGES.items() if name in ENRICHMENT_STAGES or set(stage.provides) & set(fields)]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    # Shared by every Enricher, so many accounts do not mean many threads
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(ENRICHMENT_WORKERS, thread_name_prefix='enrich')
+        return _executor
+
+class EnrichmentResult:
+    """The fields gathered for a track and the stages that did not contribute."""
+
+    def __init__(self):
+        self.fields = {}
+        self.skipped = {} # stage name -> 'timeout', 'error' or 'budget'
+        self.stale = [] # stages whose fields come from an older result
+
+    @property
+    def complete(self):
+        return not self.skipped and not self.stale
+
+    def get(self, field, default=None):
+        return self.fields.get(field, default)
+
+class Enricher:
+    """
+    Runs the enrichment stages of a track concurrently under a time budget.
+
+    Cached results are used first. The remaining stages run on a shared
+    thread pool with the caller's context (so their spans join the current
+    trace), and run() returns once they are all done or their timeouts or
+    the budget have passed, with whatever finished in time. A stage that
+    finishes late still fills the cache for the next update of the track.
+    """
+
+    def __init__(self, stages=None, budget=ENRICHMENT_BUDGET, timeouts=None):
+        """
+        Args:
+            stages (list): Stage names to run, from STAGES. Defaults to every stage.
+            budget (float): Seconds to wait for all stages of a track.
+            timeouts (dict): Per-stage timeout overrides in seconds.
+        """
+        timeouts = ENRICHMENT_TIMEOUTS if timeouts is None else timeouts
+        self.stages = []
+        for name in STAGES if stages is None else stages:
+            stage = STAGES.get(name)
+            if stage is None:
+                logger.warning(f"Unknown enrichment stage: {name}")
+                continue
+            if name in timeouts:
+                stage = Stage(stage.name, stage.func, stage.provides, float(timeouts[name]),
+                              stage.key, stage.ttl, stage.stale_ok, stage.after_play)
+            self.stages.append(stage)
+        self.budget = budget
+        self._cache = _cache # (stage, key) -> (fields, stored_at, played), shared by every Enricher
+        self._last = {} # stage -> last fields, for stale_ok stages
+        self._playing = {} # username -> the 'track', 'artist', 'title' and 'fields' of its current track
+        self._inflight = {} # (stage, key) -> Future
+        self._lock = threading.Lock()
+
+    def _lookup(self, stage, key, context=None):
+        """Returns the cached fields, corrected for the play they were prefetched during if context is given."""
+        entry = self._cache.get((stage.name, key))
+        if entry is None:
+            return None
+        fields, stored_at, played = entry
+        if stage.ttl is not None and clock.monotonic() - stored_at > stage.ttl:
+            self._cache.pop((stage.name, key))
+            return None
+        if played is not None and context is not None:
+            # The track is playing now, so the one that played during the prefetch has ended
+            if stage.after_play is not None:
+                fields = stage.after_play(fields, played, context)
+            self._cache.put((stage.name, key), (fields, stored_at, None))
+        return fields
+
+    def _store(self, stage, key, fields, played=None):
+        self._cache.put((stage.name, key), (fields, clock.monotonic(), played))
+        with self._lock:
+            if stage.stale_ok and played is None:
+                self._last[stage.name] = fields
+
+    def _run_stage(self, stage, context, key, played=None):
+        try:
+            with tracer.span(f'enrich_{stage.name}'):
+                fields = stage.func(context)
+            self._store(stage, key, fields, played)
+            return fields
+        finally:
+            with self._lock:
+                self._inflight.pop((stage.name, key), None)
+
+    def _submit(self, stage, context, key):
+        with self._lock:
+            future = self._inflight.get((stage.name, key))
+            if future is None:
+                # copy_context() carries the current trace span into the pool thread
+                future = _get_executor().submit(contextvars.copy_context().run, self._run_stage, stage, context, key)
+                self._inflight[(stage.name, key)] = future
+            return future
+
+    def _skip(self, result, stage, reason, error=None):
+        metrics.inc(SKIP_COUNTERS[reason], ('stage', stage.name))
+        if error is not None:
+            logger.warning(f"Enrichment stage {stage.name} failed: {error}")
+        else:
+            logger.warning(f"Enrichment stage {stage.name} skipped ({reason})")
+        with self._lock:
+            last = self._last.get(stage.name) if stage.stale_ok else None
+        if last is not None:
+            result.fields.update(last)
+            result.stale.append(stage.name)
+        else:
+            result.skipped[stage.name] = reason
+
+    def run(self, username, artist, title, track):
+        """
+        Gathers the fields of every stage for a track.
+
+        Returns:
+            EnrichmentResult: The fields that were available in time.
+        """
+        context = {'username': username, 'artist': artist, 'title': title, 'track': track}
+        result = EnrichmentResult()
+        # The budget bounds real waiting, like wait() below, even under a virtual clock
+        start = time.monotonic()
+        pending = {}
+        for stage in self.stages:
+            key = stage.key(context)
+            fields = self._lookup(stage, key, context)
+            if fields is not None:
+                metrics.inc('enrich_cache_hits_total', ('stage', stage.name))
+                result.fields.update(fields)
+            else:
+                pending[self._submit(stage, context, key)] = stage
+
+        while pending:
+            now = time.monotonic()
+            deadlines = {future: start + min(stage.timeout, self.budget) for future, stage in pending.items()}
+            for future in [future for future, deadline in deadlines.items() if deadline <= now and not future.done()]:
+                stage = pending.pop(future)
+                self._skip(result, stage, 'timeout' if stage.timeout <= self.budget else 'budget')
+            if not pending:
+                break
+            done, _ = wait(pending, timeout=max(0.0, min(deadlines[future] for future in pending) - now),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = pending.pop(future)
+                error = future.exception()
+                if error is not None:
+                    self._skip(result, stage, 'error', error)
+                else:
+                    result.fields.update(future.result())
+
+        skipped = sorted(result.skipped) + sorted(result.stale)
+        if skipped:
+            tracer.current().set('enrich_skipped', skipped)
+        self._remember_playing(context, result.fields)
+        return result
+
+    def _remember_playing(self, context, fields):
+        # The counts from early in the play, before it scrobbles, are what after_play adds to
+        with self._lock:
+            playing = self._playing.get(context['username'])
+            if playing is None or playing['track'] != context['track']:
+                self._playing[context['username']] = {'track': context['track'], 'artist': context['artist'],
+                                                      'title': context['title'], 'fields': dict(fields)}
+            else:
+                for field, value in fields.items():
+                    playing['fields'].setdefault(field, value)
+
+    def prefetch(self, username, artist, title, track, allow=None):
+        """
+        Fills the cache for a track that is likely to play next.
+
+        The stages whose results are not cached run one after another on
+        the calling thread, so prefetching never takes more than one
+        connection or a thread of the shared pool. A run() for the track
+        while one of them is in progress waits for it instead of repeating
+        it. Counts fetched now may miss the scrobble of the track playing
+        for username; the stages' after_play hooks add it once the
+        prefetched track plays.
+
+        Args:
+            allow (callable): Asked before each stage runs; False puts the stage off, e.g. to spare the rate limit.
+
+        Returns:
+            int: The number of stages put off.
+        """
+        context = {'username': username, 'artist': artist, 'title': title, 'track': track}
+        with self._lock:
+            playing = self._playing.get(username)
+            played = None if playing is None else {**playing, 'fields': dict(playing['fields'])}
+        deferred = 0
+        for stage in self.stages:
+            key = stage.key(context)
+            if self._lookup(stage, key) is not None:
+                continue
+            if allow is not None and not allow():
+                deferred += 1
+                continue
+            with self._lock:
+                if (stage.name, key) in self._inflight:
+                    continue
+                future = Future()
+                self._inflight[(stage.name, key)] = future
+            metrics.inc('enrich_prefetch_total', ('stage', stage.name))
+            try:
+                future.set_result(self._run_stage(stage, context, key, played))
+            except Exception as e:
+                future.set_exception(e)
+                logger.debug("Prefetching %s for %s failed: %s", stage.name, track, e)
+        return deferred
@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from utils.cache_manager import cache_manager
+from utils.clock import clock
+from constants.project import METADATA_CACHE_PATH, METADATA_TTL, METADATA_NEGATIVE_TTL
+
+logger = logging.getLogger('cache')
+
+# Entry kinds
+COVER = 'cover'         # album -> cover image URL (None when the album has no art)
+DURATION = 'duration'   # track -> duration in milliseconds (0 when unknown)
+
+# Seconds to rebuild an entry evicted from memory: a database read, or a web-service call without one
+DATABASE_COST = 0.001
+NETWORK_COST = 0.3
+
+class MetadataCache:
+    """
+    Persistent cache for album artwork and track durations.
+
+    Entries are stored in a small SQLite file and mirrored in memory, so a
+    repeat album or track is resolved without any web-service call. The
+    memory mirror is held to the cache manager's budget; an entry evicted
+    from it is read back from the database on its next lookup. Empty
+    values (albums without art, tracks without duration) are kept as negative
+    entries with a shorter TTL so they are re-checked now and then.
+    """
+
+    def __init__(self, path=METADATA_CACHE_PATH, ttl=METADATA_TTL, negative_ttl=METADATA_NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._memory = cache_manager.cache('metadata', NETWORK_COST)  # (kind, key) -> (value, expires_at)
+        self._conn = None
+        self._loaded = False
+
+    @staticmethod
+    def make_key(*parts):
+        """Builds a case-insensitive cache key from artist/album/track names."""
+        return '\x1f'.join(str(part).strip().lower() for part in parts)
+
+    def _connection(self):
+        """Opens the backing database on first use. Returns None if unavailable."""
+        if self._conn is None:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS metadata ("
+                    "kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT, "
+                    "expires_at REAL NOT NULL, PRIMARY KEY (kind, key))"
+                )
+                self._conn.commit()
+            except (sqlite3.Error, OSError) as e:
+                logger.error(f"Metadata cache unavailable, using memory only: {e}")
+                self._conn = False
+            else:
+                self._memory.cost = DATABASE_COST
+        return self._conn or None
+
+    def _expiry(self, value, now):
+        return now + (self.ttl if value else self.negative_ttl)
+
+    def load(self):
+        """Bulk loads every unexpired entry into memory and prunes expired rows."""
+        with self._lock:
+            if self._loaded:
+                return len(self._memory)
+            self._loaded = True
+            conn = self._connection()
+            if conn is None:
+                return 0
+            now = clock.time()
+            try:
+                conn.execute("DELETE FROM metadata WHERE expires_at <= ?", (now,))
+                conn.commit()
+                rows = conn.execute("SELECT kind, key, value, expires_at FROM metadata").fetchall()
+            except sqlite3.Error as e:
+                logger.error(f"Error loading metadata cache: {e}")
+                return 0
+            for kind, key, value, expires_at in rows:
+                self._memory.put((kind, key), (json.loads(value), expires_at))
+            logger.debug("Metadata cache loaded %s entries from %s", len(rows), self.path)
+            return len(rows)
+
+    def lookup(self, kind, key):
+        """
+        Looks up an entry.
+
+        Entries read back from the database count as backing hits of the memory mirror, not as misses.
+
+        Returns:
+            tuple: (hit, value). Expired entries count as a miss so they get refreshed.
+        """
+        with self._lock:
+            entry = self._memory.get((kind, key), count_miss=False)
+            if entry is None:
+                entry = self._read((kind, key))
+                if entry is not None and entry[1] <= clock.time():
+                    entry = None
+                self._memory.backing_lookup(entry is not None)
+                if entry is None:
+                    return False, None
+                self._memory.put((kind, key), entry)
+            value, expires_at = entry
+            if expires_at <= clock.time():
+                self._memory.pop((kind, key))
+                return False, None
+            return True, value
+
+    def _read(self, kind_key):
+        # Entries evicted from memory are still in the database
+        conn = self._connection() if self._loaded else None
+        if conn is None:
+            return None
+        try:
+            row = conn.execute("SELECT value, expires_at FROM metadata WHERE kind = ? AND key = ?", kind_key).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading metadata cache: {e}")
+            return None
+        return None if row is None else (json.loads(row[0]), row[1])
+
+    def store(self, kind, key, value):
+        """Stores a single entry, refreshing its TTL."""
+        self.store_many(kind, {key: value})
+
+    def store_many(self, kind, items):
+        """Stores several entries of the same kind in one transaction."""
+        now = clock.time()
+        rows = []
+        with self._lock:
+            for key, value in items.items():
+                expires_at = self._expiry(value, now)
+                self._memory.put((kind, key), (value, expires_at))
+                rows.append((kind, key, json.dumps(value), expires_at))
+            conn = self._connection()
+            if conn is None:
+                return
+            try:
+                conn.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)", rows)
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error writing metadata cache: {e}")
+
+metadata_cache = MetadataCache()
@@ -0,0 +1,229 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pylast
+from constants.project import PREFETCH_LEAD, PREFETCH_TRACKS
+from api.lastfm.enrichment import PLAY_TTL
+from api.lastfm.metadata_cache import metadata_cache, DURATION
+from api.lastfm.user.tracking import get_network
+from utils.cache_manager import cache_manager
+from utils.clock import clock
+from utils.metrics import metrics
+
+logger = logging.getLogger('prefetch')
+
+# Album tracklists as lists of (artist, title, duration in ms), one web-service call to rebuild
+_albums = cache_manager.cache('albums', cost=0.3)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    # One thread for every account: prefetching is never urgent
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(1, thread_name_prefix='prefetch')
+        return _executor
+
+def _text(node, tag):
+    elements = node.getElementsByTagName(tag)
+    if not elements or elements[0].firstChild is None:
+        return None
+    return elements[0].firstChild.data.strip()
+
+def _album_info(album):
+    """
+    Returns the album.getInfo response of a pylast Album as a DOM document, or None if pylast cannot provide it.
+
+    Album.get_tracks() parses the same response but drops the durations, and
+    pylast has no public call that returns it, so this reads it through
+    pylast's request helper, guarded against that helper changing.
+    """
+    request = getattr(album, '_request', None)
+    if request is None:
+        return None
+    try:
+        return request('album.getInfo', cacheable=True)
+    except TypeError as e: # The helper's signature changed
+        logger.debug("Could not request album.getInfo directly: %s", e)
+        return None
+
+def get_tracklist(artist, album, allow=None):
+    """
+    Returns the tracks of an album as (artist, title, duration in ms), fetching them once with album.getInfo.
+
+    The durations of every track are stored in the metadata cache on the
+    way, so the album's other tracks need no track.getInfo call.
+
+    Args:
+        allow (callable): Asked before the request; if it returns False, None is returned instead.
+    """
+    key = metadata_cache.make_key(artist, album)
+    tracks = _albums.get(key)
+    if tracks is not None:
+        return tracks
+    if allow is not None and not allow():
+        return None
+    album_object = get_network().get_album(artist, album)
+    doc = _album_info(album_object)
+    tracks = []
+    if doc is None:
+        # The public call, without durations
+        tracks = [(str(track.get_artist()) or artist, track.get_title() or '', 0) for track in album_object.get_tracks()]
+    else:
+        for node in doc.getElementsByTagName('track'):
+            artist_nodes = node.getElementsByTagName('artist')
+            seconds = _text(node, 'duration')
+            tracks.append((
+                (_text(artist_nodes[0], 'name') if artist_nodes else None) or artist,
+                _text(node, 'name') or '',
+                int(seconds) * 1000 if seconds and seconds.isdigit() else 0,
+            ))
+    metrics.inc('prefetch_requests_total', ('kind', 'tracklist'))
+    _albums.put(key, tracks)
+    durations = {metadata_cache.make_key(track_artist, title): duration
+                 for track_artist, title, duration in tracks if duration}
+    if durations:
+        metadata_cache.store_many(DURATION, durations)
+    logger.debug("Fetched %s tracks of %s - %s", len(tracks), artist, album)
+    return tracks
+
+class Prefetcher:
+    """
+    Warms the caches for the tracks that are likely to play next on an album.
+
+    The caller reports the now-playing track after every poll. Halfway
+    through a track, the album's tracklist is fetched once, which also
+    stores the duration of each of its tracks; the artwork is per album and
+    already cached for the current track. When the track is about to end,
+    the enrichment stages of the tracks that follow it run, so a sequential
+    track change finds every stage cached and publishes without waiting on
+    the network. The counters are fetched this late, rather than halfway,
+    because they are only cached for PLAY_TTL seconds; the Enricher adds
+    the current track's scrobble to them when the next track starts.
+
+    The work runs on one background thread shared by every Prefetcher,
+    one request at a time. Nothing is prefetched for tracks that are not
+    on their album's tracklist (e.g. another edition) or whose duration is
+    unknown.
+    """
+
+    def __init__(self, username, enricher, tracks=PREFETCH_TRACKS, lead=PREFETCH_LEAD, allow=None):
+        """
+        Args:
+            username (str): The Last.fm user whose stats are prefetched.
+            enricher (Enricher): The enricher whose stages and cache the presence uses.
+            tracks (int): How many of the following tracks to prefetch.
+            lead (float): Seconds before the end of a track that the stats of the next ones are fetched.
+            allow (callable): Asked before each request; False puts it off until the next poll, e.g. to spare the rate limit.
+        """
+        self.username = username
+        self.enricher = enricher
+        self.tracks = tracks
+        # Stats fetched earlier would expire before the next track starts
+        self.lead = min(lead, PLAY_TTL / 2)
+        self.allow = allow
+        self._lock = threading.Lock()
+        self._track = None # "Artist - Title" of the current track, lowercased
+        self._current = None # (title, artist, album)
+        self._started = 0.0
+        self._duration = 0 # ms
+        self._upcoming = None # [(artist, title)] once the tracklist is known
+        self._predicted = set() # lowercased keys of the prefetched tracks
+        self._done = set() # phases finished for the current track
+        self._queued = set() # phases waiting for or running on the prefetch thread
+
+    def observe(self, title, artist, album, duration):
+        """
+        Follows the now-playing track. Never blocks; requests are queued for the prefetch thread.
+
+        Args:
+            album (str): The album title, or None.
+            duration (int): The track duration in milliseconds, 0 if unknown.
+        """
+        track = f'{artist} - {title}'.lower()
+        now = clock.monotonic()
+        with self._lock:
+            if track != self._track:
+                if self._predicted:
+                    metrics.inc('prefetch_predictions_total', ('result', 'hit' if track in self._predicted else 'miss'))
+                self._track = track
+                self._current = (title, artist, album)
+                self._started = now
+                self._duration = duration
+                self._upcoming = None
+                self._predicted = set()
+                self._done = set()
+            if not album:
+                return
+            elapsed = now - self._started
+            if 'tracklist' not in self._done:
+                # Without a duration, the tracklist may provide one
+                if elapsed >= self._duration / 2000:
+                    self._queue('tracklist')
+            elif 'stats' not in self._done and self._upcoming and self._duration:
+                if self._duration / 1000 - elapsed <= self.lead:
+                    self._queue('stats')
+
+    def _queue(self, phase):
+        if phase in self._queued:
+            return
+        self._queued.add(phase)
+        _get_executor().submit(self._run, phase, self._track)
+
+    def _run(self, phase, track):
+        with self._lock:
+            current = self._current if self._track == track else None
+        done = False
+        try:
+            if current is not None and phase == 'tracklist':
+                done = self._fetch_tracklist(track, *current)
+            elif current is not None:
+                done = self._fetch_stats(track)
+        except (pylast.WSError, pylast.NetworkError, pylast.MalformedResponseError) as e:
+            logger.debug("Prefetching %s failed: %s", phase, e)
+            done = True # Not retried for this track
+        except Exception as e:
+            logger.warning(f"Prefetching {phase} failed: {e}")
+            done = True
+        finally:
+            with self._lock:
+                self._queued.discard(phase)
+                if done and self._track == track:
+                    self._done.add(phase)
+
+    def _fetch_tracklist(self, track, title, artist, album):
+        tracks = get_tracklist(str(artist), str(album), self.allow)
+        if tracks is None:
+            return False
+        titles = [track_title.lower() for _, track_title, _ in tracks]
+        position = titles.index(str(title).lower()) if str(title).lower() in titles else None
+        with self._lock:
+            if self._track != track:
+                return False
+            if position is None:
+                logger.debug("%s is not on the tracklist of %s; nothing to prefetch", title, album)
+                self._upcoming = []
+                return True
+            self._upcoming = [(track_artist, track_title) for track_artist, track_title, _ in
+                              tracks[position + 1:position + 1 + self.tracks]]
+            self._predicted = {f'{track_artist} - {track_title}'.lower() for track_artist, track_title in self._upcoming}
+            if not self._duration:
+                self._duration = tracks[position][2]
+        return True
+
+    def _fetch_stats(self, track):
+        with self._lock:
+            upcoming = list(self._upcoming or ())
+        deferred = 0
+        for artist, title in upcoming:
+            with self._lock:
+                if self._track != track:
+                    return False
+            key = f'{artist} - {title}'
+            deferred += self.enricher.prefetch(self.username, artist, title, key, allow=self.allow)
+        if upcoming:
+            logger.debug("Prefetched the stats of %s", ', '.join(f'{artist} - {title}' for artist, title in upcoming))
+        return not deferred
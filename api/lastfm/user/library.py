@@ -1,29 +1,42 @@
-from utils.request_utils import get_response, get_dom
+from utils.parsing import html_document, parsing_pool
+from utils.request_utils import get_response
 from utils.string_utils import get_removal
 from utils.url_utils import url_encoder
-from constants.project import LASTFM_LIBRARY_URL
+from utils.tracing import tracer
+from constants.project import LASTFM_LIBRARY_URL, STAGE_FETCH_TRIES, STAGE_FETCH_TIMEOUT
 
-def get_library_data(username, artist_name, track_name) -> dict:
+def parse_count(dom):
+    data = dom.find_all("p", {"class":"metadata-display"})
+    if data:
+        # if there is no artist info, return 0
+        data = data[0].text if len(data) != 0 else '0' 
+        data = get_removal(data,',', int)
+    else:
+        data = 0
 
+    return data
+
+def extract_count(content):
+    # Module-level so the parsing pool can run it in a worker process
+    return parse_count(html_document(content))
+
+def _library_url(username, artist_name, track_name=None):
     USER_LIBRARY_URL = LASTFM_LIBRARY_URL.format(username=username)
     # + ?date_preset=ALL (login req)
-    USER_LIBRARY_ARTIST_URL = "/".join([USER_LIBRARY_URL, "music", "+noredirect", url_encoder(artist_name)])
-    USER_LIBRARY_TRACK_URL = "/".join([USER_LIBRARY_URL, "music", "+noredirect", url_encoder(artist_name), "_", url_encoder(track_name)])
-
-    def parse_count(dom):
-        data = dom.find_all("p", {"class":"metadata-display"})
-        if data:
-            # if there is no artist info, return 0
-            data = data[0].text if len(data) != 0 else '0' 
-            data = get_removal(data,',', int)
-        else:
-            data = 0
+    parts = [USER_LIBRARY_URL, "music", "+noredirect", url_encoder(artist_name)]
+    if track_name is not None:
+        parts += ["_", url_encoder(track_name)]
+    return "/".join(parts)
 
-        return data
+def fetch_count(url):
+    with tracer.span('fetch_library'):
+        response = get_response(url, max_retries=STAGE_FETCH_TRIES, timeout=STAGE_FETCH_TIMEOUT)
+    return parsing_pool.parse(extract_count, response.content)
 
-    data = {
-         'artist_count': parse_count(get_dom(get_response(USER_LIBRARY_ARTIST_URL))),
-         'track_count': parse_count(get_dom(get_response(USER_LIBRARY_TRACK_URL)))
-         }
+def get_artist_count(username, artist_name) -> int:
+    """Returns how many times the user scrobbled the artist."""
+    return fetch_count(_library_url(username, artist_name))
 
-    return data
\ No newline at end of file
+def get_track_count(username, artist_name, track_name) -> int:
+    """Returns how many times the user scrobbled the track."""
+    return fetch_count(_library_url(username, artist_name, track_name))
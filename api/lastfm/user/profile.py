@@ -1,9 +1,11 @@
 import logging
 import os
 
-from constants.project import DEFAULT_AVATAR_ID, LASTFM_USER_URL
-from utils.request_utils import get_response, get_dom
+from constants.project import DEFAULT_AVATAR_ID, LASTFM_USER_URL, STAGE_FETCH_TRIES, STAGE_FETCH_TIMEOUT
+from utils.parsing import html_document, parsing_pool
+from utils.request_utils import get_response
 from utils.string_utils import get_removal
+from utils.tracing import tracer
 
 logger = logging.getLogger('profile')
 
@@ -68,6 +70,26 @@ def parse_user_header_status(page_content):
         logger.error(f"Error parsing user header status: {e}")
     return header_status
 
+def extract_user_data(content):
+    """
+    Parses a profile page into the user data returned by get_user_data.
+
+    Runs in a parsing worker process when the pool is enabled, so it only
+    takes the page bytes and returns plain values.
+
+    Args:
+        content (bytes): The raw profile page.
+
+    Returns:
+        dict: The user's display name, avatar URL and header status.
+    """
+    dom = html_document(content)
+    return {
+        "display_name": parse_user_display_name(dom),
+        "avatar_url": parse_user_avatar_url(dom),
+        "header_status": parse_user_header_status(dom)
+    }
+
 def get_user_data(username) -> dict:
     """
     Retrieves the user data from their Last.fm profile page.
@@ -80,15 +102,11 @@ def get_user_data(username) -> dict:
     """
     USER_PROFILE_URL = LASTFM_USER_URL.format(username=username)
 
-    response = get_response(USER_PROFILE_URL)
+    with tracer.span('fetch_profile'):
+        response = get_response(USER_PROFILE_URL, max_retries=STAGE_FETCH_TRIES, timeout=STAGE_FETCH_TIMEOUT)
     if response.status_code in range(200, 299):
-        dom = get_dom(response)
-        data = {
-            "display_name": parse_user_display_name(dom),
-            "avatar_url": parse_user_avatar_url(dom),
-            "header_status": parse_user_header_status(dom)
-        }
-        logger.debug(f"User data retrieved successfully for {username}")
+        data = parsing_pool.parse(extract_user_data, response.content)
+        logger.debug("User data retrieved successfully for %s", username)
         return data
     else:
         logger.error(f"Failed to retrieve user data for {username}, status code: {response.status_code}")
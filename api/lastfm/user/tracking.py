@@ -1,19 +1,36 @@
 import logging
+import threading
 
 import pylast
 from constants.project import API_KEY, API_SECRET, TRANSLATIONS, DEFAULT_COOLDOWN
+from api.lastfm.metadata_cache import metadata_cache, COVER, DURATION
+from utils.cache_manager import cache_manager
+from utils.metrics import metrics
+from utils.tracing import tracer
+from utils.recording import recorder
 
 logger = logging.getLogger('lastfm')
 
-network = pylast.LastFMNetwork(API_KEY, API_SECRET)
+_network = None
+_network_lock = threading.Lock()
+
+def get_network():
+    """Returns the shared pylast network, building it on first use."""
+    global _network
+    with _network_lock:
+        if _network is None:
+            _network = pylast.LastFMNetwork(API_KEY, API_SECRET)
+        return _network
 
 class User:
     def __init__(self, username, cooldown=DEFAULT_COOLDOWN):
         self.username = username
-        self.lastfm_user = network.get_user(username)
+        self.lastfm_user = get_network().get_user(username)
         self.cooldown = cooldown
         self.last_track = None
         self.last_track_info = None
+        cache_manager.register_slots('track_info', self, ('last_track_info',))
+        metadata_cache.load()
 
     def _get_current_track(self):
         try:
@@ -22,6 +39,8 @@ class User:
             if "Invalid API key" in str(e):
                 logger.critical("CRITICAL: Invalid API Key. Please update config.yaml with a valid key from Last.fm.")
                 import os
+                from utils.logging_config import shutdown_logging
+                shutdown_logging() # os._exit skips atexit, so write out the queued records first
                 os._exit(1)
             logger.error(f"{TRANSLATIONS['pylast_ws_error'].format(self.cooldown)} | Details: {e}")
         except pylast.NetworkError:
@@ -30,6 +49,33 @@ class User:
             logger.error(TRANSLATIONS['pylast_malformed_response_error'])
         return None
 
+    def _get_cover_image(self, artist, album):
+        """Returns the album cover URL, resolving it through the metadata cache."""
+        key = metadata_cache.make_key(artist, album.get_title())
+        hit, artwork = metadata_cache.lookup(COVER, key)
+        if hit:
+            metrics.inc('cache_hits_total', ('cache', 'artwork'))
+            tracer.current().set('artwork_cache_hit', True)
+            logger.debug("Artwork cache hit for %s", album)
+            return artwork
+        metrics.inc('cache_misses_total', ('cache', 'artwork'))
+        artwork = album.get_cover_image() or None
+        metadata_cache.store(COVER, key, artwork)
+        return artwork
+
+    def _get_duration(self, artist, title, current_track):
+        """Returns the track duration, resolving it through the metadata cache."""
+        key = metadata_cache.make_key(artist, title)
+        hit, duration = metadata_cache.lookup(DURATION, key)
+        if hit:
+            metrics.inc('cache_hits_total', ('cache', 'duration'))
+            tracer.current().set('duration_cache_hit', True)
+            return duration
+        metrics.inc('cache_misses_total', ('cache', 'duration'))
+        duration = current_track.get_duration() or 0
+        metadata_cache.store(DURATION, key, duration)
+        return duration
+
     def _get_track_info(self, current_track):
         title, artist, album, artwork, time_remaining = None, None, None, None, 0
         try:
@@ -37,28 +83,72 @@ class User:
             artist = current_track.get_artist()
             album = current_track.get_album()
             if album:
-                artwork = album.get_cover_image()
-            time_remaining = current_track.get_duration()
+                artwork = self._get_cover_image(artist, album)
+            time_remaining = self._get_duration(artist, title, current_track)
         except pylast.WSError as e:
             logger.error(f'pylast.WSError: {e}')
         except pylast.NetworkError:
             logger.error(TRANSLATIONS['pylast_network_error'])
         if artwork:
-            logger.debug(f"Fetched artwork URL: {artwork}")
+            logger.debug("Fetched artwork URL: %s", artwork)
         else:
             logger.debug("No artwork found for track.")
         return title, artist, album, artwork, time_remaining
 
+    def remote_track(self):
+        """Last.fm's now-playing track, without fetching its info."""
+        return self._get_current_track()
+
+    def now_playing_local(self, local):
+        """
+        Returns track info for a track reported by a local player.
+
+        Title, artist and duration come from the player. Only the artwork is
+        resolved through Last.fm, and only once per album thanks to the
+        metadata cache.
+        """
+        key = local.key
+        if self.last_track and str(self.last_track) == key:
+            metrics.inc('cache_hits_total', ('cache', 'track_info'))
+            return key, self.last_track_info
+
+        album, artwork, duration = None, None, local.length_ms
+        with tracer.span('track_info', track=key, source='mpris'):
+            try:
+                if local.album:
+                    album = get_network().get_album(local.artist, local.album)
+                    artwork = self._get_cover_image(local.artist, album)
+                if not duration:
+                    duration = self._get_duration(local.artist, local.title, get_network().get_track(local.artist, local.title))
+            except pylast.WSError as e:
+                logger.error(f'pylast.WSError: {e}')
+            except pylast.NetworkError:
+                logger.error(TRANSLATIONS['pylast_network_error'])
+        info = (local.title, local.artist, album, artwork, duration)
+        if recorder.active:
+            recorder.record('track_info', track=key, info=[local.title, local.artist, local.album, artwork, duration])
+        self.last_track = key
+        self.last_track_info = info
+        return key, info
+
     def now_playing(self):
         current_track = self._get_current_track()
+        if recorder.active:
+            recorder.record('poll', track=str(current_track) if current_track else None)
         
         if current_track:
             # If track is same as last time, return cached info
             if self.last_track and str(current_track) == str(self.last_track):
+                metrics.inc('cache_hits_total', ('cache', 'track_info'))
                 return current_track, self.last_track_info
                 
             # New track, fetch info
-            info = self._get_track_info(current_track)
+            with tracer.span('track_info', track=str(current_track)):
+                info = self._get_track_info(current_track)
+            if recorder.active:
+                title, artist, album, artwork, time_remaining = info
+                recorder.record('track_info', track=str(current_track),
+                                info=[title, str(artist) if artist else None, album.get_title() if album else None, artwork, time_remaining])
             self.last_track = current_track
             self.last_track_info = info
             return current_track, info
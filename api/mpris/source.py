@@ -0,0 +1,235 @@
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+
+from utils.metrics import metrics
+
+logger = logging.getLogger('mpris')
+
+MPRIS_PREFIX = 'org.mpris.MediaPlayer2.'
+MPRIS_PATH = '/org/mpris/MediaPlayer2'
+PLAYER_INTERFACE = 'org.mpris.MediaPlayer2.Player'
+PROPERTIES_INTERFACE = 'org.freedesktop.DBus.Properties'
+
+# How long the listener blocks before checking whether it should stop
+RECEIVE_TIMEOUT = 1.0
+
+def mpris_available():
+    """Whether local players can be followed: Linux, jeepney installed and a session bus to talk to."""
+    if not sys.platform.startswith('linux') or not os.environ.get('DBUS_SESSION_BUS_ADDRESS'):
+        return False
+    try:
+        import jeepney # noqa: F401 (optional dependency)
+    except ImportError:
+        return False
+    return True
+
+class LocalTrack:
+    """A track reported by a local MPRIS player."""
+
+    def __init__(self, title, artist, album=None, length_ms=0, art_url=None, player=None):
+        self.title = title
+        self.artist = artist
+        self.album = album
+        self.length_ms = length_ms
+        self.art_url = art_url
+        self.player = player
+
+    @property
+    def key(self):
+        """The track as "Artist - Title", the same form str() gives for a pylast Track."""
+        return f'{self.artist} - {self.title}'
+
+    def __repr__(self):
+        return f'LocalTrack({self.key!r}, album={self.album!r}, player={self.player!r})'
+
+def _unwrap(value):
+    # jeepney hands variants over as (signature, value)
+    return value[1] if isinstance(value, tuple) and len(value) == 2 and isinstance(value[0], str) else value
+
+def parse_metadata(metadata, player=None):
+    """
+    Builds a LocalTrack from an MPRIS Metadata dict.
+
+    Returns:
+        LocalTrack: The track, or None if the title or the artist is missing.
+    """
+    fields = {key: _unwrap(value) for key, value in (metadata or {}).items()}
+    title = fields.get('xesam:title')
+    artists = fields.get('xesam:artist') or fields.get('xesam:albumArtist') or []
+    if isinstance(artists, str):
+        artists = [artists]
+    if not title or not artists:
+        return None
+    length = fields.get('mpris:length') or 0 # microseconds
+    return LocalTrack(
+        title=str(title),
+        artist=', '.join(str(artist) for artist in artists),
+        album=fields.get('xesam:album') or None,
+        length_ms=int(length) // 1000,
+        art_url=fields.get('mpris:artUrl') or None,
+        player=player
+    )
+
+class MprisSource:
+    """
+    Follows local media players over the D-Bus session bus.
+
+    A listener thread subscribes to the PropertiesChanged signals of every
+    org.mpris.MediaPlayer2.* player and to NameOwnerChanged, so players
+    that start or quit later are picked up too. Whenever the track of the
+    preferred playing player changes, on_change is called, typically to
+    wake the RPC worker. Needs the optional jeepney package.
+    """
+
+    def __init__(self, on_change=None, players=None):
+        """
+        Args:
+            on_change (callable): Called from the listener thread after the current track changes.
+            players (list): Optional player name fragments (e.g. ['spotify']) to follow; all players if empty.
+        """
+        self.on_change = on_change
+        self.players = [name.lower() for name in players or []]
+        self._lock = threading.Lock()
+        self._states = {} # unique bus name -> {'name', 'status', 'track'}
+        self._current = None
+        self._changed = False
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._connection = None
+
+    def start(self):
+        """Connects to the session bus and starts listening. Returns False if that is not possible."""
+        try:
+            from jeepney.io.blocking import open_dbus_connection
+            self._connection = open_dbus_connection(bus='SESSION')
+        except Exception as e:
+            logger.warning(f"MPRIS unavailable, using Last.fm polling only: {e}")
+            return False
+        self._thread = threading.Thread(target=self._run, name='mpris', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(RECEIVE_TIMEOUT * 2)
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+    def current(self):
+        """The track of the preferred playing player, or None if no local player is playing."""
+        with self._lock:
+            return self._current
+
+    def consume_change(self):
+        """Returns whether the current track changed since the last call, and resets the flag."""
+        with self._lock:
+            changed, self._changed = self._changed, False
+            return changed
+
+    def _wanted(self, name):
+        return not self.players or any(fragment in name.lower() for fragment in self.players)
+
+    def _call(self, destination, path, interface, method, signature=None, body=()):
+        from jeepney import DBusAddress, new_method_call
+        address = DBusAddress(path, bus_name=destination, interface=interface)
+        return self._connection.send_and_get_reply(new_method_call(address, method, signature, body), timeout=2).body
+
+    def _add_player(self, name, owner=None):
+        """Reads the current state of a player that is already running."""
+        try:
+            if owner is None:
+                owner = self._call('org.freedesktop.DBus', '/org/freedesktop/DBus', 'org.freedesktop.DBus',
+                                   'GetNameOwner', 's', (name,))[0]
+            properties = self._call(name, MPRIS_PATH, PROPERTIES_INTERFACE, 'GetAll', 's', (PLAYER_INTERFACE,))[0]
+        except Exception as e:
+            logger.debug("Could not read MPRIS player %s: %s", name, e)
+            return
+        with self._lock:
+            self._states[owner] = {
+                'name': name,
+                'status': _unwrap(properties.get('PlaybackStatus')),
+                'track': parse_metadata(_unwrap(properties.get('Metadata')), name),
+            }
+        logger.info(f"Following MPRIS player {name}")
+
+    def _update(self, owner, changed):
+        with self._lock:
+            state = self._states.get(owner)
+            if state is None:
+                return
+            if 'PlaybackStatus' in changed:
+                state['status'] = _unwrap(changed['PlaybackStatus'])
+            if 'Metadata' in changed:
+                state['track'] = parse_metadata(_unwrap(changed['Metadata']), state['name'])
+
+    def _refresh_current(self):
+        """Recomputes the current track and notifies on_change if it is different."""
+        with self._lock:
+            playing = [state['track'] for state in self._states.values()
+                       if state['status'] == 'Playing' and state['track'] is not None]
+            current = playing[0] if playing else None
+            previous_key = self._current.key if self._current else None
+            self._current = current
+            changed = (current.key if current else None) != previous_key
+            if changed:
+                self._changed = True
+        if changed:
+            metrics.inc('mpris_events_total')
+            logger.debug("MPRIS current track: %s", current)
+            if self.on_change:
+                self.on_change()
+
+    def _run(self):
+        from jeepney import MatchRule, MessageType, message_bus, HeaderFields
+
+        properties_rule = MatchRule(type='signal', interface=PROPERTIES_INTERFACE,
+                                    member='PropertiesChanged', path=MPRIS_PATH)
+        properties_rule.add_arg_condition(0, PLAYER_INTERFACE)
+        owner_rule = MatchRule(type='signal', sender='org.freedesktop.DBus', interface='org.freedesktop.DBus',
+                               member='NameOwnerChanged')
+        owner_rule.add_arg_condition(0, MPRIS_PREFIX.rstrip('.'), kind='namespace')
+        queue = collections.deque(maxlen=256)
+        connection = self._connection
+        try:
+            for rule in (properties_rule, owner_rule):
+                reply = connection.send_and_get_reply(message_bus.AddMatch(rule), timeout=2)
+                if reply.header.message_type == MessageType.error:
+                    raise RuntimeError(f"AddMatch failed: {reply.body}")
+            with connection.filter(properties_rule, queue=queue), connection.filter(owner_rule, queue=queue):
+                names = connection.send_and_get_reply(message_bus.ListNames(), timeout=2).body[0]
+                for name in names:
+                    if name.startswith(MPRIS_PREFIX) and self._wanted(name):
+                        self._add_player(name)
+                self._refresh_current()
+
+                while not self._stop_event.is_set():
+                    try:
+                        message = connection.recv_until_filtered(queue, timeout=RECEIVE_TIMEOUT)
+                    except TimeoutError:
+                        continue
+                    received = time.perf_counter()
+                    if message.header.fields.get(HeaderFields.member) == 'NameOwnerChanged':
+                        name, old_owner, new_owner = message.body
+                        if old_owner:
+                            with self._lock:
+                                self._states.pop(old_owner, None)
+                        if new_owner and name.startswith(MPRIS_PREFIX) and self._wanted(name):
+                            self._add_player(name, new_owner)
+                    else:
+                        self._update(message.header.fields.get(HeaderFields.sender), message.body[1])
+                    self._refresh_current()
+                    metrics.observe_stage('mpris_dispatch', time.perf_counter() - received)
+        except Exception as e:
+            if not self._stop_event.is_set():
+                logger.error(f"MPRIS listener stopped: {e}")
+        finally:
+            # Without the listener the states go stale: forget them so Last.fm polling takes over
+            with self._lock:
+                self._states.clear()
+            self._refresh_current()
@@ -0,0 +1,279 @@
+"""
+Compares the HTTP client backends on the requests of track changes.
+
+Serves the stand-in pages and web-service responses over TLS, speaking
+HTTP/2 or HTTP/1.1 as the client negotiates. Every response is delayed by
+one round trip, and the first request on a new connection by two more for
+the TCP and TLS handshakes, as on a real network. Like real servers, it
+closes connections that stay idle for a few seconds. Each track change
+makes the requests of the enrichment stages and a now-playing poll
+concurrently, then the client idles until the next one.
+
+    python -m benchmarks.http_client --rtt 50 --changes 10 --idle 8 --server-idle 5
+
+Backends:
+- requests: requests.get and pylast as shipped, a new connection per request (tray default)
+- session: a pooled requests Session and pooled pylast transports (service mode)
+- http2: the AsyncHTTPClient, one multiplexed connection per host
+
+Needs the openssl command line tool for a throwaway certificate, and the
+h2 package for the server (and for the client to use HTTP/2).
+"""
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote
+
+from benchmarks.standin import StandInServer
+
+PAGES = (
+    '/user/benchuser',
+    '/user/benchuser/library/music/+noredirect/Radiohead',
+    '/user/benchuser/library/music/+noredirect/Radiohead/_/Reckoner',
+)
+
+def make_certificate(directory):
+    """Creates a self-signed certificate for 127.0.0.1. Returns (cert path, key path)."""
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', key, '-out', cert,
+                    '-days', '1', '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1'],
+                   check=True, capture_output=True)
+    return cert, key
+
+class TLSStandIn:
+    """The stand-in server's responses over TLS, with HTTP/2 and HTTP/1.1, and simulated round trips."""
+
+    def __init__(self, standin, cert, key, rtt, idle_timeout):
+        self.standin = standin
+        self.rtt = rtt
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self.heads = 0 # keep-warm requests
+        self.versions = {}
+        self._context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self._context.load_cert_chain(cert, key)
+        self._context.set_alpn_protocols(['h2', 'http/1.1'])
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._serve, '127.0.0.1', 0, ssl=self._context))
+        self.port = self._server.sockets[0].getsockname()[1]
+        threading.Thread(target=self._loop.run_forever, name='tls-standin', daemon=True).start()
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._server.close)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _respond(self, method, path, form, first):
+        # One round trip per request, two more for the handshakes of a new connection
+        await asyncio.sleep(self.rtt * (3 if first else 1))
+        if method == 'HEAD':
+            self.heads += 1
+            return 200, b'', 'text/html'
+        return self.standin.respond(path, form)
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        protocol = writer.get_extra_info('ssl_object').selected_alpn_protocol() or 'http/1.1'
+        self.versions[protocol] = self.versions.get(protocol, 0) + 1
+        try:
+            if protocol == 'h2':
+                await self._serve_h2(reader, writer)
+            else:
+                await self._serve_http11(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ssl.SSLError):
+            pass # including connections closed for being idle
+        finally:
+            writer.close()
+
+    async def _serve_http11(self, reader, writer):
+        first = True
+        while True:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.idle_timeout)
+            request_line, *header_lines = head.decode('latin-1').split('\r\n')
+            method, target, _ = request_line.split(' ', 2)
+            headers = {name.strip().lower(): value.strip() for name, _, value in
+                       (line.partition(':') for line in header_lines if line)}
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            form = {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()} if method == 'POST' else None
+            status, content, content_type = await self._respond(method, unquote(target.split('?')[0]), form, first)
+            first = False
+            writer.write(f'HTTP/1.1 {status} OK\r\nContent-Type: {content_type}\r\n'
+                         f'Content-Length: {len(content)}\r\n\r\n'.encode('latin-1') + content)
+            await writer.drain()
+
+    async def _serve_h2(self, reader, writer):
+        import h2.config
+        import h2.connection
+        import h2.events
+
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        requests = {} # stream id -> [headers, body]
+        pending = {} # stream id -> bytes left to send
+        window = asyncio.Event()
+        first = [True]
+
+        async def answer(stream_id, headers, body):
+            method = headers.get(':method')
+            form = {k: v[0] for k, v in parse_qs(body.decode('utf-8')).items()} if method == 'POST' else None
+            is_first, first[0] = first[0], False
+            status, content, content_type = await self._respond(
+                method, unquote(headers[':path'].split('?')[0]), form, is_first)
+            conn.send_headers(stream_id, [(':status', str(status)), ('content-type', content_type),
+                                          ('content-length', str(len(content)))], end_stream=not content)
+            if content:
+                pending[stream_id] = content
+            window.set()
+
+        async def sender():
+            while True:
+                await window.wait()
+                window.clear()
+                for stream_id, data in list(pending.items()):
+                    size = min(len(data), conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size)
+                    while size > 0:
+                        conn.send_data(stream_id, data[:size])
+                        data = data[size:]
+                        size = min(len(data), conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size)
+                    if data:
+                        pending[stream_id] = data
+                    else:
+                        conn.end_stream(stream_id)
+                        del pending[stream_id]
+                writer.write(conn.data_to_send())
+                await writer.drain()
+
+        sending = asyncio.ensure_future(sender())
+        tasks = set()
+        try:
+            while True:
+                # Streams in progress keep the connection busy; only an idle one times out
+                timeout = None if requests or pending or tasks else self.idle_timeout
+                data = await asyncio.wait_for(reader.read(65536), timeout)
+                if not data:
+                    return
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        requests[event.stream_id] = [dict(event.headers), b'']
+                    elif isinstance(event, h2.events.DataReceived):
+                        requests[event.stream_id][1] += event.data
+                        conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        headers, body = requests.pop(event.stream_id)
+                        task = asyncio.ensure_future(answer(event.stream_id, headers, body))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    elif isinstance(event, h2.events.WindowUpdated):
+                        window.set()
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        return
+                window.set()
+        finally:
+            sending.cancel()
+            for task in tasks:
+                task.cancel()
+
+def install_backend(name, network, workers, keepalive, keep_warm=True):
+    """Routes page fetches and pylast calls through a backend. Returns a cleanup function."""
+    import requests
+    from utils.http_pool import create_session, pool_network
+
+    if name == 'requests':
+        network.proxy = None
+        return lambda url, timeout=None: requests.get(url, timeout=timeout), lambda: None
+    if name == 'session':
+        session = create_session(workers)
+        network.proxy = None
+        pool_network(network, workers)
+        return lambda url, timeout=None: session.get(url, timeout=timeout), session.close
+    from utils.async_http import AsyncHTTPClient
+    client = AsyncHTTPClient(workers, keepalive=keepalive, keep_warm=keep_warm)
+    client.mount(network)
+    return client.get, client.close
+
+def measure(name, args, standin, server, base_url):
+    import pylast
+
+    network = pylast.LastFMNetwork('benchkey', 'benchsecret')
+    network.ws_server = (base_url.split('://', 1)[1], '/2.0/')
+    get, close = install_backend(name, network, args.workers, args.keepalive, args.keep_warm)
+    track = pylast.Track('Radiohead', 'Reckoner', network)
+    user = network.get_user('benchuser')
+    calls = [lambda path=path: get(base_url + path).content for path in PAGES]
+    calls += [track.get_duration, user.get_now_playing]
+
+    connections_before, heads_before = server.connections, server.heads
+    times = []
+    with ThreadPoolExecutor(len(calls)) as executor:
+        for change in range(args.changes + 1):
+            start = time.perf_counter()
+            list(executor.map(lambda call: call(), calls))
+            if change:
+                times.append(time.perf_counter() - start) # the first change only opens the connections
+            time.sleep(args.idle)
+    close()
+    times.sort()
+    return {
+        'backend': name,
+        'median_ms': round(statistics.median(times) * 1000, 1),
+        'p95_ms': round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 1),
+        'connections': server.connections - connections_before,
+        'requests': (args.changes + 1) * len(calls),
+        'keepalive_requests': server.heads - heads_before,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the HTTP client backends.')
+    parser.add_argument('--backends', nargs='+', default=['requests', 'session', 'http2'])
+    parser.add_argument('--rtt', type=float, default=50, help='Simulated round trip in milliseconds')
+    parser.add_argument('--changes', type=int, default=10, help='Track changes per backend')
+    parser.add_argument('--idle', type=float, default=8, help='Seconds between track changes')
+    parser.add_argument('--server-idle', type=float, default=5, help='Seconds before the server closes an idle connection')
+    parser.add_argument('--keepalive', type=float, default=6, help='KEEPALIVE of the http2 backend')
+    parser.add_argument('--keep-warm', action=argparse.BooleanOptionalAction, default=True,
+                        help='KEEP_WARM of the http2 backend')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--report', help='Write the results as JSON')
+    args = parser.parse_args(argv)
+
+    import pylast
+
+    directory = tempfile.mkdtemp()
+    cert, key = make_certificate(directory)
+    os.environ['REQUESTS_CA_BUNDLE'] = cert
+    pylast.SSL_CONTEXT.load_verify_locations(cert)
+
+    standin = StandInServer()
+    standin.now_playing = {'artist': 'Radiohead', 'title': 'Reckoner', 'album': 'In Rainbows'}
+    server = TLSStandIn(standin, cert, key, args.rtt / 1000, args.server_idle)
+    base_url = f'https://127.0.0.1:{server.port}'
+
+    results = []
+    print(f"{'backend':>9} {'median ms':>10} {'p95 ms':>8} {'connections':>12} {'requests':>9} {'keep-warm':>10}")
+    try:
+        for name in args.backends:
+            result = measure(name, args, standin, server, base_url)
+            results.append(result)
+            print(f"{name:>9} {result['median_ms']:10.1f} {result['p95_ms']:8.1f} "
+                  f"{result['connections']:12d} {result['requests']:9d} {result['keepalive_requests']:10d}")
+    finally:
+        server.stop()
+    print(f"Negotiated: {server.versions}")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
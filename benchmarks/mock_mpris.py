@@ -0,0 +1,170 @@
+"""
+A mock MPRIS player on the D-Bus session bus.
+
+MockPlayer owns org.mpris.MediaPlayer2.<name>, answers Properties.Get and
+GetAll for the Player interface and emits PropertiesChanged when its track
+or playback status changes, like a real player does. It needs jeepney and
+a session bus; dbus-run-session provides a private one:
+
+    dbus-run-session -- python -m benchmarks.mock_mpris --measure --changes 50
+
+--measure runs api.mpris.source.MprisSource in-process and reports how long
+a track change takes to reach on_change. Without it the player cycles
+through tracks every --interval seconds, for trying the app against it.
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+
+from api.mpris.source import MPRIS_PATH, MPRIS_PREFIX, PLAYER_INTERFACE, PROPERTIES_INTERFACE, MprisSource
+
+class MockPlayer:
+    """Serves MPRIS Player properties for a scripted track."""
+
+    def __init__(self, name='mock'):
+        self.bus_name = MPRIS_PREFIX + name
+        self.status = 'Stopped'
+        self.metadata = {}
+        self.last_emit = None
+        self._connection = None
+        self._send_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        from jeepney.bus_messages import message_bus
+        from jeepney.io.blocking import open_dbus_connection
+
+        self._connection = open_dbus_connection(bus='SESSION')
+        reply = self._connection.send_and_get_reply(message_bus.RequestName(self.bus_name), timeout=2)
+        if reply.body[0] != 1: # DBUS_REQUEST_NAME_REPLY_PRIMARY_OWNER
+            raise RuntimeError(f"Could not own {self.bus_name}")
+        self._thread = threading.Thread(target=self._serve, name='mock-mpris', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(2)
+        if self._connection:
+            self._connection.close()
+
+    def play(self, title, artist, album=None, length_ms=0, art_url=None):
+        """Switches to a new track, playing, and announces it."""
+        self.metadata = {
+            'mpris:trackid': ('o', f'/org/mpris/MediaPlayer2/track/{abs(hash((artist, title)))}'),
+            'xesam:title': ('s', title),
+            'xesam:artist': ('as', [artist]),
+            'mpris:length': ('x', length_ms * 1000),
+        }
+        if album:
+            self.metadata['xesam:album'] = ('s', album)
+        if art_url:
+            self.metadata['mpris:artUrl'] = ('s', art_url)
+        self.status = 'Playing'
+        self._emit({'Metadata': ('a{sv}', self.metadata), 'PlaybackStatus': ('s', self.status)})
+
+    def set_status(self, status):
+        """Sets 'Playing', 'Paused' or 'Stopped' and announces it."""
+        self.status = status
+        self._emit({'PlaybackStatus': ('s', status)})
+
+    def _properties(self):
+        return {
+            'PlaybackStatus': ('s', self.status),
+            'Metadata': ('a{sv}', self.metadata),
+            'CanControl': ('b', False),
+        }
+
+    def _emit(self, changed):
+        from jeepney import DBusAddress, new_signal
+
+        address = DBusAddress(MPRIS_PATH, interface=PROPERTIES_INTERFACE)
+        message = new_signal(address, 'PropertiesChanged', 'sa{sv}as', (PLAYER_INTERFACE, changed, []))
+        with self._send_lock:
+            self.last_emit = time.perf_counter()
+            self._connection.send(message)
+
+    def _serve(self):
+        from jeepney import MessageType, HeaderFields, new_error, new_method_return
+
+        while not self._stop_event.is_set():
+            try:
+                message = self._connection.receive(timeout=0.5)
+            except TimeoutError:
+                continue
+            except OSError:
+                return
+            fields = message.header.fields
+            if message.header.message_type != MessageType.method_call:
+                continue
+            member = fields.get(HeaderFields.member)
+            if fields.get(HeaderFields.interface) == PROPERTIES_INTERFACE and member == 'GetAll':
+                reply = new_method_return(message, 'a{sv}', (self._properties(),))
+            elif fields.get(HeaderFields.interface) == PROPERTIES_INTERFACE and member == 'Get':
+                value = self._properties().get(message.body[1])
+                reply = (new_method_return(message, 'v', (value,)) if value is not None
+                         else new_error(message, 'org.freedesktop.DBus.Error.InvalidArgs'))
+            else:
+                reply = new_error(message, 'org.freedesktop.DBus.Error.UnknownMethod')
+            with self._send_lock:
+                self._connection.send(reply)
+
+def measure(player, changes):
+    """Plays `changes` tracks and returns the emit-to-on_change latencies in milliseconds."""
+    received = threading.Event()
+    latencies = []
+
+    def on_change():
+        latencies.append((time.perf_counter() - player.last_emit) * 1000)
+        received.set()
+
+    source = MprisSource(on_change=on_change)
+    if not source.start():
+        raise RuntimeError("MprisSource could not connect to the session bus")
+    time.sleep(0.5) # Let the listener subscribe before the first change
+    missed = 0
+    for index in range(changes):
+        received.clear()
+        player.play(f'Track {index}', 'Radiohead', 'OK Computer', 240000)
+        if not received.wait(2):
+            missed += 1
+        elif source.current().title != f'Track {index}':
+            raise RuntimeError(f"Source reports {source.current()!r} after Track {index}")
+        time.sleep(0.02)
+    source.stop()
+    return latencies, missed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a mock MPRIS player on the session bus.')
+    parser.add_argument('--name', default='mock', help='Player name after org.mpris.MediaPlayer2.')
+    parser.add_argument('--interval', type=float, default=30, help='Seconds per track when not measuring')
+    parser.add_argument('--measure', action='store_true', help='Measure MprisSource change latency and exit')
+    parser.add_argument('--changes', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    player = MockPlayer(args.name).start()
+    try:
+        if args.measure:
+            latencies, missed = measure(player, args.changes)
+            latencies.sort()
+            print(f"{len(latencies)} changes, {missed} missed; latency median "
+                  f"{statistics.median(latencies):.2f} ms, p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} ms, "
+                  f"max {latencies[-1]:.2f} ms")
+            return 1 if missed else 0
+        index = 0
+        while True:
+            player.play(f'Track {index}', 'Radiohead', 'OK Computer', int(args.interval * 1000))
+            print(f"Playing Track {index}")
+            index += 1
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        player.stop()
+
+if __name__ == '__main__':
+    sys.exit(main())
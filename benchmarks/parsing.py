@@ -0,0 +1,97 @@
+"""
+Compares the in-thread and process-pool parsing backends.
+
+Parses the recorded profile and library pages from several threads at once,
+as the multi-account service does, and reports pages per second. A ticker
+thread meanwhile stands in for the tray's event thread: it asks to wake up
+every few milliseconds, and its lateness shows how long parsing kept it
+from getting the GIL.
+
+    python -m benchmarks.parsing --workers 0 2 4 --threads 4 --pages 200
+"""
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api.lastfm.user.library import extract_count
+from api.lastfm.user.profile import extract_user_data
+from benchmarks.standin import load_fixture
+from utils.parsing import ParsingPool
+
+PAGES = (
+    (extract_user_data, 'profile.html'),
+    (extract_count, 'library_artist.html'),
+    (extract_count, 'library_track.html'),
+)
+
+def ticker(stop_event, interval, lateness):
+    """Sleeps for `interval` over and over and records how late each wake-up was."""
+    while not stop_event.is_set():
+        start = time.perf_counter()
+        time.sleep(interval)
+        lateness.append(time.perf_counter() - start - interval)
+
+def measure(workers, args, pages):
+    pool = ParsingPool(workers)
+    pool.start()
+    expected = [extractor(content) for extractor, content in pages]
+    # Warm every worker up: imports and the first parse are not steady-state costs
+    for _ in range(max(workers, 1)):
+        if [pool.parse(extractor, content) for extractor, content in pages] != expected:
+            raise RuntimeError('The parsing backends disagree')
+
+    lateness = []
+    stop_event = threading.Event()
+    tick_thread = threading.Thread(target=ticker, args=(stop_event, args.tick / 1000, lateness))
+    tick_thread.start()
+    time.sleep(0.2)
+    idle_ticks = len(lateness)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        list(executor.map(lambda index: pool.parse(*pages[index % len(pages)]), range(args.pages)))
+    elapsed = time.perf_counter() - start
+    stop_event.set()
+    tick_thread.join()
+    pool.shutdown()
+
+    busy = sorted(lateness[idle_ticks:]) or [0.0]
+    return {
+        'workers': workers,
+        'backend': 'process' if workers else 'thread',
+        'pages_per_second': round(args.pages / elapsed, 1),
+        'tick_lateness_median_ms': round(statistics.median(busy) * 1000, 2),
+        'tick_lateness_p99_ms': round(busy[min(len(busy) - 1, int(len(busy) * 0.99))] * 1000, 2),
+        'tick_lateness_max_ms': round(busy[-1] * 1000, 2),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the HTML parsing backends.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2, 4], help='Pool sizes; 0 parses in-thread')
+    parser.add_argument('--threads', type=int, default=4, help='Threads requesting pages concurrently')
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--tick', type=float, default=5, help='Ticker interval in milliseconds')
+    parser.add_argument('--report', help='Write the results as JSON')
+    args = parser.parse_args(argv)
+
+    pages = [(extractor, load_fixture(name)) for extractor, name in PAGES]
+    results = []
+    print(f"{'backend':>8} {'workers':>7} {'pages/s':>8} {'tick late median ms':>19} {'p99 ms':>7} {'max ms':>7}")
+    for workers in args.workers:
+        result = measure(workers, args, pages)
+        results.append(result)
+        print(f"{result['backend']:>8} {workers:7d} {result['pages_per_second']:8.1f} "
+              f"{result['tick_lateness_median_ms']:19.2f} {result['tick_lateness_p99_ms']:7.2f} "
+              f"{result['tick_lateness_max_ms']:7.2f}")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
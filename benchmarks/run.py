@@ -0,0 +1,304 @@
+"""
+Offline benchmark suite.
+
+Runs microbenchmarks of the parsing and rendering helpers and an end-to-end
+track-change benchmark against the local stand-in server and a fake Discord
+IPC endpoint. Nothing here talks to last.fm or Discord.
+
+    python -m benchmarks.run                                  # run and print
+    python -m benchmarks.run --save benchmarks/baselines/local.json
+    python -m benchmarks.run --compare benchmarks/baselines/local.json
+    python -m benchmarks.run --filter e2e --latency 80 --jitter 40
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = {}
+
+def benchmark(name, iterations=200):
+    """Registers a benchmark. The function returns a list of samples in seconds."""
+    def register(func):
+        BENCHMARKS[name] = (func, iterations)
+        return func
+    return register
+
+def measure(func, iterations, warmup=5):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'unit': 'seconds',
+        'iterations': len(ordered),
+        'mean': statistics.fmean(ordered),
+        'median': statistics.median(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'min': ordered[0],
+        'max': ordered[-1],
+    }
+
+class FakeResponse:
+    """The subset of requests.Response used by the scrapers."""
+
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+# -- Microbenchmarks
+
+@benchmark('get_dom.profile', iterations=50)
+def bench_get_dom(args):
+    from benchmarks.standin import load_fixture
+    from utils.request_utils import get_dom
+
+    response = FakeResponse(load_fixture('profile.html'))
+    return measure(lambda: get_dom(response), args.iterations or 50)
+
+@benchmark('parse_user_header_status')
+def bench_parse_header_status(args):
+    from benchmarks.standin import load_fixture
+    from api.lastfm.user.profile import parse_user_header_status
+    from utils.request_utils import get_dom
+
+    dom = get_dom(FakeResponse(load_fixture('profile.html')))
+    return measure(lambda: parse_user_header_status(dom), args.iterations or 200)
+
+@benchmark('parse_count')
+def bench_parse_count(args):
+    from benchmarks.standin import load_fixture
+    from api.lastfm.user.library import parse_count
+    from utils.request_utils import get_dom
+
+    dom = get_dom(FakeResponse(load_fixture('library_artist.html')))
+    return measure(lambda: parse_count(dom), args.iterations or 200)
+
+@benchmark('format_image_text', iterations=5000)
+def bench_format_image_text(args):
+    from api.discord.rpc import DiscordRPC
+    from constants.project import RPC_LINE_LIMIT, RPC_XCHAR
+
+    rpc = DiscordRPC()
+    lines = {
+        'name': 'Bench User (@benchuser)',
+        'scrobbles': 'Scrobbles: 184223',
+        'artists': 'Artists: 6031',
+        'loved_tracks': 'Loved Tracks: 1408',
+    }
+    return measure(lambda: rpc._format_image_text(lines, RPC_LINE_LIMIT, RPC_XCHAR), args.iterations or 5000)
+
+@benchmark('update_status.cached', iterations=2000)
+def bench_update_status(args):
+    from api.discord.rpc import DiscordRPC
+
+    class NullPresence:
+        def update(self, **kwargs):
+            pass
+
+    rpc = DiscordRPC()
+    rpc.RPC = NullPresence()
+    # Stats cached for this track, so only rendering and publishing are measured
+    rpc.last_fetched_track = 'Radiohead - Reckoner'
+    rpc.cached_user_data = {'display_name': 'Bench User', 'avatar_url': None, 'header_status': [184223, 6031, 1408]}
+    rpc.cached_library_data = {'artist_count': 2417, 'track_count': 143}
+
+    def run():
+        rpc.last_track = None
+        rpc.update_status('Radiohead - Reckoner', 'Reckoner', 'Radiohead', 'In Rainbows', 290000, 'benchuser', None)
+
+    return measure(run, args.iterations or 2000)
+
+# -- End-to-end
+
+class EndToEnd:
+    """
+    Wires the real User and DiscordRPC to the stand-in server and fake IPC.
+
+    Each iteration changes the now-playing track on the server and measures
+    the time from the poll starting to the activity arriving at the fake
+    Discord endpoint.
+    """
+
+    def __init__(self, args):
+        from benchmarks.standin import StandInServer, FakeDiscordIPC, redirect_network
+        import api.lastfm.user.library as library
+        import api.lastfm.user.profile as profile
+        import api.lastfm.user.tracking as tracking
+        import api.lastfm.enrichment as enrichment
+        import api.lastfm.prefetch as prefetch
+        from api.lastfm.metadata_cache import MetadataCache
+        from api.discord.rpc import DiscordRPC
+
+        self.server = StandInServer(args.latency / 1000, args.jitter / 1000, args.error_rate, seed=1)
+        base_url = self.server.start()
+        self.ipc = FakeDiscordIPC()
+        os.environ['XDG_RUNTIME_DIR'] = self.ipc.start()
+
+        profile.LASTFM_USER_URL = f'{base_url}/user/{{username}}'
+        library.LASTFM_LIBRARY_URL = f'{base_url}/user/{{username}}/library'
+        tracking.metadata_cache = MetadataCache(os.path.join(tempfile.mkdtemp(), 'metadata.db'))
+        prefetch.metadata_cache = tracking.metadata_cache
+        redirect_network(tracking.get_network(), base_url)
+        # Stage results are shared process-wide; earlier benchmarks must not warm this one
+        enrichment._cache.clear()
+        prefetch._albums.clear()
+
+        self.user = tracking.User('benchuser')
+        self.rpc = DiscordRPC()
+        self.rpc.enable()
+        if not self.rpc.is_connected:
+            raise RuntimeError('Could not connect to the fake Discord IPC endpoint')
+
+    def close(self):
+        self.rpc.disable()
+        self.ipc.stop()
+        self.server.stop()
+
+    def track_change(self, artist, title, album):
+        self.server.now_playing = {'artist': artist, 'title': title, 'album': album}
+        received = len(self.ipc.activities)
+        start = time.perf_counter()
+        current_track, data = self.user.now_playing()
+        title, artist, album, artwork, time_remaining = data
+        self.rpc.update_status(str(current_track), str(title), str(artist), str(album), time_remaining, 'benchuser', artwork)
+        if not self.ipc.wait_for_activity(received + 1):
+            raise RuntimeError('No activity reached the fake Discord IPC endpoint')
+        return self.ipc.activities[-1][0] - start
+
+    def play(self, prefetcher, poll_interval=5):
+        """Plays the current track to its end on the installed clock, reporting each poll to the prefetcher."""
+        from api.lastfm.prefetch import _get_executor
+        from utils.clock import clock
+
+        title, artist, album, _, duration = self.user.last_track_info
+        for _ in range(max(1, int(duration / 1000 / poll_interval))):
+            clock.sleep(poll_interval)
+            prefetcher.observe(str(title), str(artist), album.get_title() if album else None, duration)
+            # The prefetch thread runs one job at a time: this returns once the queued ones are done
+            _get_executor().submit(lambda: None).result()
+
+@benchmark('e2e.track_change.new_album', iterations=20)
+def bench_e2e_new_album(args):
+    e2e = EndToEnd(args)
+    try:
+        iterations = args.iterations or 20
+        return [e2e.track_change('Radiohead', f'Track {i}', f'Album {i}') for i in range(iterations)]
+    finally:
+        e2e.close()
+
+@benchmark('e2e.track_change.same_album', iterations=20)
+def bench_e2e_same_album(args):
+    e2e = EndToEnd(args)
+    try:
+        iterations = args.iterations or 20
+        e2e.track_change('Radiohead', 'Warm Up', 'In Rainbows')
+        return [e2e.track_change('Radiohead', f'Track {i}', 'In Rainbows') for i in range(iterations)]
+    finally:
+        e2e.close()
+
+@benchmark('e2e.track_change.album_prefetch', iterations=20)
+def bench_e2e_album_prefetch(args):
+    # Like same_album, but each track plays to its end (on a virtual clock) with the prefetcher following it
+    from api.lastfm.prefetch import Prefetcher
+    from utils.clock import clock, VirtualClock
+
+    e2e = EndToEnd(args)
+    clock.install(VirtualClock(speed=1000))
+    try:
+        iterations = args.iterations or 20
+        e2e.server.album_tracks = ['Warm Up'] + [f'Track {i}' for i in range(iterations)]
+        prefetcher = Prefetcher('benchuser', e2e.rpc.enricher)
+        e2e.track_change('Radiohead', 'Warm Up', 'In Rainbows')
+        samples = []
+        for i in range(iterations):
+            e2e.play(prefetcher)
+            samples.append(e2e.track_change('Radiohead', f'Track {i}', 'In Rainbows'))
+        return samples
+    finally:
+        clock.reset()
+        e2e.close()
+
+# -- Baselines
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path, threshold):
+    """Prints the median change against a baseline. Returns the regressed benchmark names."""
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = json.load(file)['benchmarks']
+    regressions = []
+    print(f"\nCompared with {baseline_path} (threshold {threshold:.0%}):")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = result['median'] / baseline[name]['median'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"  {name:<32} {change:+8.1%}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmark suite.')
+    parser.add_argument('--filter', default='', help='Only run benchmarks whose name contains this text')
+    parser.add_argument('--iterations', type=int, default=0, help='Override the iteration count of every benchmark')
+    parser.add_argument('--latency', type=float, default=30, help='Stand-in server latency in ms')
+    parser.add_argument('--jitter', type=float, default=0, help='Additional random latency in ms')
+    parser.add_argument('--error-rate', type=float, default=0, help='Fraction of stand-in requests answered with 503')
+    parser.add_argument('--save', help='Write the results as a baseline JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Median slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    results = {}
+    for name, (func, _) in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        results[name] = summarize(func(args))
+        summary = results[name]
+        print(f"{name:<32} median {summary['median'] * 1000:10.3f} ms   p95 {summary['p95'] * 1000:10.3f} ms   ({summary['iterations']} runs)")
+
+    document = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'latency_ms': args.latency, 'jitter_ms': args.jitter, 'error_rate': args.error_rate},
+        'benchmarks': results,
+    }
+    if args.save:
+        directory = os.path.dirname(args.save)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as file:
+            json.dump(document, file, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
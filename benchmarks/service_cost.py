@@ -0,0 +1,121 @@
+"""
+Measures the per-account cost of the multi-account service.
+
+Runs core.service.Service against the local stand-in server under an
+accelerated virtual clock, once per account count, and reports memory per
+account and requests per account-hour:
+
+    python -m benchmarks.service_cost --accounts 10 100 1000 --minutes 30
+
+Every account plays the same rotating tracks, so artwork and duration
+lookups hit the shared metadata cache after the first account; profile
+and library pages are still fetched per account.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import api.lastfm.user.library as library
+import api.lastfm.user.profile as profile
+import api.lastfm.user.tracking as tracking
+from api.lastfm.metadata_cache import MetadataCache
+from benchmarks.soak import current_rss
+from benchmarks.standin import StandInServer, redirect_network
+from core.service import Service
+from utils.clock import clock, VirtualClock
+from utils.logging_config import setup_logging
+
+TRACK_SECONDS = 210 # Average track length used to rotate the stand-in's now playing
+
+def measure(count, args, server):
+    tracking.metadata_cache = MetadataCache(os.path.join(tempfile.mkdtemp(), 'metadata.db'))
+    virtual_clock = clock.install(VirtualClock(args.speed))
+    gc.collect()
+    rss_before = current_rss()
+    traced_before = tracemalloc.get_traced_memory()[0]
+    requests_before = dict(server.request_counts)
+
+    service = Service([f'user{i:04d}' for i in range(count)], workers=args.workers,
+                      requests_per_second=args.rate, sinks_config={})
+    worker = threading.Thread(target=service.run, daemon=True)
+    worker.start()
+
+    end = args.minutes * 60
+    track = 0
+    while virtual_clock.elapsed() < end:
+        if virtual_clock.elapsed() >= (track + 1) * TRACK_SECONDS:
+            track += 1
+            server.now_playing = {'artist': 'Radiohead', 'title': f'Track {track}', 'album': f'Album {track // 10}'}
+        time.sleep(0.05)
+
+    gc.collect()
+    rss_after = current_rss()
+    traced_after = tracemalloc.get_traced_memory()[0]
+    service.stop()
+    worker.join(30)
+    clock.reset()
+
+    hours = args.minutes / 60
+    requests = {key: value - requests_before.get(key, 0) for key, value in server.request_counts.items()}
+    return {
+        'accounts': count,
+        'polls': service.polls,
+        'polls_per_account_hour': round(service.polls / count / hours, 1),
+        'requests_per_account_hour': round(sum(requests.values()) / count / hours, 1),
+        'requests_per_poll': round(service.poll_cost, 2),
+        'min_poll_interval_s': round(service.min_interval(), 1),
+        'rss_kb_per_account': round((rss_after - rss_before) / 1024 / count, 1),
+        'traced_kb_per_account': round((traced_after - traced_before) / 1024 / count, 1),
+        'requests_by_kind': requests,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure per-account service costs.')
+    parser.add_argument('--accounts', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--minutes', type=float, default=30, help='Virtual minutes per run')
+    parser.add_argument('--speed', type=float, default=10,
+                        help='Virtual seconds per real second. Worker compute is sped up too while the scheduler waits, so keep it low')
+    parser.add_argument('--rate', type=float, default=5, help='Requests per second for the whole service')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--traced', action='store_true', help='Also measure tracemalloc memory (slows polling)')
+    parser.add_argument('--report', help='Write the results as JSON')
+    args = parser.parse_args(argv)
+
+    setup_logging(level=logging.WARNING)
+    server = StandInServer(latency=0.01, seed=1)
+    base_url = server.start()
+    profile.LASTFM_USER_URL = f'{base_url}/user/{{username}}'
+    library.LASTFM_LIBRARY_URL = f'{base_url}/user/{{username}}/library'
+    redirect_network(tracking.get_network(), base_url)
+    server.now_playing = {'artist': 'Radiohead', 'title': 'Track 0', 'album': 'Album 0'}
+    if args.traced:
+        tracemalloc.start()
+
+    # A short single-account run first, so lazily imported modules and
+    # one-off buffers are not counted as per-account memory
+    measure(1, argparse.Namespace(**{**vars(args), 'minutes': 1}), server)
+
+    results = []
+    print(f"{'accounts':>8} {'polls/acct/h':>12} {'req/acct/h':>10} {'req/poll':>8} {'interval s':>10} {'RSS KB/acct':>11} {'traced KB/acct':>14}")
+    for count in args.accounts:
+        result = measure(count, args, server)
+        results.append(result)
+        print(f"{count:8d} {result['polls_per_account_hour']:12.1f} {result['requests_per_account_hour']:10.1f} "
+              f"{result['requests_per_poll']:8.2f} {result['min_poll_interval_s']:10.1f} "
+              f"{result['rss_kb_per_account']:11.1f} {result['traced_kb_per_account']:14.1f}")
+    server.stop()
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""
+Replays a recorded session under an accelerated virtual clock.
+
+Record a session by setting RECORDING.ENABLED in config.yaml and using the
+app normally; the recording is written to diagnostics/session-*.jsonl.gz.
+Then drive the real App.run_rpc, User and DiscordRPC code against it:
+
+    python -m benchmarks.soak diagnostics/session-XXXX.jsonl.gz --hours 24 --speed 500
+
+The recording is looped until the requested virtual duration is reached.
+Memory (RSS and tracemalloc), cycle latency and request counts are sampled
+along the way, and the run fails if traced memory keeps growing.
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from urllib.parse import urlsplit
+
+# The tray is never shown during a replay
+os.environ.setdefault('PYSTRAY_BACKEND', 'dummy')
+
+import requests
+
+import api.lastfm.user.tracking as tracking
+from api.lastfm.metadata_cache import MetadataCache
+from core.application import App
+from utils.clock import clock, VirtualClock
+from utils.logging_config import setup_logging
+from utils.metrics import metrics
+from utils.recording import load_recording
+from utils.request_utils import set_http_get
+
+class ReplayCounters:
+    def __init__(self):
+        self.api_calls = 0
+        self.http_requests = 0
+        self.http_misses = 0
+        self.discord_updates = 0
+
+class ReplayArtist:
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+class ReplayAlbum:
+    """Mimics the parts of pylast.Album used by User._get_track_info."""
+
+    def __init__(self, artist, title, artwork, counters):
+        self.artist = artist
+        self.title = title
+        self.artwork = artwork
+        self.counters = counters
+
+    def get_title(self):
+        return self.title
+
+    def get_cover_image(self):
+        self.counters.api_calls += 1
+        return self.artwork
+
+    def __str__(self):
+        return f'{self.artist} - {self.title}'
+
+class ReplayTrack:
+    """Mimics the parts of pylast.Track used by User._get_track_info."""
+
+    def __init__(self, name, info, counters):
+        self.name = name
+        self.info = info
+        self.counters = counters
+
+    def get_title(self):
+        return self.info[0]
+
+    def get_artist(self):
+        return ReplayArtist(self.info[1])
+
+    def get_album(self):
+        title, artist, album, artwork, _ = self.info
+        return ReplayAlbum(artist, album, artwork, self.counters) if album else None
+
+    def get_duration(self):
+        self.counters.api_calls += 1
+        return self.info[4]
+
+    def __str__(self):
+        return self.name
+
+class ReplayUser(tracking.User):
+    """A User whose now-playing state follows the recording on the virtual clock."""
+
+    def __init__(self, username, recording, counters):
+        super().__init__(username)
+        self.recording = recording
+        self.counters = counters
+        self.origin = clock.monotonic()
+        self.times = [t for t, _ in recording['polls']]
+        self.period = max(recording['duration'], 1.0)
+
+    def _get_current_track(self):
+        self.counters.api_calls += 1
+        position = (clock.monotonic() - self.origin) % self.period
+        index = bisect.bisect_right(self.times, position) - 1
+        name = self.recording['polls'][index][1] if index >= 0 else None
+        info = self.recording['track_info'].get(name)
+        if not name or info is None:
+            return None
+        return ReplayTrack(name, info, self.counters)
+
+class ReplayResponse:
+    """The subset of requests.Response used by get_response/get_dom."""
+
+    def __init__(self, url, status_code, content):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} for replayed url: {self.url}')
+
+class ReplayPresence:
+    """Stands in for the Discord client; every call succeeds instantly."""
+
+    def __init__(self, counters):
+        self.counters = counters
+
+    def connect(self):
+        pass
+
+    def update(self, **kwargs):
+        self.counters.discord_updates += 1
+
+    def clear(self, *args, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+class ReplayApp(App):
+    """The tray application without a tray, fed from a recording."""
+
+    snapshot_path = None
+
+    def __init__(self, recording, counters):
+        self.recording = recording
+        self.counters = counters
+        super().__init__()
+        self.username = recording['header'].get('username', self.username)
+        self.rpc.presence_factory = lambda: ReplayPresence(counters)
+
+    def setup_tray_icon(self):
+        return None
+
+    def create_sinks(self):
+        return []
+
+    def create_local_source(self):
+        return None
+
+    def create_http_client(self):
+        return None
+
+    def create_prefetcher(self):
+        return None # The recording has no answers for requests the session did not make
+
+    def create_user(self):
+        return ReplayUser(self.username, self.recording, self.counters)
+
+def current_rss():
+    """Resident set size in bytes (Linux), or the peak RSS elsewhere."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def cycle_stats(previous):
+    """Mean and approximate p95 cycle latency (ms) since the previous snapshot."""
+    histogram = metrics.histogram('stage_seconds', ('stage', 'cycle'))
+    counts, total, count = histogram.snapshot()
+    prev_counts, prev_total, prev_count = previous or ([0] * len(counts), 0.0, 0)
+    delta = [a - b for a, b in zip(counts, prev_counts)]
+    cycles = count - prev_count
+    if not cycles:
+        return (counts, total, count), 0, None, None
+    threshold, seen, p95 = cycles * 0.95, 0, None
+    for bound, bucket in zip(histogram.buckets + (float('inf'),), delta):
+        seen += bucket
+        if seen >= threshold:
+            p95 = bound * 1000
+            break
+    return (counts, total, count), cycles, (total - prev_total) / cycles * 1000, p95
+
+def growth_per_hour(samples, key):
+    """Least-squares slope of samples[key] over virtual hours, on the second half of the run."""
+    points = [(s['virtual_hours'], s[key]) for s in samples[len(samples) // 2:]]
+    if len(points) < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    denominator = sum((x - mean_x) ** 2 for x, _ in points)
+    if not denominator:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / denominator
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a recorded session under a virtual clock.')
+    parser.add_argument('recording', help='Path to a session-*.jsonl.gz recording')
+    parser.add_argument('--hours', type=float, default=24, help='Virtual duration of the run')
+    parser.add_argument('--speed', type=float, default=500, help='Virtual seconds per real second while waiting')
+    parser.add_argument('--sample-minutes', type=float, default=30, help='Virtual minutes between samples')
+    parser.add_argument('--max-growth-kb', type=float, default=256, help='Allowed traced memory growth per virtual hour')
+    parser.add_argument('--report', help='Write the samples and summary as JSON')
+    args = parser.parse_args(argv)
+
+    setup_logging(level=logging.WARNING)
+    recording = load_recording(args.recording)
+    if not recording['polls']:
+        print(f"{args.recording} contains no polls to replay")
+        return 2
+
+    counters = ReplayCounters()
+    # Match pages by path so recordings made against a mirror or stand-in replay too
+    pages = {urlsplit(url).path: page for url, page in recording['http'].items()}
+
+    def replay_get(url, timeout=None):
+        counters.http_requests += 1
+        status_code, content = pages.get(urlsplit(url).path, (404, b''))
+        if status_code == 404:
+            counters.http_misses += 1
+        return ReplayResponse(url, status_code, content)
+
+    virtual_clock = clock.install(VirtualClock(args.speed))
+    set_http_get(replay_get)
+    tracking.metadata_cache = MetadataCache(os.path.join(tempfile.mkdtemp(), 'metadata.db'))
+    tracemalloc.start()
+
+    app = ReplayApp(recording, counters)
+    worker = threading.Thread(target=app.run_rpc, args=(asyncio.new_event_loop(),), daemon=True)
+    real_start = time.perf_counter()
+    worker.start()
+
+    samples = []
+    previous = None
+    step = args.sample_minutes * 60
+    next_sample = step
+    end = args.hours * 3600
+    print(f"{'hours':>6} {'rss MB':>8} {'traced MB':>10} {'cycles':>7} {'mean ms':>8} {'p95 ms':>8} {'api':>6} {'http':>6} {'updates':>7}")
+    while next_sample <= end:
+        # The lowest traced memory seen in the window filters out pages parsed mid-cycle;
+        # a leak shows up as a rising floor
+        traced = tracemalloc.get_traced_memory()[0]
+        while virtual_clock.elapsed() < next_sample:
+            time.sleep(0.05)
+            traced = min(traced, tracemalloc.get_traced_memory()[0])
+        previous, cycles, mean_ms, p95_ms = cycle_stats(previous)
+        sample = {
+            'virtual_hours': round(next_sample / 3600, 3),
+            'rss_bytes': current_rss(),
+            'traced_bytes': traced,
+            'cycles': cycles,
+            'cycle_mean_ms': mean_ms,
+            'cycle_p95_ms': p95_ms,
+            'api_calls': counters.api_calls,
+            'http_requests': counters.http_requests,
+            'discord_updates': counters.discord_updates,
+        }
+        samples.append(sample)
+        print(f"{sample['virtual_hours']:6.1f} {sample['rss_bytes'] / 2**20:8.1f} {traced / 2**20:10.2f} {cycles:7d} "
+              f"{mean_ms or 0:8.1f} {p95_ms or 0:8.0f} {counters.api_calls:6d} {counters.http_requests:6d} {counters.discord_updates:7d}")
+        next_sample += step
+
+    app.stop()
+    worker.join(10)
+    clock.reset()
+    set_http_get(None)
+
+    growth_kb = growth_per_hour(samples, 'traced_bytes') / 1024
+    summary = {
+        'recording': args.recording,
+        'virtual_hours': args.hours,
+        'real_seconds': round(time.perf_counter() - real_start, 1),
+        'traced_growth_kb_per_hour': round(growth_kb, 1),
+        'rss_growth_kb_per_hour': round(growth_per_hour(samples, 'rss_bytes') / 1024, 1),
+        'api_calls_per_hour': round(counters.api_calls / args.hours, 1),
+        'http_requests_per_hour': round(counters.http_requests / args.hours, 1),
+        'replay_misses': counters.http_misses,
+    }
+    print(json.dumps(summary, indent=2))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump({'summary': summary, 'samples': samples}, file, indent=2)
+
+    if growth_kb > args.max_growth_kb:
+        print(f"Traced memory grows by {growth_kb:.0f} KB per virtual hour (limit {args.max_growth_kb:.0f} KB)")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,308 @@
+"""
+Local stand-ins for the services the app talks to.
+
+- StandInServer: serves recorded last.fm profile/library pages and web
+  service XML over plain HTTP, with configurable latency and error rate.
+- FakeDiscordIPC: a Unix socket speaking Discord's IPC framing, so the real
+  pypresence client can connect and publish to it.
+- redirect_network(): routes a pylast network's web-service calls to the
+  stand-in server instead of ws.audioscrobbler.com.
+"""
+import json
+import os
+import random
+import re
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+from urllib.parse import parse_qs, unquote
+from xml.sax.saxutils import escape
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as file:
+        return file.read()
+
+def load_template(name):
+    return Template(load_fixture(name).decode('utf-8'))
+
+class StandInServer:
+    """
+    Threaded HTTP server answering like www.last.fm and ws.audioscrobbler.com.
+
+    The now-playing track is whatever `now_playing` is set to; album
+    tracklists are derived from `album_tracks`. Every request is delayed by
+    `latency` (+ up to `jitter`) seconds and fails with a 503 with
+    probability `error_rate`.
+    """
+
+    ROUTES = (
+        (re.compile(r'^/user/[^/]+$'), 'profile.html'),
+        (re.compile(r'^/user/[^/]+/library/music/\+noredirect/[^/]+$'), 'library_artist.html'),
+        (re.compile(r'^/user/[^/]+/library/music/\+noredirect/[^/]+/_/[^/]+$'), 'library_track.html'),
+    )
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.now_playing = None # dict(artist, title, album) or None
+        self.album_tracks = [] # titles of the now-playing album
+        self.duration = 215000
+        self.loved = False
+        self.request_counts = {}
+        self.bytes_sent = 0
+        self._pages = {name: load_fixture(name) for _, name in self.ROUTES}
+        self._templates = {
+            name: load_template(name) for name in (
+                'recent_tracks.xml', 'recent_tracks_idle.xml', 'track_info.xml',
+                'album_info.xml', 'album_track.xml'
+            )
+        }
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server._handle(self, unquote(self.path.split('?')[0]), None)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                form = parse_qs(self.rfile.read(length).decode('utf-8'))
+                server._handle(self, self.path.split('?')[0], {k: v[0] for k, v in form.items()})
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='standin-http', daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def total_requests(self):
+        with self._lock:
+            return sum(self.request_counts.values())
+
+    def _count(self, key, size):
+        with self._lock:
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+            self.bytes_sent += size
+
+    def _render(self, name, **values):
+        safe = {key: escape(str(value)) for key, value in values.items()}
+        return self._templates[name].safe_substitute(safe).encode('utf-8')
+
+    def _track_values(self):
+        track = self.now_playing or {'artist': 'Unknown', 'title': 'Unknown', 'album': ''}
+        cover = f"{abs(hash((track['artist'], track['album']))):032x}"[:32]
+        titles = self.album_tracks or [track['title']]
+        position = titles.index(track['title']) + 1 if track['title'] in titles else 1
+        return dict(track, cover=cover, position=position, duration=self.duration,
+                    loved=int(self.loved), username='benchuser')
+
+    def _api_body(self, method):
+        values = self._track_values()
+        if method == 'user.getRecentTracks':
+            name = 'recent_tracks.xml' if self.now_playing else 'recent_tracks_idle.xml'
+            return self._render(name, **values)
+        if method == 'track.getInfo':
+            return self._render('track_info.xml', **values)
+        if method == 'album.getInfo':
+            tracks = b''.join(
+                self._render('album_track.xml', rank=rank, title=title, artist=values['artist'], seconds=self.duration // 1000)
+                for rank, title in enumerate(self.album_tracks or [values['title']], start=1)
+            ).decode('utf-8')
+            return self._templates['album_info.xml'].safe_substitute(
+                {key: escape(str(value)) for key, value in values.items()}, tracks=tracks
+            ).encode('utf-8')
+        return None
+
+    def delay(self):
+        """Seconds the next response is delayed by."""
+        return self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+
+    def respond(self, path, form):
+        """
+        Answers a request and counts it, without the delay.
+
+        Args:
+            path (str): The unquoted URL path.
+            form (dict): The form fields of a web-service POST, None for a page GET.
+
+        Returns:
+            tuple: (status, body, content type)
+        """
+        if self.error_rate and self.random.random() < self.error_rate:
+            self._count('error', 0)
+            return 503, b'Service Unavailable', 'text/plain'
+
+        if form is not None:
+            method = form.get('method', '')
+            body = self._api_body(method)
+            if body is None:
+                body = b'<?xml version="1.0" encoding="UTF-8"?><lfm status="failed"><error code="3">Invalid Method</error></lfm>'
+            self._count(method, len(body))
+            return 200, body, 'text/xml; charset=utf-8'
+
+        for pattern, name in self.ROUTES:
+            if pattern.match(path):
+                body = self._pages[name]
+                self._count(name, len(body))
+                return 200, body, 'text/html; charset=utf-8'
+
+        self._count('not_found', 0)
+        return 404, b'Not Found', 'text/plain'
+
+    def _handle(self, handler, path, form):
+        delay = self.delay()
+        if delay:
+            time.sleep(delay)
+        self._send(handler, *self.respond(path, form))
+
+    @staticmethod
+    def _send(handler, status, body, content_type):
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+class FakeDiscordIPC:
+    """
+    Minimal Discord IPC endpoint on a Unix socket (Linux/macOS only).
+
+    Answers the handshake with READY and acknowledges SET_ACTIVITY frames,
+    recording the perf_counter() time each activity arrived. Point
+    pypresence at it by exporting XDG_RUNTIME_DIR=<ipc.directory>.
+    """
+
+    def __init__(self):
+        if sys.platform == 'win32':
+            raise RuntimeError('FakeDiscordIPC needs Unix domain sockets')
+        self.directory = tempfile.mkdtemp(prefix='fake-discord-')
+        self.path = os.path.join(self.directory, 'discord-ipc-0')
+        self.activities = [] # (perf_counter, activity)
+        self.activity_event = threading.Event()
+        self._socket = None
+        self._running = False
+
+    def start(self):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.path)
+        self._socket.listen()
+        self._running = True
+        threading.Thread(target=self._accept_loop, name='fake-discord', daemon=True).start()
+        return self.directory
+
+    def stop(self):
+        self._running = False
+        if self._socket:
+            self._socket.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rmdir(self.directory)
+
+    def wait_for_activity(self, count, timeout=10):
+        """Blocks until at least `count` activities were received."""
+        deadline = time.perf_counter() + timeout
+        while len(self.activities) < count:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return False
+            self.activity_event.wait(remaining)
+            self.activity_event.clear()
+        return True
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _recv_exact(conn, size):
+        data = b''
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    @staticmethod
+    def _send(conn, op, payload):
+        body = json.dumps(payload).encode('utf-8')
+        conn.sendall(struct.pack('<II', op, len(body)) + body)
+
+    def _serve(self, conn):
+        with conn:
+            try:
+                while True:
+                    op, length = struct.unpack('<II', self._recv_exact(conn, 8))
+                    payload = json.loads(self._recv_exact(conn, length))
+                    if op == 0:
+                        # Connections that only probe the path (test_ipc_path) close here
+                        self._send(conn, 1, {'cmd': 'DISPATCH', 'evt': 'READY', 'data': {'v': 1}, 'nonce': None})
+                    elif op == 1:
+                        args = payload.get('args', {})
+                        if payload.get('cmd') == 'SET_ACTIVITY':
+                            self.activities.append((time.perf_counter(), args.get('activity')))
+                            self.activity_event.set()
+                        self._send(conn, 1, {'cmd': payload.get('cmd'), 'evt': None, 'data': args.get('activity'), 'nonce': payload.get('nonce')})
+                    elif op == 2:
+                        return
+            except (ConnectionError, OSError, struct.error, ValueError):
+                return
+
+def redirect_network(network, base_url):
+    """
+    Sends every web-service call of a pylast network to `base_url`.
+
+    pylast opens a short-lived client per request and mounts
+    `network.proxy` on it, so a custom transport placed there sees every
+    call. The transport rewrites the request URL and reuses one pooled
+    HTTP transport for all of them.
+    """
+    import pylast
+    httpx = pylast.httpx # the HTTP client module pylast itself uses
+
+    target = httpx.URL(base_url)
+
+    class RedirectTransport(httpx.BaseTransport):
+        def __init__(self):
+            self._inner = httpx.HTTPTransport()
+
+        def handle_request(self, request):
+            request.url = request.url.copy_with(scheme=target.scheme, host=target.host, port=target.port)
+            return self._inner.handle_request(request)
+
+        def close(self):
+            # pylast closes its client after every call; keep the pool alive
+            pass
+
+    network.proxy = {'all://': RedirectTransport()}
+    return network
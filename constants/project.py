@@ -1,8 +1,56 @@
-from utils.reader import load_config, load_translations
+from utils.reader import load_config, load_section, load_translations
 
 # Loaded from config.yaml
 USERNAME, API_KEY, API_SECRET, APP_LANG = load_config()
 
+# Optional config.yaml sections
+LOGGING_CONFIG = load_section('LOGGING')
+LOGGING_FORMAT = LOGGING_CONFIG.get('FORMAT', 'text') # Console format: text or json
+LOGGING_FILE = LOGGING_CONFIG.get('FILE') # Optional log file, rotated by size
+LOGGING_FILE_FORMAT = LOGGING_CONFIG.get('FILE_FORMAT', 'json')
+LOGGING_MAX_BYTES = LOGGING_CONFIG.get('MAX_BYTES', 5 * 1024 * 1024)
+LOGGING_BACKUPS = LOGGING_CONFIG.get('BACKUPS', 3)
+METRICS_CONFIG = load_section('METRICS')
+METRICS_PORT = METRICS_CONFIG.get('PORT', 0) # 0 disables the localhost endpoint
+TRACING_CONFIG = load_section('TRACING')
+TRACING_ENABLED = TRACING_CONFIG.get('ENABLED', False)
+TRACING_SAMPLE_RATE = TRACING_CONFIG.get('SAMPLE_RATE', 1.0) # Fraction of cycles written
+TRACING_SLOW_ONLY_MS = TRACING_CONFIG.get('SLOW_ONLY_MS', 0) # >0 keeps only cycles slower than this
+TRACING_MAX_BYTES = TRACING_CONFIG.get('MAX_BYTES', 5 * 1024 * 1024)
+TRACING_BACKUPS = TRACING_CONFIG.get('BACKUPS', 3)
+RECORDING_CONFIG = load_section('RECORDING')
+RECORDING_ENABLED = RECORDING_CONFIG.get('ENABLED', False) # Capture the session for replay
+PARSING_CONFIG = load_section('PARSING')
+PARSING_WORKERS = PARSING_CONFIG.get('WORKERS', 0) # Worker processes for HTML parsing, 0 parses in-thread
+ENRICHMENT_CONFIG = load_section('ENRICHMENT')
+ENRICHMENT_STAGES = ENRICHMENT_CONFIG.get('STAGES') or [] # Run besides those the presence templates need, e.g. for the sinks
+ENRICHMENT_BUDGET = ENRICHMENT_CONFIG.get('BUDGET', 5) # Seconds to wait for all stages of a new track
+ENRICHMENT_TIMEOUTS = ENRICHMENT_CONFIG.get('TIMEOUTS') or {} # Per-stage timeout overrides in seconds
+ENRICHMENT_WORKERS = ENRICHMENT_CONFIG.get('WORKERS', 8) # Threads shared by all stages (and accounts)
+HTTP_CLIENT_CONFIG = load_section('HTTP_CLIENT')
+HTTP_BACKEND = HTTP_CLIENT_CONFIG.get('BACKEND', 'requests') # requests, or http2 for one multiplexed pool
+HTTP_KEEPALIVE = HTTP_CLIENT_CONFIG.get('KEEPALIVE', 120) # Seconds idle http2 connections are kept
+HTTP_KEEP_WARM = HTTP_CLIENT_CONFIG.get('KEEP_WARM', False) # Send HEAD requests to keep idle http2 connections open
+PRESENCE_CONFIG = load_section('PRESENCE') # Presence text templates, see api/discord/templates.py
+PREFETCH_CONFIG = load_section('PREFETCH')
+PREFETCH_ENABLED = PREFETCH_CONFIG.get('ENABLED', True) # Warm the caches for the next tracks of an album
+PREFETCH_TRACKS = PREFETCH_CONFIG.get('TRACKS', 1) # Upcoming tracks whose stats are prefetched
+PREFETCH_LEAD = PREFETCH_CONFIG.get('LEAD', 30) # Seconds before a track ends that the next one's stats are fetched
+CACHE_CONFIG = load_section('CACHE')
+CACHE_MEMORY_BUDGET = int(CACHE_CONFIG.get('MEMORY_BUDGET_MB', 32) * 1024 * 1024) # Shared by every in-memory cache
+SINKS_CONFIG = load_section('SINKS')
+SINKS_DISCORD = SINKS_CONFIG.get('DISCORD', True) # Publish to the Discord client over IPC
+MPRIS_CONFIG = load_section('MPRIS')
+MPRIS_ENABLED = MPRIS_CONFIG.get('ENABLED', False) # Follow local Linux players over D-Bus
+MPRIS_PLAYERS = MPRIS_CONFIG.get('PLAYERS') or [] # Player name fragments to follow, all if empty
+MPRIS_RECONCILE_INTERVAL = MPRIS_CONFIG.get('RECONCILE_INTERVAL', 30) # Last.fm check while a local player plays
+SERVICE_CONFIG = load_section('SERVICE')
+SERVICE_ACCOUNTS = SERVICE_CONFIG.get('ACCOUNTS') or [] # Usernames tracked by --service
+SERVICE_ACCOUNTS_FILE = SERVICE_CONFIG.get('ACCOUNTS_FILE') # Optional file with one username per line
+SERVICE_WORKERS = SERVICE_CONFIG.get('WORKERS', 8)
+SERVICE_REQUESTS_PER_SECOND = SERVICE_CONFIG.get('REQUESTS_PER_SECOND', 5) # Shared by all accounts
+SERVICE_IDLE_MAX_INTERVAL = SERVICE_CONFIG.get('IDLE_MAX_INTERVAL', 60) # Poll backoff cap for idle accounts
+
 # Discord Configuration
 CLIENT_ID = '702984897496875072'
 APP_NAME = "Last.fm Discord Rich Presence"
@@ -15,11 +63,25 @@ MAX_RETRIES = 10
 UPDATE_INTERVAL = 2
 TRACK_CHECK_INTERVAL = 5
 DEFAULT_COOLDOWN = 6
+HTTP_TIMEOUT = 20 # Page fetches through a shared session
+STAGE_FETCH_TRIES = 1 # Page fetches inside enrichment stages; the next poll runs a failed stage again
+STAGE_FETCH_TIMEOUT = 8 # Bounds how long a stage that timed out keeps its pool thread
+SERVICE_STATUS_INTERVAL = 60 # Service summary log and request cost refresh
+PROFILING_SAMPLE_INTERVAL = 0.005 # Stack sampler period while profiling
+METADATA_TTL = 30 * 24 * 60 * 60 # Album artwork / track duration cache
+METADATA_NEGATIVE_TTL = 24 * 60 * 60 # Albums without art, tracks without duration
+SNAPSHOT_INTERVAL = 60 # Warm-start snapshot save period while running
+SNAPSHOT_TRACK_MAX_AGE = 15 * 60 # Older snapshots restore settings and stats, not the track
 
 # Paths
 TRANSLATIONS_PATH = "translations/project.yaml"
 ASSETS_DIR = "assets"
 APP_ICON_PATH = "assets/last_fm.png"
+CACHE_DIR = "cache"
+METADATA_CACHE_PATH = f"{CACHE_DIR}/metadata.db"
+SNAPSHOT_PATH = f"{CACHE_DIR}/state.json"
+DIAGNOSTICS_DIR = "diagnostics"
+TRACING_PATH = f"{DIAGNOSTICS_DIR}/traces.jsonl"
 
 # Remote Assets
 DEFAULT_AVATAR_ID = "818148bf682d429dc215c1705eb27b98"
@@ -38,5 +100,5 @@ LASTFM_TRACK_URL_TEMPLATE = f"{LASTFM_USER_URL}/library/music/{{artist}}/_/{{tit
 YT_MUSIC_SEARCH_TEMPLATE = "https://music.youtube.com/search?q={query}"
 SPOTIFY_SEARCH_TEMPLATE = "https://open.spotify.com/search/{query}"
 
-# Load translations
-TRANSLATIONS = load_translations(APP_LANG, TRANSLATIONS_PATH)
\ No newline at end of file
+# Load translations (only the active language, from the cache when it is current)
+TRANSLATIONS = load_translations(APP_LANG, TRANSLATIONS_PATH, CACHE_DIR)
\ No newline at end of file
@@ -1,29 +1,49 @@
 import asyncio
+import datetime
 import logging
 import threading
 import webbrowser
 import sys
 import os
-from tkinter import messagebox
-
-from pystray import Icon, Menu, MenuItem
-from PIL import Image
 
 from constants.project import (
     USERNAME, APP_NAME, 
     APP_ICON_PATH, 
     TRACK_CHECK_INTERVAL, UPDATE_INTERVAL,
-    LASTFM_USER_URL
+    LASTFM_USER_URL, METRICS_PORT,
+    RECORDING_ENABLED, DIAGNOSTICS_DIR,
+    SINKS_CONFIG, SINKS_DISCORD, HTTP_BACKEND, PREFETCH_ENABLED,
+    MPRIS_ENABLED, MPRIS_PLAYERS, MPRIS_RECONCILE_INTERVAL,
+    SNAPSHOT_PATH, SNAPSHOT_INTERVAL, SNAPSHOT_TRACK_MAX_AGE
 )
 from utils.string_utils import messenger
-from api.lastfm.user.tracking import User
+from utils.metrics import metrics, start_metrics_server
+from utils.tracing import tracer
+from utils.profiling import profiler
+from utils.clock import clock
+from utils.recording import recorder
+from utils.startup import startup
+from utils.snapshot import read_snapshot, write_snapshot
+from utils.parsing import parsing_pool
+from utils.cache_manager import cache_manager
 from api.discord.rpc import DiscordRPC
+from core.sinks import create_sinks
 
 logger = logging.getLogger('app')
 
 class App:
+    snapshot_path = SNAPSHOT_PATH # None disables the warm-start snapshot
+
     def __init__(self):
+        self.username = USERNAME
         self.rpc = DiscordRPC()
+        self.rpc.discord_enabled = SINKS_DISCORD
+        self.rpc.sinks = self.create_sinks()
+        if RECORDING_ENABLED:
+            self.start_recording()
+        self.cached_track_data = None # Store (current_track, data) for forced updates
+        cache_manager.register_slots('presence', self, ('cached_track_data',))
+        self.restore_snapshot()
         self.current_track_name = messenger('no_track')
         self._rpc_connected = False
         self.debug_enabled = logging.getLogger().getEffectiveLevel() == logging.DEBUG
@@ -32,29 +52,163 @@ class App:
         self.rpc_thread = threading.Thread(target=self.run_rpc, args=(self.loop,))
         self.rpc_thread.daemon = True
         self.update_event = threading.Event()
-        self.cached_track_data = None # Store (current_track, data) for forced updates
+        self.stop_event = threading.Event()
+        self.local_source = None # MPRIS players, started by run_rpc
+        self.http_client = None # HTTP/2 client, started by run_rpc when selected
+        self.prefetcher = None # Album prefetcher, started by run_rpc when enabled
+        self.metrics_server = start_metrics_server(METRICS_PORT) if METRICS_PORT else None
 
     def exit_app(self, icon, item):
         """Stops the system tray icon and exits the application."""
         logger.info("Exiting application.")
+        self.stop()
         icon.stop()
         sys.exit()
 
+    def stop(self):
+        """Stops the RPC worker loop and flushes diagnostics."""
+        self.stop_event.set()
+        self.update_event.set()
+        profiler.stop() # the worker's next checkpoint may never come
+        if self.local_source:
+            self.local_source.stop()
+        if self.http_client:
+            self.http_client.close()
+        self.save_snapshot()
+        self.rpc.close_sinks()
+        parsing_pool.shutdown()
+        tracer.close()
+        recorder.stop()
+
+    def restore_snapshot(self):
+        """
+        Restores the state saved by the previous run.
+
+        Display options always apply. Stats apply to the same user only, and
+        the last track only if the snapshot is recent; run_rpc renders it
+        before the first poll.
+        """
+        if not self.snapshot_path:
+            return
+        snapshot = read_snapshot(self.snapshot_path)
+        if not snapshot:
+            return
+        # A truncated or hand-edited snapshot must not keep the app from starting
+        try:
+            same_user = snapshot.get('username') == self.username
+            age = clock.time() - float(snapshot.get('saved_at', 0))
+            state = snapshot.get('rpc') or {}
+            if not isinstance(state, dict):
+                raise TypeError("'rpc' is not an object")
+            track = snapshot.get('track')
+            cached_track_data = None
+            if same_user and track and age < SNAPSHOT_TRACK_MAX_AGE:
+                info = tuple(track['info'])
+                if len(info) != 5:
+                    raise ValueError(f"track info has {len(info)} fields instead of 5")
+                cached_track_data = (str(track['name']), info)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Ignoring malformed state snapshot {self.snapshot_path}: {e}")
+            return
+        self.rpc.restore_state(state, with_stats=same_user)
+        if cached_track_data:
+            self.cached_track_data = cached_track_data
+        logger.info(f"Restored state snapshot from {age / 60:.0f} minutes ago.")
+
+    def save_snapshot(self):
+        """Saves the last known track, stats and display options for a warm start."""
+        if not self.snapshot_path:
+            return
+        track = None
+        if self.cached_track_data:
+            current_track, (title, artist, album, artwork, time_remaining) = self.cached_track_data
+            track = {
+                'name': str(current_track),
+                'info': [str(title), str(artist), str(album) if album is not None else None, artwork, time_remaining]
+            }
+        write_snapshot(self.snapshot_path, {'username': self.username, 'track': track, 'rpc': self.rpc.export_state()})
+
+    def _render_warm_start(self):
+        """Publishes the restored track at once. The first poll then revalidates it."""
+        try:
+            with tracer.trace('warm_start'):
+                self._handle_active_track(*self.cached_track_data)
+        except Exception as e:
+            logger.warning(f"Could not render the restored state: {e}")
+        # Make the first poll fetch fresh stats and publish again
+        self.rpc.last_track = None
+        self.rpc.last_fetched_track = None
+
+    def start_recording(self):
+        """Records every Last.fm and Discord interaction of this session for replay."""
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        recorder.start(f"{DIAGNOSTICS_DIR}/session-{stamp}.jsonl.gz", username=self.username)
+        presence_factory = self.rpc.presence_factory
+        self.rpc.presence_factory = lambda: recorder.wrap_presence(presence_factory())
+
+    def create_sinks(self):
+        """Creates the additional presence outputs configured in the SINKS section."""
+        return create_sinks(SINKS_CONFIG, self.username)
+
+    def create_local_source(self):
+        """Starts following local MPRIS players when enabled and available."""
+        if not MPRIS_ENABLED:
+            return None
+        from api.mpris.source import MprisSource, mpris_available
+        if not mpris_available():
+            logger.warning("MPRIS needs Linux, a D-Bus session bus and the jeepney package. Using Last.fm polling only.")
+            return None
+        source = MprisSource(on_change=self.update_event.set, players=MPRIS_PLAYERS)
+        return source if source.start() else None
+
+    def create_http_client(self):
+        """Routes page fetches and web-service calls through one HTTP/2 connection pool when selected."""
+        if HTTP_BACKEND == 'requests':
+            return None
+        if HTTP_BACKEND != 'http2':
+            logger.warning(f"Unknown HTTP client backend {HTTP_BACKEND!r}, using requests")
+            return None
+        from api.lastfm.user.tracking import get_network
+        from utils.async_http import AsyncHTTPClient
+        from utils.request_utils import set_http_get
+        client = AsyncHTTPClient()
+        set_http_get(client.get)
+        client.mount(get_network())
+        return client
+
+    def create_prefetcher(self):
+        """Creates the prefetcher that warms the caches for the next tracks of an album, when enabled."""
+        if not PREFETCH_ENABLED:
+            return None
+        from api.lastfm.prefetch import Prefetcher
+        return Prefetcher(self.username, self.rpc.enricher)
+
+    def create_user(self):
+        """Creates the Last.fm tracker used by the RPC worker."""
+        # pylast is imported here, on the worker thread, after the tray is up
+        from api.lastfm.user.tracking import User
+        return User(self.username)
+
     def toggle_debug(self, icon, item):
         """Toggles between DEBUG and INFO logging levels."""
         self.debug_enabled = not self.debug_enabled
         new_level = logging.DEBUG if self.debug_enabled else logging.INFO
+        # Only the root level changes; handlers keep their own levels,
+        # which the queue listener respects
         logging.getLogger().setLevel(new_level)
-        
-        # Also update for existing handlers if necessary (though usually inherited)
-        for handler in logging.getLogger().handlers:
-            handler.setLevel(new_level)
             
         logger.info(f"Logging level set to: {'DEBUG' if self.debug_enabled else 'INFO'}")
 
+    def toggle_profiling(self, icon, item):
+        """Starts or stops profiling of the RPC worker thread."""
+        enabled = profiler.toggle()
+        logger.info(f"Profiling {'requested' if enabled else 'stop requested'}.")
+        # Wake the worker so the change applies without waiting for the next poll
+        self.update_event.set()
+
     def open_profile(self, icon, item):
         """Opens the user's Last.fm profile in the default browser."""
-        url = LASTFM_USER_URL.format(username=USERNAME)
+        url = LASTFM_USER_URL.format(username=self.username)
         webbrowser.open(url)
         logger.info(f"Opened Last.fm profile: {url}")
 
@@ -70,9 +224,12 @@ class App:
 
     def load_icon(self, directory):
         """Loads the application icon from the assets directory."""
+        from PIL import Image
+
         try:
             return Image.open(os.path.join(directory, APP_ICON_PATH))
         except FileNotFoundError:
+            from tkinter import messagebox
             messagebox.showerror(messenger('err'), messenger('err_assets'))
             sys.exit(1)
 
@@ -149,10 +306,29 @@ class App:
             return messenger('stats_loading')
         return messenger('stats_idle')
 
+    def _get_dynamic_metrics_summary(self, item):
+        """Returns the mean stage latencies for the menu."""
+        stages = (('poll',), ('fetch_profile', 'fetch_library'), ('publish',))
+        values = [metrics.mean_ms(*group) for group in stages]
+        return messenger('metrics_summary', ['-' if value is None else value for value in values])
+
+    def _get_dynamic_cache_summary(self, item):
+        """Returns the cache memory use and hit rate for the menu."""
+        stats = cache_manager.stats()
+        hit_rate = '-' if stats['hit_rate'] is None else f"{stats['hit_rate']:.0%}"
+        return messenger('cache_summary', [stats['used_bytes'] // 1024, stats['budget_bytes'] // 1024, hit_rate])
+
+    def dump_cache_stats(self, icon=None, item=None):
+        """Writes the per-cache entries, sizes, hit rates and evictions to the diagnostics folder."""
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        return cache_manager.dump(f"{DIAGNOSTICS_DIR}/cache-{stamp}.json")
+
     def setup_tray_menu(self):
         """Creates and returns the tray menu with dynamic items."""
+        from pystray import Menu, MenuItem
+
         return Menu(
-            MenuItem(messenger('user', USERNAME), self.open_profile),
+            MenuItem(messenger('user', self.username), self.open_profile),
             MenuItem(lambda item: self.current_track_name, None, enabled=False),
             # Display stats item
             MenuItem(
@@ -161,6 +337,8 @@ class App:
                 enabled=False
             ),
             MenuItem(self._get_dynamic_discord_status, None, enabled=False),
+            MenuItem(self._get_dynamic_metrics_summary, None, enabled=False),
+            MenuItem(self._get_dynamic_cache_summary, None, enabled=False),
             Menu.SEPARATOR,
             
             # Small Image Options
@@ -185,11 +363,15 @@ class App:
             
             Menu.SEPARATOR,
             MenuItem(messenger('debug_mode'), self.toggle_debug, checked=lambda item: self.debug_enabled),
+            MenuItem(messenger('profiling_mode'), self.toggle_profiling, checked=lambda item: profiler.requested),
+            MenuItem(messenger('dump_cache_stats'), self.dump_cache_stats),
             MenuItem(messenger('exit'), self.exit_app)
         )
 
     def setup_tray_icon(self):
         """Sets up the initial system tray icon."""
+        from pystray import Icon
+
         directory = self.get_directory()
         icon_img = self.load_icon(directory)
         
@@ -216,9 +398,10 @@ class App:
             self.current_track_name = new_track_display
             self._rpc_connected = self.rpc.is_connected
             logger.info(f"Status: {self.current_track_name} | Discord: {self._rpc_connected}")
-            self.icon_tray.title = f"{APP_NAME}\n{new_track_display}"
+            if self.icon_tray:
+                self.icon_tray.title = f"{APP_NAME}\n{new_track_display}"
         else:
-            logger.debug(f"Polling: {formatted_track}")
+            logger.debug("Polling: %s", formatted_track)
 
         # 2. HEAVY DATA UPDATE
         self.rpc.update_status(
@@ -227,12 +410,16 @@ class App:
             str(artist),
             str(album),
             time_remaining,
-            USERNAME,
+            self.username,
             artwork
         )
+        if self.prefetcher:
+            # A restored snapshot has the album as text only, which is not worth a lookup
+            album_title = album.get_title() if hasattr(album, 'get_title') else None
+            self.prefetcher.observe(str(title), str(artist), album_title, time_remaining)
         
         # 3. Refresh menu if changed
-        if has_track_changed or has_conn_changed:
+        if (has_track_changed or has_conn_changed) and self.icon_tray:
             self.icon_tray.menu = self.setup_tray_menu()
 
     def _handle_no_track(self):
@@ -241,48 +428,84 @@ class App:
             self.current_track_name = messenger('no_track')
             self._rpc_connected = self.rpc.is_connected
             logger.info(f"Tray Update: No track detected | Discord: {self._rpc_connected}")
-            self.icon_tray.title = f"{APP_NAME}\n{self.current_track_name}"
+            if self.icon_tray:
+                self.icon_tray.title = f"{APP_NAME}\n{self.current_track_name}"
         self.rpc.disable()
 
     def run_rpc(self, loop):
         """Runs the RPC updater in a loop."""
         logger.info(messenger('starting_rpc'))
         asyncio.set_event_loop(loop)
-        user = User(USERNAME)
+        if self.cached_track_data:
+            self._render_warm_start()
+        parsing_pool.start() # Workers spawn while pylast loads
+        self.http_client = self.create_http_client()
+        user = self.create_user()
+        self.prefetcher = self.create_prefetcher()
+        self.local_source = self.create_local_source()
+        next_snapshot = clock.monotonic() + SNAPSHOT_INTERVAL
 
-        while True:
-            # Check if this iteration was triggered by an event (settings change)
-            is_forced_update = self.update_event.is_set()
+        while not self.stop_event.is_set():
+            # Check if this iteration was triggered by an event (settings change or local player)
+            is_woken = self.update_event.is_set()
             self.update_event.clear()
+            local_changed = self.local_source.consume_change() if self.local_source else False
+            is_forced_update = is_woken and not local_changed
+            profiler.checkpoint()
             
             try:
-                # If forced update and we have cached data, reuse it without polling Last.fm
-                if is_forced_update and self.cached_track_data:
-                    current_track, data = self.cached_track_data
-                else:
-                    # Normal poll cycle
-                    current_track, data = user.now_playing()
-                    if data:
+                with tracer.trace('cycle', forced=is_forced_update, local=local_changed) as cycle:
+                    local = self.local_source.current() if self.local_source else None
+                    if local:
+                        # A local player is playing: no Last.fm poll, except a periodic reconciliation
+                        with tracer.span('poll', source='mpris'):
+                            current_track, data = user.now_playing_local(local)
                         self.cached_track_data = (current_track, data)
-                
-                if data:
-                    self._handle_active_track(current_track, data)
-                    if self.update_event.wait(TRACK_CHECK_INTERVAL):
-                        continue # If event set, restart loop immediately
-                else:
-                    self._handle_no_track()
-                    self.cached_track_data = None
-                    if self.update_event.wait(UPDATE_INTERVAL):
-                        continue
+                        if not is_woken:
+                            self._reconcile_local(user, local)
+                    # If forced update and we have cached data, reuse it without polling Last.fm
+                    elif is_forced_update and self.cached_track_data:
+                        current_track, data = self.cached_track_data
+                    else:
+                        # Normal poll cycle
+                        with tracer.span('poll'):
+                            current_track, data = user.now_playing()
+                        if data:
+                            self.cached_track_data = (current_track, data)
+                    
+                    if data:
+                        cycle.set('track', str(current_track))
+                        self._handle_active_track(current_track, data)
+                        interval = MPRIS_RECONCILE_INTERVAL if local else TRACK_CHECK_INTERVAL
+                    else:
+                        self._handle_no_track()
+                        self.cached_track_data = None
+                        interval = UPDATE_INTERVAL
             except Exception as e:
                 logger.error(f"Unexpected error in RPC loop: {e}", exc_info=True)
-                if self.update_event.wait(UPDATE_INTERVAL):
-                    continue
-            
-            # Additional small sleep if needed to prevent hot loop in case of errors, 
-            # but wait() handles the interval. 
-            # Logic: If wait returns True (event set), we continue. 
-            # If wait returns False (timeout), loop continues naturally.
+                interval = UPDATE_INTERVAL
+
+            if clock.monotonic() >= next_snapshot:
+                self.save_snapshot()
+                next_snapshot = clock.monotonic() + SNAPSHOT_INTERVAL
+
+            # Waiting happens outside the traced cycle. If the event is set
+            # (settings change), the loop restarts immediately.
+            clock.wait(self.update_event, interval)
+
+    def _reconcile_local(self, user, local):
+        """Checks the local player against Last.fm's now playing, e.g. to spot a player that is not scrobbling."""
+        with tracer.span('reconcile'):
+            remote = user.remote_track()
+        if remote is None:
+            result = 'lastfm_idle'
+        elif str(remote).lower() == local.key.lower():
+            result = 'match'
+        else:
+            result = 'mismatch'
+        metrics.inc('mpris_reconcile_total', ('result', result))
+        if result != 'match':
+            logger.info(f"Local player plays {local.key}, Last.fm reports {remote or 'nothing'}; keeping the local track.")
 
     def _on_setup(self, icon):
         """Callback to start backend tasks once the icon is running."""
@@ -292,6 +515,7 @@ class App:
             # Startup notification removed as per request
         except Exception as e:
             logger.warning(f"Failed to set icon visibility: {e}")
+        startup.mark('tray_icon')
 
         # Start the background thread
         logger.info("Starting RPC background thread...")
@@ -0,0 +1,36 @@
+import logging
+import signal
+
+from core.application import App
+
+logger = logging.getLogger('daemon')
+
+class HeadlessApp(App):
+    """
+    Runs the tracking pipeline without the system tray.
+
+    Nothing from pystray, PIL or tkinter is imported, so this suits servers,
+    containers and test harnesses. Presence goes to the sinks configured in
+    config.yaml (Discord IPC, stdout, file, socket). The worker loop runs on
+    the main thread until SIGINT or SIGTERM.
+    """
+
+    def setup_tray_icon(self):
+        return None
+
+    def _handle_signal(self, signum, frame):
+        logger.info(f"Received signal {signum}, stopping.")
+        self.stop_event.set()
+        self.update_event.set()
+
+    def run(self):
+        """Runs the RPC updater on the calling thread until stopped."""
+        logger.info("Starting in headless mode...")
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        try:
+            self.run_rpc(self.loop)
+        finally:
+            self.rpc.disable()
+            self.stop()
+            logger.info("Headless loop finished.")
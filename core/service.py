@@ -0,0 +1,256 @@
+import heapq
+import itertools
+import logging
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from constants.project import (
+    TRACK_CHECK_INTERVAL, HTTP_TIMEOUT, SERVICE_STATUS_INTERVAL,
+    SERVICE_ACCOUNTS, SERVICE_ACCOUNTS_FILE, SERVICE_WORKERS,
+    SERVICE_REQUESTS_PER_SECOND, SERVICE_IDLE_MAX_INTERVAL, SINKS_CONFIG, HTTP_BACKEND, PREFETCH_ENABLED
+)
+from api.discord.rpc import DiscordRPC
+from core.sinks import create_sinks
+from utils.cache_manager import cache_manager
+from utils.clock import clock
+from utils.http_pool import create_session, pool_network
+from utils.metrics import metrics
+from utils.parsing import parsing_pool
+from utils.rate_limit import TokenBucket
+from utils.request_utils import set_http_get
+from utils.tracing import tracer
+
+logger = logging.getLogger('service')
+
+# Requests per poll assumed until the first measurement (poll plus some enrichment)
+INITIAL_POLL_COST = 1.5
+
+class Account:
+    """
+    One tracked Last.fm user: its tracker, its presence renderer and its sinks.
+
+    Polls run on the service's worker pool, never two at a time for the same
+    account. Discord IPC is off; one machine has one Discord client, so
+    presence goes to the account's sinks only.
+    """
+
+    def __init__(self, username, sinks, prefetch_allow=None):
+        self.username = username
+        self.user = None # Created on the first poll, on a worker thread
+        self.prefetcher = None # Likewise, when prefetching is enabled
+        self.prefetch_allow = prefetch_allow
+        self.rpc = DiscordRPC()
+        self.rpc.discord_enabled = False
+        self.rpc.sinks = sinks
+        self.playing = False
+        self.idle_polls = 0
+
+    def poll(self):
+        """Polls Last.fm once and publishes the result. Returns whether a track is playing."""
+        from api.lastfm.user.tracking import User
+
+        if self.user is None:
+            self.user = User(self.username)
+            if PREFETCH_ENABLED:
+                from api.lastfm.prefetch import Prefetcher
+                self.prefetcher = Prefetcher(self.username, self.rpc.enricher, allow=self.prefetch_allow)
+        with tracer.trace('cycle', account=self.username):
+            with tracer.span('poll'):
+                current_track, data = self.user.now_playing()
+            if data:
+                title, artist, album, artwork, time_remaining = data
+                self.rpc.update_status(
+                    str(current_track), str(title), str(artist), str(album),
+                    time_remaining, self.username, artwork
+                )
+                if self.prefetcher:
+                    self.prefetcher.observe(str(title), str(artist), album.get_title() if album else None, time_remaining)
+                self.idle_polls = 0
+            else:
+                self.rpc.disable()
+                self.idle_polls += 1
+        self.playing = bool(data)
+        return self.playing
+
+    def base_interval(self, poll_interval, idle_max_interval):
+        """Seconds until the next poll before rate limiting: doubles while idle, up to idle_max_interval."""
+        if self.playing or not self.idle_polls:
+            return poll_interval
+        return min(idle_max_interval, poll_interval * 2 ** min(self.idle_polls, 16))
+
+class Service:
+    """
+    Tracks many accounts in one process.
+
+    Accounts share one pylast network with pooled connections, one requests
+    Session for page fetches, the metadata cache and a single token bucket
+    that every outgoing request draws from. A heap orders accounts by their
+    next poll time and hands them to a fixed worker pool.
+
+    Poll intervals are rate-aware: the measured requests per poll (the poll
+    itself plus the profile/library pages and getInfo calls of track changes)
+    sets the shortest interval at which all accounts fit in the budget, so a
+    large service slows every account down evenly instead of starving some.
+    """
+
+    def __init__(self, usernames, workers=SERVICE_WORKERS, requests_per_second=SERVICE_REQUESTS_PER_SECOND,
+                 poll_interval=TRACK_CHECK_INTERVAL, idle_max_interval=SERVICE_IDLE_MAX_INTERVAL,
+                 sinks_config=SINKS_CONFIG):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.idle_max_interval = idle_max_interval
+        self.bucket = TokenBucket(requests_per_second)
+        # Prefetching only uses tokens that polls and track changes leave over
+        self.accounts = [Account(username, create_sinks(sinks_config, username), self._spare_tokens)
+                         for username in usernames]
+        self.poll_cost = INITIAL_POLL_COST
+        self.polls = 0
+        self.stop_event = threading.Event()
+        self._wakeup = threading.Event()
+        self._slots = threading.Semaphore(workers)
+        self._lock = threading.Lock()
+        self._heap = []
+        self._sequence = itertools.count()
+        self._session = None
+        self._client = None # AsyncHTTPClient with the http2 backend
+        self._executor = None
+
+    @classmethod
+    def from_config(cls):
+        """Creates the service for the accounts listed in the SERVICE section."""
+        usernames = list(SERVICE_ACCOUNTS)
+        if SERVICE_ACCOUNTS_FILE:
+            with open(SERVICE_ACCOUNTS_FILE, encoding='utf-8') as file:
+                usernames += [line.strip() for line in file if line.strip() and not line.startswith('#')]
+        return cls(list(dict.fromkeys(usernames)))
+
+    def min_interval(self):
+        """Shortest poll interval at which every account fits in the request budget."""
+        return len(self.accounts) * self.poll_cost / self.bucket.rate
+
+    def _spare_tokens(self):
+        return self.bucket.has_tokens(self.bucket.capacity / 2)
+
+    def _throttled_get(self, url, timeout=HTTP_TIMEOUT):
+        self.bucket.acquire()
+        return self._session.get(url, timeout=timeout)
+
+    def install(self):
+        """Routes page fetches and web-service calls through the shared pools and the token bucket."""
+        from api.lastfm.user.tracking import get_network
+
+        parsing_pool.start()
+        if HTTP_BACKEND == 'http2':
+            from utils.async_http import AsyncHTTPClient
+            self._client = AsyncHTTPClient(self.workers, before_request=lambda request: self.bucket.acquire())
+            set_http_get(self._client.get)
+            self._client.mount(get_network())
+            return
+        self._session = create_session(self.workers)
+        set_http_get(self._throttled_get)
+        pool_network(get_network(), self.workers, before_request=lambda request: self.bucket.acquire())
+
+    def _schedule(self, account, due):
+        with self._lock:
+            heapq.heappush(self._heap, (due, next(self._sequence), account))
+        self._wakeup.set()
+
+    def _run_account(self, account, due):
+        metrics.observe_stage('scheduler_lag', max(0.0, clock.monotonic() - due))
+        try:
+            account.poll()
+        except Exception as e:
+            logger.error(f"Poll failed for {account.username}: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self.polls += 1
+            metrics.inc('service_polls_total')
+            interval = max(account.base_interval(self.poll_interval, self.idle_max_interval), self.min_interval())
+            self._schedule(account, clock.monotonic() + interval)
+            self._slots.release()
+
+    def _update_poll_cost(self, consumed, polls):
+        """Blends the requests per poll measured over the last window into the running estimate."""
+        if polls:
+            self.poll_cost = max(1.0, 0.5 * self.poll_cost + 0.5 * consumed / polls)
+
+    def _log_status(self):
+        playing = sum(account.playing for account in self.accounts)
+        lag = metrics.mean_ms('scheduler_lag')
+        logger.info(f"Service: {playing}/{len(self.accounts)} playing, {self.poll_cost:.2f} requests per poll, "
+                    f"poll interval >= {self.min_interval():.1f}s, mean scheduling lag {lag if lag is not None else '-'} ms")
+        cache = cache_manager.stats()
+        hit_rate = '-' if cache['hit_rate'] is None else f"{cache['hit_rate']:.0%}"
+        logger.info(f"Cache: {cache['used_bytes'] // 1024}/{cache['budget_bytes'] // 1024} KB, "
+                    f"hit rate {hit_rate}, {cache['evictions']} evictions")
+
+    def run(self):
+        """Runs the scheduler on the calling thread until stop() is called."""
+        if not self.accounts:
+            logger.error("No accounts configured. Add usernames to SERVICE.ACCOUNTS or SERVICE.ACCOUNTS_FILE in config.yaml.")
+            return
+        self.install()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='account')
+        logger.info(f"Service started for {len(self.accounts)} accounts with {self.workers} workers "
+                    f"and {self.bucket.rate:g} requests per second.")
+
+        # Spread the first polls over one interval so startup does not burst
+        now = clock.monotonic()
+        spacing = max(self.poll_interval, self.min_interval()) / len(self.accounts)
+        for index, account in enumerate(self.accounts):
+            self._schedule(account, now + index * spacing)
+
+        next_status = now + SERVICE_STATUS_INTERVAL
+        window = (self.bucket.consumed, self.polls)
+        while not self.stop_event.is_set():
+            self._wakeup.clear()
+            now = clock.monotonic()
+            if now >= next_status:
+                with self._lock:
+                    current = (self.bucket.consumed, self.polls)
+                self._update_poll_cost(current[0] - window[0], current[1] - window[1])
+                window = current
+                self._log_status()
+                next_status = now + SERVICE_STATUS_INTERVAL
+
+            with self._lock:
+                due = self._heap[0][0] if self._heap else None
+            if due is None or due > now:
+                timeout = SERVICE_STATUS_INTERVAL if due is None else min(due - now, next_status - now)
+                clock.wait(self._wakeup, max(0.0, timeout))
+                continue
+
+            # Wait for a free worker, then hand over the most overdue account
+            if not self._slots.acquire(timeout=1):
+                continue
+            with self._lock:
+                due, _, account = heapq.heappop(self._heap)
+            self._executor.submit(self._run_account, account, due)
+
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        for account in self.accounts:
+            account.rpc.disable()
+            account.rpc.close_sinks()
+        set_http_get(None)
+        if self._client:
+            self._client.close()
+        parsing_pool.shutdown()
+        logger.info("Service stopped.")
+
+    def stop(self):
+        self.stop_event.set()
+        self._wakeup.set()
+
+def run_service():
+    """Entry point for main.py --service: runs until SIGINT or SIGTERM."""
+    service = Service.from_config()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, stopping.")
+        service.stop()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    service.run()
+    tracer.close()
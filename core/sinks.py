@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+
+logger = logging.getLogger('sinks')
+
+# Seconds a socket client may block a publish before it is dropped
+SOCKET_SEND_TIMEOUT = 0.5
+
+def encode_event(event):
+    return json.dumps(event, ensure_ascii=False, default=str) + '\n'
+
+class Sink:
+    """
+    Receives the presence events published by DiscordRPC.
+
+    Events are dicts with an 'event' key: 'presence' carries the track, the
+    stats and the rendered Discord activity; 'clear' means nothing is playing.
+    """
+
+    name = 'sink'
+
+    def publish(self, event):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class StdoutSink(Sink):
+    """Writes every event as a JSON line to stdout."""
+
+    name = 'stdout'
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def publish(self, event):
+        self.stream.write(encode_event(event))
+        self.stream.flush()
+
+class FileSink(Sink):
+    """
+    Writes events to a file.
+
+    In 'append' mode every event is appended as a JSON line. In 'latest'
+    mode the file is atomically replaced and only holds the current event,
+    which suits overlays that poll a file.
+    """
+
+    name = 'file'
+
+    def __init__(self, path, mode='append'):
+        if mode not in ('append', 'latest'):
+            raise ValueError(f"Unknown file sink mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._file = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def publish(self, event):
+        line = encode_event(event)
+        with self._lock:
+            if self.mode == 'latest':
+                temp_path = f'{self.path}.tmp'
+                with open(temp_path, 'w', encoding='utf-8') as file:
+                    file.write(line)
+                os.replace(temp_path, self.path)
+                return
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class SocketSink(Sink):
+    """
+    Streams events as JSON lines to local socket clients.
+
+    The address is 'unix:/path/to/socket' or 'host:port' (TCP, localhost by
+    default). A client receives the latest event as soon as it connects.
+    Clients that stop reading are dropped rather than slowing the worker.
+    """
+
+    name = 'socket'
+
+    def __init__(self, address):
+        self.address = str(address)
+        self._lock = threading.Lock()
+        self._clients = []
+        self._latest = None
+        self._closed = False
+        self._server = self._listen(self.address)
+        threading.Thread(target=self._accept_loop, name='socket-sink', daemon=True).start()
+        logger.info(f"Socket sink listening on {self.address}")
+
+    @staticmethod
+    def _listen(address):
+        if address.startswith('unix:'):
+            path = address[len('unix:'):]
+            if os.path.exists(path):
+                os.unlink(path)
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(path)
+        else:
+            host, _, port = address.rpartition(':')
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((host or '127.0.0.1', int(port)))
+        server.listen()
+        return server
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            client.settimeout(SOCKET_SEND_TIMEOUT)
+            with self._lock:
+                if self._latest is not None and not self._send(client, self._latest):
+                    continue
+                self._clients.append(client)
+
+    @staticmethod
+    def _send(client, data):
+        try:
+            client.sendall(data)
+            return True
+        except OSError:
+            client.close()
+            return False
+
+    def publish(self, event):
+        data = encode_event(event).encode('utf-8')
+        with self._lock:
+            self._latest = data
+            self._clients = [client for client in self._clients if self._send(client, data)]
+
+    def close(self):
+        self._closed = True
+        self._server.close()
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients = []
+        if self.address.startswith('unix:'):
+            try:
+                os.unlink(self.address[len('unix:'):])
+            except OSError:
+                pass
+
+def _status_server(address, allowed_origins):
+    from core.status_server import StatusServer
+    return StatusServer(address, allowed_origins)
+
+def create_sinks(config, username=None):
+    """
+    Builds the sinks enabled in the SINKS section of config.yaml.
+
+    Paths and addresses may contain {username}, so several accounts can
+    share one configuration. The Discord IPC connection is not a Sink; it is
+    toggled by SINKS.DISCORD on DiscordRPC itself.
+
+    Returns:
+        list: The enabled Sink instances. A sink that fails to start is logged and skipped.
+    """
+    def expand(value):
+        return str(value).format(username=username or '')
+
+    sinks = []
+    factories = (
+        ('STDOUT', lambda options: StdoutSink()),
+        ('FILE', lambda options: FileSink(expand(options['PATH']), options.get('MODE', 'append'))),
+        ('SOCKET', lambda options: SocketSink(expand(options['ADDRESS']))),
+        ('HTTP', lambda options: _status_server(expand(options.get('ADDRESS', '127.0.0.1:8766')),
+                                                options.get('ALLOWED_ORIGINS') or [])),
+    )
+    for key, factory in factories:
+        options = config.get(key)
+        if not options:
+            continue
+        try:
+            sinks.append(factory(options if isinstance(options, dict) else {}))
+        except (KeyError, ValueError, OSError) as e:
+            logger.error(f"Could not start the {key.lower()} sink: {e}")
+    return sinks
@@ -0,0 +1,322 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import struct
+import threading
+from urllib.parse import urlsplit
+
+from core.sinks import Sink, encode_event
+from utils.clock import clock
+from utils.metrics import metrics
+
+logger = logging.getLogger('status')
+
+# Seconds a client may take to accept a write before it is disconnected
+CLIENT_SEND_TIMEOUT = 5.0
+# Seconds between keep-alive messages on idle streams
+HEARTBEAT_INTERVAL = 15.0
+# Bytes buffered for a streaming client before its writes wait
+STREAM_BUFFER_LIMIT = 16 * 1024
+# Largest request head accepted, in bytes
+MAX_REQUEST_HEAD = 8192
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# Host names that always mean this machine
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+def _hostname(value, is_origin=False):
+    """The lowercased host of an Origin or Host header value, without port or brackets; None if unparsable."""
+    try:
+        return urlsplit(value if is_origin else f'//{value}').hostname
+    except ValueError:
+        return None
+
+def _websocket_frame(payload, opcode=0x1):
+    """Builds an unmasked server frame (text by default)."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+class _Subscriber:
+    """
+    One streaming client.
+
+    Holds at most one pending message: a newer state replaces an unsent one,
+    so a slow client skips intermediate states instead of queueing them.
+    """
+
+    def __init__(self, writer, kind):
+        self.writer = writer
+        self.kind = kind # 'sse' or 'websocket'
+        self.pending = None
+        self.ready = asyncio.Event()
+
+    def offer(self, frame):
+        if self.pending is not None:
+            metrics.inc('status_coalesced_total', ('stream', self.kind))
+        self.pending = frame
+        self.ready.set()
+
+class StatusServer(Sink):
+    """
+    Serves the current presence to local overlays and widgets.
+
+    Runs an asyncio server on its own thread with three endpoints:
+
+    - GET /status: the latest state as JSON, served from memory.
+    - GET /events: a Server-Sent Events stream.
+    - GET /ws: a WebSocket stream of text messages.
+
+    Only local pages may read the state: a request whose Host header is
+    not a local name or the bind address, or whose Origin is neither a
+    local page nor listed in allowed_origins, is refused. Without this,
+    any website open in the user's browser could read what they listen to
+    (directly, or through DNS rebinding). Requests without an Origin, such
+    as those of scripts and overlay tools, are served.
+
+    Streams get the current state on connect and then one message per
+    change. publish() only encodes the state once and hands it to the loop,
+    so the RPC worker never waits for clients. Each subscriber keeps only
+    the newest unsent message, and clients that stop reading are dropped.
+    """
+
+    name = 'http'
+
+    def __init__(self, address='127.0.0.1:8766', allowed_origins=()):
+        """
+        Args:
+            address (str): host:port to listen on; port 0 picks a free port.
+            allowed_origins (list): Origins besides local pages that may read the state, e.g. 'https://overlay.example'.
+        """
+        host, _, port = str(address).rpartition(':')
+        self.host = host or '127.0.0.1'
+        self.port = int(port)
+        self.allowed_origins = {origin.rstrip('/').lower() for origin in allowed_origins}
+        self._status = encode_event({'event': 'idle', 'time': round(clock.time(), 3)}).encode('utf-8')
+        self._version = 0
+        self._subscribers = set()
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._started = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='status-server', daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._error:
+            raise self._error
+        logger.info(f"Status server listening on http://{self.host}:{self.port}")
+
+    @property
+    def address(self):
+        return f'{self.host}:{self.port}'
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, limit=MAX_REQUEST_HEAD))
+            # Port 0 picks a free port
+            self.port = self._server.sockets[0].getsockname()[1]
+        except OSError as e:
+            self._error = e
+            self._started.set()
+            return
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    def publish(self, event):
+        data = encode_event(event).encode('utf-8')
+        self._loop.call_soon_threadsafe(self._broadcast, data)
+
+    def close(self):
+        if self._loop.is_closed() or self._server is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        try:
+            future.result(2)
+        except Exception as e:
+            logger.debug("Status server shutdown: %s", e)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(2)
+
+    async def _shutdown(self):
+        self._server.close()
+        for subscriber in list(self._subscribers):
+            subscriber.writer.close()
+        self._subscribers.clear()
+        # Connections still being handled would be destroyed pending when the loop closes
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _broadcast(self, data):
+        """Runs on the loop: stores the new state and offers it to every subscriber."""
+        self._status = data
+        self._version += 1
+        # Each stream format is built once and shared by all its subscribers
+        frames = {}
+        for subscriber in self._subscribers:
+            frame = frames.get(subscriber.kind)
+            if frame is None:
+                frame = frames[subscriber.kind] = self._frame(subscriber.kind, data)
+            subscriber.offer(frame)
+
+    def _frame(self, kind, data):
+        if kind == 'sse':
+            return b'id: %d\ndata: %s\n\n' % (self._version, data.rstrip(b'\n'))
+        return _websocket_frame(data.rstrip(b'\n'))
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), CLIENT_SEND_TIMEOUT)
+            request_line, *header_lines = head.decode('latin-1').split('\r\n')
+            method, path, _ = request_line.split(' ', 2)
+            headers = {}
+            for line in header_lines:
+                key, _, value = line.partition(':')
+                if key:
+                    headers[key.strip().lower()] = value.strip()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError, ConnectionError):
+            writer.close()
+            return
+
+        path = path.split('?', 1)[0]
+        origin = headers.get('origin')
+        # Browsers only let a page read the response of an origin that is named back to it
+        cors = [f'Access-Control-Allow-Origin: {origin}', 'Vary: Origin'] if origin else []
+        try:
+            if not self._allowed(headers):
+                metrics.inc('status_rejected_total')
+                logger.debug("Refused a request from origin %s for host %s", origin, headers.get('host'))
+                await self._respond(writer, 403, b'{"error": "forbidden"}\n')
+            elif method != 'GET':
+                await self._respond(writer, 405, b'{"error": "method not allowed"}\n')
+            elif path == '/status':
+                await self._respond_status(writer, headers, cors)
+            elif path == '/events':
+                await self._stream(reader, writer, 'sse', headers, cors)
+            elif path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                await self._stream(reader, writer, 'websocket', headers, cors)
+            else:
+                await self._respond(writer, 404, b'{"error": "not found"}\n')
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    def _allowed(self, headers):
+        """Whether the request addresses this server by a local name and comes from a local or allowed page."""
+        host = headers.get('host')
+        if host is not None and _hostname(host) not in (*LOCAL_HOSTS, self.host.strip('[]').lower()):
+            return False
+        origin = headers.get('origin')
+        if origin is None:
+            return True
+        return _hostname(origin, is_origin=True) in LOCAL_HOSTS or origin.rstrip('/').lower() in self.allowed_origins
+
+    async def _respond(self, writer, status, body, extra_headers=()):
+        reason = {200: 'OK', 304: 'Not Modified', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed'}[status]
+        lines = [
+            f'HTTP/1.1 {status} {reason}',
+            'Content-Type: application/json; charset=utf-8',
+            f'Content-Length: {len(body)}',
+            'Cache-Control: no-cache',
+            'Connection: close',
+            *extra_headers,
+        ]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await asyncio.wait_for(writer.drain(), CLIENT_SEND_TIMEOUT)
+
+    async def _respond_status(self, writer, headers, cors):
+        metrics.inc('status_requests_total')
+        etag = f'"{self._version}"'
+        if headers.get('if-none-match') == etag:
+            await self._respond(writer, 304, b'', [f'ETag: {etag}', *cors])
+        else:
+            await self._respond(writer, 200, self._status, [f'ETag: {etag}', *cors])
+
+    async def _stream(self, reader, writer, kind, headers, cors):
+        if kind == 'sse':
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/event-stream\r\n'
+                         b'Cache-Control: no-cache\r\n' +
+                         ''.join(f'{line}\r\n' for line in cors).encode('latin-1') +
+                         b'Connection: keep-alive\r\n\r\n')
+            heartbeat = b': keep-alive\n\n'
+        else:
+            key = headers.get('sec-websocket-key', '').encode('latin-1')
+            accept = base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID).digest())
+            writer.write(b'HTTP/1.1 101 Switching Protocols\r\n'
+                         b'Upgrade: websocket\r\n'
+                         b'Connection: Upgrade\r\n'
+                         b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+            heartbeat = _websocket_frame(b'', opcode=0x9) # ping
+
+        # Keep little per-client buffering, so a slow client is noticed by drain() early
+        writer.transport.set_write_buffer_limits(high=STREAM_BUFFER_LIMIT)
+        subscriber = _Subscriber(writer, kind)
+        subscriber.offer(self._frame(kind, self._status))
+        self._subscribers.add(subscriber)
+        metrics.inc('status_subscribers_total', ('stream', kind))
+        logger.debug("%s subscriber connected, %s total", kind, len(self._subscribers))
+        # The client's side is only read to notice disconnects and answer WebSocket control frames
+        watcher = asyncio.ensure_future(self._watch_client(reader, subscriber))
+        try:
+            while not watcher.done():
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    frame = heartbeat
+                else:
+                    subscriber.ready.clear()
+                    frame, subscriber.pending = subscriber.pending, None
+                if frame is None:
+                    continue
+                writer.write(frame)
+                try:
+                    await asyncio.wait_for(writer.drain(), CLIENT_SEND_TIMEOUT)
+                except asyncio.TimeoutError:
+                    metrics.inc('status_dropped_total', ('stream', kind))
+                    logger.debug("Dropping a %s subscriber that stopped reading", kind)
+                    return
+        finally:
+            self._subscribers.discard(subscriber)
+            watcher.cancel()
+
+    async def _watch_client(self, reader, subscriber):
+        """Reads until the client goes away. Answers WebSocket pings and closes."""
+        try:
+            if subscriber.kind == 'sse':
+                while await reader.read(1024):
+                    pass
+                return
+            while True:
+                first, second = await reader.readexactly(2)
+                opcode = first & 0x0F
+                length = second & 0x7F
+                if length == 126:
+                    length = struct.unpack('!H', await reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack('!Q', await reader.readexactly(8))[0]
+                if length > MAX_REQUEST_HEAD:
+                    return
+                mask = await reader.readexactly(4) if second & 0x80 else b'\0\0\0\0'
+                payload = bytes(byte ^ mask[index % 4] for index, byte in enumerate(await reader.readexactly(length)))
+                if opcode == 0x8: # close
+                    subscriber.writer.write(_websocket_frame(payload[:2], opcode=0x8))
+                    return
+                if opcode == 0x9: # ping
+                    subscriber.writer.write(_websocket_frame(payload, opcode=0xA))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            subscriber.ready.set() # Wake the writer so it notices the client is gone
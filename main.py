@@ -1,13 +1,39 @@
+import argparse
 import logging
-from core.application import App
+import sys
+from utils.startup import startup # First, so startup times include every import
 from utils.logging_config import setup_logging
-
-# Configure enhanced logging
-setup_logging(level=logging.INFO)
+from constants.project import LOGGING_FORMAT, LOGGING_FILE, LOGGING_FILE_FORMAT, LOGGING_MAX_BYTES, LOGGING_BACKUPS
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Last.fm Discord Rich Presence")
+    parser.add_argument('--headless', action='store_true',
+                        help="Run without the tray icon, publishing to the sinks configured in config.yaml")
+    parser.add_argument('--service', action='store_true',
+                        help="Track every account in the SERVICE section of config.yaml, publishing to per-account sinks")
+    args = parser.parse_args()
+
+    # Configure enhanced logging. Headless logs go to stderr so the stdout sink stays parseable.
+    setup_logging(
+        level=logging.INFO,
+        stream=sys.stderr if args.headless or args.service else sys.stdout,
+        console_format=LOGGING_FORMAT,
+        file_path=LOGGING_FILE or None,
+        file_format=LOGGING_FILE_FORMAT,
+        max_bytes=LOGGING_MAX_BYTES,
+        backups=LOGGING_BACKUPS
+    )
+
     try:
+        if args.service:
+            from core.service import run_service
+            run_service()
+            sys.exit()
+        if args.headless:
+            from core.daemon import HeadlessApp as App
+        else:
+            from core.application import App
         app = App()
         app.run()
     except Exception as e:
-        logging.critical(f"Application failed to start: {e}", exc_info=True)
\ No newline at end of file
+        logging.critical(f"Application failed to start: {e}", exc_info=True)
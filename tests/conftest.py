@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules import each other from the repository root and read config.yaml relative to it
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
@@ -0,0 +1,73 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.async_http import AsyncHTTPClient
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def do_HEAD(self):
+        self.server.requests.append(('HEAD', self.path))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def url(server, path='/page'):
+    return f'http://127.0.0.1:{server.server_address[1]}{path}'
+
+def test_get_goes_through_before_request(server):
+    requested = []
+    client = AsyncHTTPClient(keepalive=0.2, before_request=requested.append)
+    try:
+        response = client.get(url(server))
+    finally:
+        client.close()
+    assert response.status_code == 200 and response.content == b'ok'
+    assert requested == [url(server)]
+
+def test_connections_are_not_kept_warm_by_default(server):
+    client = AsyncHTTPClient(keepalive=0.2)
+    try:
+        client.get(url(server))
+        time.sleep(0.4)
+    finally:
+        client.close()
+    assert client._warm_task is None
+    assert server.requests == [('GET', '/page')]
+
+def test_warming_requests_go_through_before_request(server):
+    requested = []
+    client = AsyncHTTPClient(keepalive=0.2, before_request=requested.append, keep_warm=True)
+    try:
+        client.get(url(server))
+        deadline = time.monotonic() + 2
+        while ('HEAD', '/') not in server.requests and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        client.close()
+    assert ('HEAD', '/') in server.requests
+    assert requested[0] == url(server)
+    assert url(server, '/') in requested[1:]
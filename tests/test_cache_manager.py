@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+
+from api.lastfm.metadata_cache import COVER, MetadataCache
+from utils.cache_manager import MIN_CACHE_SHARE, CacheManager, estimate_size
+
+class Owner:
+    def __init__(self, value):
+        self.value = value
+
+def test_estimate_size_follows_containers():
+    assert estimate_size({'a': 'x' * 1000}) > estimate_size({'a': 'x'}) + 900
+    assert estimate_size(Owner(['x' * 1000])) > 1000
+
+def test_hits_and_misses_are_counted():
+    cache = CacheManager(budget=10_000).cache('test')
+    cache.put('a', 1, size=10)
+    assert cache.get('a') == 1
+    assert cache.get('b', 'default') == 'default'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+
+def test_cheapest_entry_per_byte_is_evicted_first():
+    manager = CacheManager(budget=300)
+    cheap = manager.cache('cheap', cost=0.001)
+    costly = manager.cache('costly', cost=1.0)
+    costly.put('web', 'result', size=100)
+    cheap.put('row', 'result', size=100)
+    costly.put('other', 'result', size=100)
+    cheap.put('row2', 'result', size=100)
+    assert manager.bytes <= 300
+    assert 'web' in costly and 'other' in costly
+    assert cheap.evictions == 1
+
+def test_entries_that_are_not_used_age_out():
+    manager = CacheManager(budget=200)
+    cache = manager.cache('test')
+    cache.put('old', 1, size=100, cost=2.0)
+    # Each eviction raises the inflation value, so the costly but unused entry goes eventually
+    for index in range(50):
+        cache.put(index, index, size=100, cost=1.0)
+    assert 'old' not in cache
+
+def test_recently_used_entry_survives():
+    manager = CacheManager(budget=200)
+    cache = manager.cache('test')
+    cache.put('a', 1, size=100)
+    cache.put('b', 2, size=100)
+    cache.get('a')
+    cache.put('c', 3, size=100)
+    assert 'a' in cache and 'b' not in cache
+
+def test_slots_count_against_the_budget():
+    manager = CacheManager(budget=100_000)
+    owner = Owner('x' * 20_000)
+    manager.register_slots('current', owner, ['value'])
+    cache = manager.cache('test')
+    cache.put('a', 1, size=50_000)
+    cache.put('b', 2, size=50_000)
+    assert manager.slot_bytes > 20_000
+    assert len(cache) == 1
+    assert manager.stats()['caches']['current'] == {'entries': 1, 'bytes': manager.slot_bytes, 'pinned': True}
+
+def test_slots_over_budget_do_not_empty_the_caches():
+    manager = CacheManager(budget=10_000)
+    owner = Owner('x' * 50_000)
+    manager.register_slots('current', owner, ['value'])
+    cache = manager.cache('test')
+    for index in range(10):
+        cache.put(index, index, size=1_000)
+    assert manager.slot_bytes > manager.budget
+    assert manager.bytes == pytest.approx(manager.budget * MIN_CACHE_SHARE, abs=1_000)
+    assert len(cache) >= 2
+
+def test_slots_are_measured_without_the_lock():
+    manager = CacheManager()
+    held = []
+
+    class Probe:
+        @property
+        def value(self):
+            # Another thread can take the lock while the slots are measured
+            thread = threading.Thread(target=lambda: held.append(manager.lock.acquire(timeout=1) and manager.lock.release()))
+            thread.start()
+            thread.join()
+            return 'x' * 100
+
+    probe = Probe()
+    manager.register_slots('probe', probe, ['value'])
+    manager.cache('test').put('a', 1)
+    assert held == [None]
+
+def test_dead_owners_are_dropped():
+    manager = CacheManager()
+    owner = Owner('x' * 1000)
+    manager.register_slots('current', owner, ['value'])
+    del owner
+    assert manager._measure_slots() == {'current': {'entries': 0, 'bytes': 0, 'pinned': True}}
+
+def test_database_reads_are_counted_apart_from_misses(tmp_path):
+    cache = MetadataCache(str(tmp_path / 'metadata.db'))
+    cache.load()
+    cache.store(COVER, 'radiohead\x1fin rainbows', 'https://example.com/cover.png')
+    cache._memory.clear()
+    assert cache.lookup(COVER, 'radiohead\x1fin rainbows') == (True, 'https://example.com/cover.png')
+    assert cache.lookup(COVER, 'radiohead\x1fin rainbows') == (True, 'https://example.com/cover.png')
+    assert cache.lookup(COVER, 'radiohead\x1fkid a') == (False, None)
+    stats = cache._memory.stats()
+    assert (stats['hits'], stats['backing_hits'], stats['misses']) == (1, 1, 1)
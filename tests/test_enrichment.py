@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+import api.lastfm.enrichment as enrichment
+from api.lastfm.enrichment import Enricher, Stage
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    enrichment._cache.clear()
+    yield
+    enrichment._cache.clear()
+
+def per_track(context):
+    return (context['username'], context['track'])
+
+def make_enricher(*stages, budget=5.0):
+    enricher = Enricher(stages=[], budget=budget)
+    enricher.stages = list(stages)
+    return enricher
+
+def run(enricher, title='Reckoner'):
+    return enricher.run('benchuser', 'Radiohead', title, f'Radiohead - {title}')
+
+def test_fields_of_every_stage_are_merged():
+    enricher = make_enricher(
+        Stage('a', lambda context: {'a': 1}, ('a',), timeout=1.0, key=per_track),
+        Stage('b', lambda context: {'b': context['title']}, ('b',), timeout=1.0, key=per_track),
+    )
+    result = run(enricher)
+    assert result.fields == {'a': 1, 'b': 'Reckoner'}
+    assert result.complete
+
+def test_slow_stage_is_skipped_for_timeout_and_cached_when_done():
+    release = threading.Event()
+
+    def slow(context):
+        release.wait(2)
+        return {'slow': True}
+
+    enricher = make_enricher(Stage('slow', slow, ('slow',), timeout=0.05, key=per_track))
+    result = run(enricher)
+    assert result.skipped == {'slow': 'timeout'}
+    assert 'slow' not in result.fields
+
+    release.set()
+    deadline = time.monotonic() + 2
+    while enricher._inflight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert run(enricher).fields == {'slow': True}
+
+def test_budget_cuts_stages_whose_timeout_is_longer():
+    release = threading.Event()
+    enricher = make_enricher(
+        Stage('slow', lambda context: release.wait(2) and {}, ('slow',), timeout=1.0, key=per_track),
+        budget=0.05,
+    )
+    try:
+        assert run(enricher).skipped == {'slow': 'budget'}
+    finally:
+        release.set()
+
+def test_failing_stage_is_skipped_with_error():
+    def broken(context):
+        raise LookupError('no user data')
+
+    result = run(make_enricher(Stage('broken', broken, ('broken',), timeout=1.0, key=per_track)))
+    assert result.skipped == {'broken': 'error'}
+
+def test_stale_ok_stage_stands_in_with_its_last_result():
+    def profile(context):
+        if context['title'] != 'Reckoner':
+            raise LookupError('profile page unavailable')
+        return {'display_name': 'Bench User'}
+
+    enricher = make_enricher(Stage('profile', profile, ('display_name',), timeout=1.0, key=per_track, stale_ok=True))
+    assert run(enricher).complete
+    result = run(enricher, title='Nude')
+    assert result.fields == {'display_name': 'Bench User'}
+    assert result.stale == ['profile']
+    assert not result.complete
+
+def test_stage_in_flight_is_not_submitted_again():
+    calls = []
+    release = threading.Event()
+
+    def slow(context):
+        calls.append(context['track'])
+        release.wait(2)
+        return {'slow': True}
+
+    enricher = make_enricher(Stage('slow', slow, ('slow',), timeout=0.05, key=per_track))
+    run(enricher)
+    run(enricher)
+    release.set()
+    assert calls == ['Radiohead - Reckoner']
+
+def test_expired_results_are_fetched_again(monkeypatch):
+    calls = []
+    enricher = make_enricher(Stage('count', lambda context: calls.append(1) or {'count': len(calls)},
+                                   ('count',), timeout=1.0, key=per_track, ttl=60))
+    now = [1000.0]
+    monkeypatch.setattr(enrichment.clock, 'monotonic', lambda: now[0])
+    assert run(enricher).fields == {'count': 1}
+    now[0] += 30
+    assert run(enricher).fields == {'count': 1}
+    now[0] += 31
+    assert run(enricher).fields == {'count': 2}
+
+def test_stages_for_picks_the_providers_of_the_fields():
+    assert enrichment.stages_for({'artist_count', 'avatar_url'}) == ['profile', 'artist_count']
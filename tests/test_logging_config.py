@@ -0,0 +1,66 @@
+import io
+import json
+import logging
+import sys
+import threading
+
+import pytest
+
+from utils.logging_config import JsonFormatter, setup_logging, shutdown_logging
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    shutdown_logging()
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+def test_records_are_written_by_the_listener(root_logger, tmp_path):
+    stream = io.StringIO()
+    path = str(tmp_path / 'logs' / 'app.jsonl')
+    setup_logging(logging.DEBUG, stream=stream, console_format='json', file_path=path)
+    logging.getLogger('test').info("Now playing %s", 'Nude')
+    logging.getLogger('test').debug("Polling")
+    shutdown_logging()
+
+    console = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [entry['message'] for entry in console] == ['Now playing Nude', 'Polling']
+    assert console[0]['logger'] == 'test' and console[0]['level'] == 'INFO'
+    with open(path, encoding='utf-8') as file:
+        assert [json.loads(line)['message'] for line in file] == ['Now playing Nude', 'Polling']
+
+def test_lazy_arguments_are_formatted_on_the_listener_thread(root_logger):
+    stream = io.StringIO()
+    setup_logging(stream=stream, console_format='json')
+    threads = []
+
+    class Probe:
+        def __str__(self):
+            threads.append(threading.current_thread().name)
+            return 'probe'
+
+    logging.getLogger('test').info("Value: %s", Probe())
+    shutdown_logging()
+    assert json.loads(stream.getvalue())['message'] == 'Value: probe'
+    assert threads and threads[0] != 'MainThread'
+
+def test_setup_twice_does_not_log_twice(root_logger):
+    first, second = io.StringIO(), io.StringIO()
+    setup_logging(stream=first, console_format='json')
+    setup_logging(stream=second, console_format='json')
+    logging.getLogger('test').warning("Once")
+    shutdown_logging()
+    assert first.getvalue() == ''
+    assert len(second.getvalue().splitlines()) == 1
+
+def test_json_formatter_includes_exceptions():
+    try:
+        raise ValueError('bad page')
+    except ValueError:
+        record = logging.getLogger('test').makeRecord('test', logging.ERROR, __file__, 1, 'Failed', (),
+                                                      exc_info=sys.exc_info())
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == 'Failed'
+    assert 'ValueError: bad page' in entry['exception']
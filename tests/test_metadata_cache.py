@@ -0,0 +1,66 @@
+import pytest
+
+from api.lastfm.metadata_cache import COVER, DURATION, MetadataCache
+from utils.clock import SystemClock, clock
+
+class ManualClock(SystemClock):
+    def __init__(self):
+        self.value = 1_700_000_000.0
+
+    def time(self):
+        return self.value
+
+@pytest.fixture
+def manual_clock():
+    manual = ManualClock()
+    clock.install(manual)
+    yield manual
+    clock.reset()
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'cache' / 'metadata.db')
+
+def test_keys_ignore_case_and_spacing():
+    assert MetadataCache.make_key(' Radiohead', 'In Rainbows ') == MetadataCache.make_key('radiohead', 'in rainbows')
+    assert MetadataCache.make_key('a b', 'c') != MetadataCache.make_key('a', 'b c')
+
+def test_entries_persist_across_instances(path):
+    cache = MetadataCache(path)
+    cache.load()
+    cache.store_many(DURATION, {'radiohead\x1fnude': 255000, 'radiohead\x1freckoner': 290000})
+    cache.store(COVER, 'radiohead\x1fin rainbows', 'https://example.com/cover.png')
+
+    reopened = MetadataCache(path)
+    assert reopened.load() == 3
+    assert reopened.lookup(DURATION, 'radiohead\x1fnude') == (True, 255000)
+    assert reopened.lookup(COVER, 'radiohead\x1fin rainbows') == (True, 'https://example.com/cover.png')
+    assert reopened.lookup(COVER, 'radiohead\x1fkid a') == (False, None)
+
+def test_negative_entries_expire_sooner(path, manual_clock):
+    cache = MetadataCache(path, ttl=1000, negative_ttl=10)
+    cache.load()
+    cache.store(COVER, 'no art', None)
+    cache.store(COVER, 'art', 'https://example.com/cover.png')
+    assert cache.lookup(COVER, 'no art') == (True, None)
+    manual_clock.value += 11
+    assert cache.lookup(COVER, 'no art') == (False, None)
+    assert cache.lookup(COVER, 'art') == (True, 'https://example.com/cover.png')
+    manual_clock.value += 1000
+    assert cache.lookup(COVER, 'art') == (False, None)
+
+def test_expired_rows_are_pruned_on_load(path, manual_clock):
+    cache = MetadataCache(path, ttl=100, negative_ttl=10)
+    cache.load()
+    cache.store(DURATION, 'short', 0)
+    cache.store(DURATION, 'long', 1000)
+    manual_clock.value += 50
+    assert MetadataCache(path, ttl=100, negative_ttl=10).load() == 1
+
+def test_unavailable_database_keeps_memory_only(tmp_path):
+    blocker = tmp_path / 'file'
+    blocker.write_text('not a directory')
+    cache = MetadataCache(str(blocker / 'metadata.db'))
+    assert cache.load() == 0
+    cache.store(DURATION, 'radiohead\x1fnude', 255000)
+    assert cache.lookup(DURATION, 'radiohead\x1fnude') == (True, 255000)
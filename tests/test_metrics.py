@@ -0,0 +1,51 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from utils.metrics import MetricsRegistry, metrics, start_metrics_server
+
+def test_counters_are_kept_per_label():
+    registry = MetricsRegistry()
+    registry.inc('cache_hits_total', ('cache', 'artwork'))
+    registry.inc('cache_hits_total', ('cache', 'artwork'), amount=2)
+    registry.inc('cache_hits_total', ('cache', 'duration'))
+    assert registry.counter('cache_hits_total', ('cache', 'artwork')).value == 3
+    assert registry.counter('cache_hits_total', ('cache', 'duration')).value == 1
+
+def test_mean_over_stages():
+    registry = MetricsRegistry()
+    assert registry.mean_ms('fetch') is None
+    registry.observe_stage('fetch', 0.1)
+    registry.observe_stage('parse', 0.3)
+    assert registry.mean_ms('fetch', 'parse', 'unknown') == 200
+
+def test_prometheus_histogram_is_cumulative():
+    registry = MetricsRegistry()
+    registry.inc('polls_total')
+    for seconds in (0.003, 0.02, 20):
+        registry.observe_stage('fetch', seconds)
+    lines = registry.render_prometheus().splitlines()
+    assert '# TYPE lastfm_rpc_polls_total counter' in lines
+    assert 'lastfm_rpc_polls_total 1' in lines
+    assert lines.count('# TYPE lastfm_rpc_stage_seconds histogram') == 1
+    assert 'lastfm_rpc_stage_seconds_bucket{stage="fetch",le="0.001"} 0' in lines
+    assert 'lastfm_rpc_stage_seconds_bucket{stage="fetch",le="0.005"} 1' in lines
+    assert 'lastfm_rpc_stage_seconds_bucket{stage="fetch",le="10.0"} 2' in lines
+    assert 'lastfm_rpc_stage_seconds_bucket{stage="fetch",le="+Inf"} 3' in lines
+    assert 'lastfm_rpc_stage_seconds_count{stage="fetch"} 3' in lines
+
+def test_metrics_endpoint():
+    server = start_metrics_server(0)
+    assert server is not None
+    try:
+        metrics.inc('test_scrapes_total')
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+        with urllib.request.urlopen(f'{url}/metrics', timeout=5) as response:
+            assert 'lastfm_rpc_test_scrapes_total' in response.read().decode('utf-8')
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f'{url}/other', timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
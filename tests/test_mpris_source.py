@@ -0,0 +1,45 @@
+import pytest
+
+from api.mpris.source import LocalTrack, MprisSource, parse_metadata
+
+class DeadConnection:
+    """A bus connection that fails every call, as after the session bus went away."""
+
+    def send_and_get_reply(self, message, timeout=None):
+        raise ConnectionResetError('bus connection lost')
+
+    def close(self):
+        pass
+
+def test_parse_metadata_unwraps_variants():
+    track = parse_metadata({
+        'xesam:title': ('s', 'Reckoner'),
+        'xesam:artist': ('as', ['Radiohead']),
+        'xesam:album': ('s', 'In Rainbows'),
+        'mpris:length': ('x', 290_000_000),
+    }, 'spotify')
+    assert track.key == 'Radiohead - Reckoner'
+    assert track.album == 'In Rainbows'
+    assert track.length_ms == 290_000
+
+def test_parse_metadata_needs_title_and_artist():
+    assert parse_metadata({'xesam:title': ('s', 'Reckoner')}) is None
+
+def test_listener_failure_drops_the_local_track():
+    pytest.importorskip('jeepney')
+    changes = []
+    source = MprisSource(on_change=lambda: changes.append(True))
+    track = LocalTrack('Reckoner', 'Radiohead', player='spotify')
+    source._states[':1.42'] = {'name': 'org.mpris.MediaPlayer2.spotify', 'status': 'Playing', 'track': track}
+    source._refresh_current()
+    assert source.current() is track
+    source.consume_change()
+    changes.clear()
+
+    source._connection = DeadConnection()
+    source._run()
+
+    assert source.current() is None
+    assert source._states == {}
+    assert source.consume_change()
+    assert changes == [True]
@@ -0,0 +1,52 @@
+import multiprocessing
+import os
+
+import pytest
+
+from utils.parsing import ParsingPool
+
+def fail_in_worker(content):
+    if multiprocessing.parent_process() is not None:
+        raise RuntimeError('extractor failed')
+    return len(content)
+
+def crash_in_worker(content):
+    if multiprocessing.parent_process() is not None:
+        os._exit(1)
+    return len(content)
+
+@pytest.fixture
+def pool():
+    pool = ParsingPool(workers=1)
+    yield pool
+    pool.shutdown()
+
+def test_without_workers_extractors_run_in_thread():
+    pool = ParsingPool(workers=0)
+    assert pool.backend == 'thread'
+    assert pool.parse(len, b'page') == 4
+
+def test_extractor_runs_in_worker(pool):
+    assert pool.parse(len, b'page') == 4
+    assert pool.backend == 'process'
+
+def test_extractor_errors_propagate_without_parsing_again(pool):
+    with pytest.raises(RuntimeError, match='extractor failed'):
+        pool.parse(fail_in_worker, b'page')
+    assert pool.backend == 'process'
+    assert pool.parse(len, b'page') == 4
+
+def test_pool_shut_down_after_lookup_parses_in_thread(pool):
+    executor = pool._get_executor()
+    executor.shutdown()
+    assert pool.parse(len, b'page') == 4
+
+def test_parsing_after_shutdown_runs_in_thread(pool):
+    pool.parse(len, b'page')
+    pool.shutdown()
+    assert pool.backend == 'thread'
+    assert pool.parse(len, b'page') == 4
+
+def test_broken_pool_falls_back_to_thread(pool):
+    assert pool.parse(crash_in_worker, b'page') == 4
+    assert pool.backend == 'thread'
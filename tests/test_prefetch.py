@@ -0,0 +1,196 @@
+import pytest
+
+import api.lastfm.enrichment as enrichment
+import api.lastfm.prefetch as prefetch
+from api.lastfm.enrichment import Enricher, Stage, STAGES
+from api.lastfm.prefetch import Prefetcher, get_tracklist
+from utils.clock import SystemClock, clock
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    enrichment._cache.clear()
+    prefetch._albums.clear()
+    yield
+    enrichment._cache.clear()
+    prefetch._albums.clear()
+
+def per_track(context):
+    return (context['username'], context['track'])
+
+def make_enricher(*stages):
+    enricher = Enricher(stages=[])
+    enricher.stages = list(stages)
+    return enricher
+
+def wait_for_prefetch():
+    # The prefetch thread runs one job at a time: this returns once the queued ones are done
+    prefetch._get_executor().submit(lambda: None).result()
+
+class Library:
+    """Stand-in counts, as Last.fm reports them at the time of the request."""
+
+    def __init__(self):
+        self.counts = {'Radiohead': 10, 'Portishead': 3}
+        self.tracks = {}
+        self.scrobbles = 100
+        self.requests = []
+
+    def scrobble(self, artist, title):
+        self.counts[artist] = self.counts.get(artist, 0) + 1
+        self.tracks[(artist, title)] = self.tracks.get((artist, title), 0) + 1
+        self.scrobbles += 1
+
+    def enricher(self):
+        def profile(context):
+            self.requests.append(('profile', context['title']))
+            return {'header_status': [self.scrobbles, len(self.counts), 5]}
+
+        def artist_count(context):
+            self.requests.append(('artist_count', context['title']))
+            return {'artist_count': self.counts.get(context['artist'], 0)}
+
+        def track_count(context):
+            self.requests.append(('track_count', context['title']))
+            return {'track_count': self.tracks.get((context['artist'], context['title']), 0)}
+
+        return make_enricher(
+            Stage('profile', profile, ('header_status',), timeout=1.0, key=per_track,
+                  after_play=STAGES['profile'].after_play),
+            Stage('artist_count', artist_count, ('artist_count',), timeout=1.0, key=per_track,
+                  after_play=STAGES['artist_count'].after_play),
+            Stage('track_count', track_count, ('track_count',), timeout=1.0, key=per_track,
+                  after_play=STAGES['track_count'].after_play),
+        )
+
+def play(enricher, artist, title):
+    return enricher.run('thom', artist, title, f'{artist} - {title}').fields
+
+def prefetch_track(enricher, artist, title):
+    return enricher.prefetch('thom', artist, title, f'{artist} - {title}')
+
+def test_counter_stages_are_prefetched():
+    assert STAGES['profile'].after_play and STAGES['artist_count'].after_play and STAGES['track_count'].after_play
+    library = Library()
+    enricher = library.enricher()
+    assert prefetch_track(enricher, 'Radiohead', 'Nude') == 0
+    assert [stage for stage, _ in library.requests] == ['profile', 'artist_count', 'track_count']
+
+@pytest.mark.parametrize('recorded_before_prefetch', [False, True])
+def test_prefetched_counts_include_the_scrobble_of_the_track_before(recorded_before_prefetch):
+    library = Library()
+    enricher = library.enricher()
+    assert play(enricher, 'Radiohead', '15 Step') == {'header_status': [100, 2, 5], 'artist_count': 10,
+                                                      'track_count': 0}
+    if recorded_before_prefetch:
+        library.scrobble('Radiohead', '15 Step')
+    prefetch_track(enricher, 'Radiohead', 'Bodysnatchers')
+    if not recorded_before_prefetch:
+        library.scrobble('Radiohead', '15 Step')
+    library.requests.clear()
+
+    fields = play(enricher, 'Radiohead', 'Bodysnatchers')
+    assert library.requests == [] # served from the prefetch
+    assert fields == {'header_status': [101, 2, 5], 'artist_count': 11, 'track_count': 0}
+    # Corrected once: a refresh of the track gives the same counts
+    assert play(enricher, 'Radiohead', 'Bodysnatchers') == fields
+
+def test_artist_count_of_another_artist_is_kept():
+    library = Library()
+    enricher = library.enricher()
+    play(enricher, 'Radiohead', 'Videotape')
+    prefetch_track(enricher, 'Portishead', 'Roads')
+    library.scrobble('Radiohead', 'Videotape')
+    assert play(enricher, 'Portishead', 'Roads') == {'header_status': [101, 2, 5], 'artist_count': 3,
+                                                     'track_count': 0}
+
+def test_first_listen_of_an_artist_adds_to_the_artists():
+    library = Library()
+    enricher = library.enricher()
+    assert play(enricher, 'Massive Attack', 'Teardrop')['artist_count'] == 0
+    prefetch_track(enricher, 'Massive Attack', 'Angel')
+    assert play(enricher, 'Massive Attack', 'Angel') == {'header_status': [101, 3, 5], 'artist_count': 1,
+                                                         'track_count': 0}
+
+def test_without_a_playing_track_prefetched_counts_are_kept():
+    library = Library()
+    enricher = library.enricher()
+    prefetch_track(enricher, 'Radiohead', 'Nude')
+    assert play(enricher, 'Radiohead', 'Nude')['artist_count'] == 10
+
+class ManualClock(SystemClock):
+    def __init__(self):
+        self.value = 1000.0
+
+    def monotonic(self):
+        return self.value
+
+@pytest.fixture
+def manual_clock():
+    manual = ManualClock()
+    clock.install(manual)
+    yield manual
+    clock.reset()
+
+def test_prefetcher_fetches_the_stats_shortly_before_the_end(monkeypatch, manual_clock):
+    tracklist = [('Radiohead', '15 Step', 237000), ('Radiohead', 'Bodysnatchers', 242000),
+                 ('Radiohead', 'Nude', 255000)]
+    monkeypatch.setattr(prefetch, 'get_tracklist', lambda artist, album, allow=None: tracklist)
+    library = Library()
+    prefetcher = Prefetcher('thom', library.enricher(), tracks=1, lead=20)
+
+    def poll(seconds):
+        manual_clock.value += seconds
+        prefetcher.observe('15 Step', 'Radiohead', 'In Rainbows', 237000)
+        wait_for_prefetch()
+
+    poll(0)
+    poll(120) # past halfway: the tracklist
+    assert prefetcher._upcoming == [('Radiohead', 'Bodysnatchers')]
+    poll(1)
+    assert library.requests == []
+    poll(100) # 16 s left
+    assert [title for _, title in library.requests] == ['Bodysnatchers'] * 3
+
+def test_lead_is_capped_below_the_counter_ttl():
+    assert Prefetcher('thom', Library().enricher(), lead=600).lead == enrichment.PLAY_TTL / 2
+
+class FakeTrack:
+    def __init__(self, artist, title):
+        self.artist = artist
+        self.title = title
+
+    def get_artist(self):
+        return self.artist
+
+    def get_title(self):
+        return self.title
+
+class PublicOnlyAlbum:
+    """A pylast Album without the request helper."""
+
+    def get_tracks(self):
+        return [FakeTrack('Radiohead', 'Reckoner'), FakeTrack('Radiohead', 'House of Cards')]
+
+class FakeNetwork:
+    def get_album(self, artist, album):
+        return PublicOnlyAlbum()
+
+def test_tracklist_falls_back_to_public_call(monkeypatch):
+    monkeypatch.setattr(prefetch, 'get_network', lambda: FakeNetwork())
+    tracks = get_tracklist('Radiohead', 'In Rainbows')
+    assert tracks == [('Radiohead', 'Reckoner', 0), ('Radiohead', 'House of Cards', 0)]
+    # Cached for the album's other tracks
+    monkeypatch.setattr(prefetch, 'get_network', lambda: pytest.fail('fetched twice'))
+    assert get_tracklist('radiohead', 'in rainbows') == tracks
+
+def test_tracklist_is_not_fetched_when_refused(monkeypatch):
+    monkeypatch.setattr(prefetch, 'get_network', lambda: pytest.fail('fetched'))
+    assert get_tracklist('Radiohead', 'In Rainbows', allow=lambda: False) is None
+
+def test_album_info_survives_a_changed_helper():
+    class ChangedAlbum:
+        def _request(self, method_name):
+            raise AssertionError('not called with these arguments')
+
+    assert prefetch._album_info(ChangedAlbum()) is None
+    assert prefetch._album_info(PublicOnlyAlbum()) is None
@@ -0,0 +1,48 @@
+import os
+import threading
+import time
+
+from utils.profiling import Profiler
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+def test_profiling_is_applied_at_checkpoints(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    profiler.checkpoint()
+    assert not profiler.active
+
+    assert profiler.toggle()
+    assert not profiler.active # only the worker's checkpoint starts it
+    profiler.checkpoint()
+    assert profiler.active
+    busy(0.2)
+
+    assert not profiler.toggle()
+    profiler.checkpoint()
+    assert not profiler.active
+
+    names = os.listdir(tmp_path)
+    base = [name for name in names if name.endswith('.pstats')][0][:-len('.pstats')]
+    assert sorted(names) == sorted(f'{base}{suffix}' for suffix in ('.pstats', '.txt', '.folded', '-alloc.txt'))
+    with open(tmp_path / f'{base}.folded', encoding='utf-8') as file:
+        assert 'busy (test_profiling.py' in file.read()
+
+def test_stop_writes_the_reports_from_another_thread(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    profiler.toggle()
+    worker = threading.Thread(target=lambda: (profiler.checkpoint(), busy(0.1)))
+    worker.start()
+    worker.join()
+    assert profiler.active
+
+    profiler.stop() # e.g. quitting from the tray while profiling
+    assert not profiler.active and not profiler.requested
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.pstats')]) == 1
+    profiler.stop()
+    profiler.checkpoint()
+    assert len(os.listdir(tmp_path)) == 4
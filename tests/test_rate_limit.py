@@ -0,0 +1,58 @@
+import pytest
+
+from utils.clock import SystemClock, clock
+from utils.rate_limit import TokenBucket
+
+class ManualClock(SystemClock):
+    """Time that only moves when something sleeps."""
+
+    def __init__(self):
+        self.value = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.value
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.value += seconds
+
+@pytest.fixture
+def manual_clock():
+    manual = ManualClock()
+    clock.install(manual)
+    yield manual
+    clock.reset()
+
+def test_burst_is_served_without_waiting(manual_clock):
+    bucket = TokenBucket(rate=2, burst=5)
+    assert [bucket.acquire() for _ in range(5)] == [0.0] * 5
+    assert manual_clock.slept == []
+    assert bucket.consumed == 5
+
+def test_debt_is_slept_off_in_arrival_order(manual_clock):
+    bucket = TokenBucket(rate=2, burst=1)
+    bucket.acquire()
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert bucket.acquire(2) == pytest.approx(1.0)
+    assert manual_clock.slept == pytest.approx([0.5, 1.0])
+
+def test_tokens_refill_up_to_capacity(manual_clock):
+    bucket = TokenBucket(rate=1, burst=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert not bucket.has_tokens()
+    manual_clock.value += 1.5
+    assert bucket.has_tokens() and not bucket.has_tokens(2)
+    manual_clock.value += 100
+    assert bucket.has_tokens(3) and not bucket.has_tokens(3.5)
+
+def test_has_tokens_does_not_take_them(manual_clock):
+    bucket = TokenBucket(rate=1, burst=2)
+    assert bucket.has_tokens(2)
+    assert bucket.has_tokens(2)
+    assert bucket.consumed == 0
+
+def test_capacity_defaults_to_rate():
+    assert TokenBucket(rate=4).capacity == 4
+    assert TokenBucket(rate=0.5).capacity == 1
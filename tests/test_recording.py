@@ -0,0 +1,100 @@
+import gzip
+import threading
+import time
+
+import pytest
+
+from utils.clock import VirtualClock
+from utils.recording import RECORDING_VERSION, Recorder, load_recording
+
+class FakePresence:
+    def __init__(self):
+        self.updates = []
+
+    def update(self, **kwargs):
+        self.updates.append(kwargs)
+
+    def clear(self):
+        raise ConnectionError('pipe closed')
+
+def test_recording_round_trip(tmp_path):
+    path = str(tmp_path / 'session.jsonl.gz')
+    recorder = Recorder()
+    recorder.start(path, username='thom')
+    recorder.record('poll', track='Radiohead - Nude')
+    recorder.record('track_info', track='Radiohead - Nude', info=['Nude', 'Radiohead', 'In Rainbows', None, 255000])
+    body = bytes(range(256))
+    recorder.record_http('https://www.last.fm/user/thom', 200, body, 0.1)
+    recorder.record_http('https://www.last.fm/user/thom/library', 200, body, 0.1)
+    recorder.stop()
+
+    recording = load_recording(path)
+    assert recording['header']['version'] == RECORDING_VERSION
+    assert recording['header']['username'] == 'thom'
+    assert [track for _, track in recording['polls']] == ['Radiohead - Nude']
+    assert recording['track_info']['Radiohead - Nude'][2] == 'In Rainbows'
+    # Bodies survive exactly and are stored once
+    assert recording['http']['https://www.last.fm/user/thom'] == (200, body)
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        assert sum('"kind": "blob"' in line for line in file) == 1
+
+def test_nothing_is_recorded_when_inactive():
+    recorder = Recorder()
+    recorder.record('poll', track='Radiohead - Nude')
+    recorder.record_http('https://www.last.fm/', 200, b'', 0.1)
+    assert not recorder.active
+
+def test_presence_calls_are_recorded_with_errors(tmp_path):
+    path = str(tmp_path / 'session.jsonl.gz')
+    recorder = Recorder()
+    recorder.start(path)
+    presence = recorder.wrap_presence(FakePresence())
+    presence.update(details='Nude', state='Radiohead')
+    with pytest.raises(ConnectionError):
+        presence.clear()
+    recorder.stop()
+
+    events = load_recording(path)['discord']
+    assert [(event['op'], event['error']) for event in events] == [('update', None), ('clear', 'ConnectionError')]
+    assert events[0]['details'] == 'Nude'
+
+def test_truncated_recording_keeps_the_readable_part(tmp_path):
+    path = str(tmp_path / 'session.jsonl.gz')
+    recorder = Recorder()
+    recorder.start(path)
+    for index in range(2000):
+        recorder.record('poll', track=f'Track {index} ' * 5)
+    recorder.stop()
+    with open(path, 'rb') as file:
+        data = file.read()
+    with open(path, 'wb') as file:
+        file.write(data[:len(data) // 2])
+    polls = load_recording(path)['polls']
+    assert 0 < len(polls) < 2000
+    assert polls[-1][1] == f'Track {len(polls) - 1} ' * 5
+
+def test_virtual_clock_sleeps_faster_but_advances_fully():
+    virtual = VirtualClock(speed=1000, start=0)
+    start_real = time.monotonic()
+    virtual.sleep(60)
+    assert time.monotonic() - start_real < 1
+    assert virtual.elapsed() == pytest.approx(60, abs=0.5)
+    assert virtual.time() == pytest.approx(60, abs=0.5)
+
+def test_virtual_clock_overlapping_sleeps_do_not_add_up():
+    virtual = VirtualClock(speed=1000)
+    threads = [threading.Thread(target=virtual.sleep, args=(30,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert virtual.elapsed() == pytest.approx(30, abs=0.5)
+
+def test_virtual_clock_wait_returns_early_when_set():
+    virtual = VirtualClock(speed=1000)
+    event = threading.Event()
+    event.set()
+    assert virtual.wait(event, 60)
+    assert virtual.elapsed() < 1
+    assert not virtual.wait(threading.Event(), 10)
+    assert virtual.elapsed() == pytest.approx(10, abs=0.5)
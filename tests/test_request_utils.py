@@ -0,0 +1,35 @@
+import pytest
+import requests
+
+import utils.request_utils as request_utils
+from utils.request_utils import get_response, set_http_get
+
+class Response:
+    def __init__(self, status_code=200, content=b'ok'):
+        self.status_code = status_code
+        self.content = content
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(request_utils.clock, 'sleep', slept.append)
+    yield slept
+    set_http_get(None)
+
+def test_single_try_fails_without_sleeping(sleeps):
+    calls = []
+    set_http_get(lambda url, timeout: calls.append(timeout) or Response(503))
+    with pytest.raises(requests.RequestException):
+        get_response('https://www.last.fm/user/benchuser', max_retries=1, timeout=3)
+    assert calls == [3]
+    assert sleeps == []
+
+def test_retries_until_a_response_succeeds(sleeps):
+    responses = [Response(503), Response(503), Response(200, b'page')]
+    set_http_get(lambda url, timeout: responses.pop(0))
+    assert get_response('https://www.last.fm/user/benchuser', retry_interval=2, max_retries=5).content == b'page'
+    assert sleeps == [2, 2]
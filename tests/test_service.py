@@ -0,0 +1,60 @@
+import pytest
+
+from core.service import INITIAL_POLL_COST, Service
+from utils.clock import SystemClock, clock
+
+class FrozenClock(SystemClock):
+    def monotonic(self):
+        return 1000.0
+
+@pytest.fixture
+def frozen_clock():
+    clock.install(FrozenClock())
+    yield
+    clock.reset()
+
+def make_service(accounts=3, requests_per_second=1.0):
+    return Service([f'user{index}' for index in range(accounts)], workers=2, requests_per_second=requests_per_second,
+                   poll_interval=10, idle_max_interval=300, sinks_config={})
+
+def test_accounts_have_no_discord_connection():
+    service = make_service()
+    assert [account.username for account in service.accounts] == ['user0', 'user1', 'user2']
+    assert not any(account.rpc.discord_enabled for account in service.accounts)
+
+def test_min_interval_fits_every_account_in_the_budget():
+    service = make_service(accounts=30, requests_per_second=2.0)
+    assert service.min_interval() == pytest.approx(30 * INITIAL_POLL_COST / 2.0)
+
+def test_poll_cost_follows_measurements():
+    service = make_service()
+    service._update_poll_cost(consumed=30, polls=10)
+    assert service.poll_cost == pytest.approx(0.5 * INITIAL_POLL_COST + 1.5)
+    service._update_poll_cost(consumed=0, polls=10)
+    assert service.poll_cost == pytest.approx(1.125)
+    service._update_poll_cost(consumed=0, polls=10)
+    assert service.poll_cost == 1.0 # never below one request per poll
+    service._update_poll_cost(consumed=100, polls=0) # no polls, no measurement
+    assert service.poll_cost == 1.0
+
+def test_idle_accounts_back_off():
+    account = make_service().accounts[0]
+    assert account.base_interval(10, 300) == 10
+    account.idle_polls = 1
+    assert account.base_interval(10, 300) == 20
+    account.idle_polls = 3
+    assert account.base_interval(10, 300) == 80
+    account.idle_polls = 100
+    assert account.base_interval(10, 300) == 300
+    account.playing = True
+    assert account.base_interval(10, 300) == 10
+
+def test_prefetching_only_uses_spare_tokens(frozen_clock):
+    service = make_service(requests_per_second=4.0)
+    allow = service.accounts[0].prefetch_allow
+    assert allow()
+    service.bucket.acquire(2)
+    assert allow() # half of the burst is left
+    service.bucket.acquire(1)
+    assert not allow()
+    assert service.bucket.consumed == 3
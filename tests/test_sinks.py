@@ -0,0 +1,78 @@
+import io
+import json
+import os
+import socket
+
+import pytest
+
+from core.sinks import FileSink, SocketSink, StdoutSink, create_sinks
+
+PRESENCE = {'event': 'presence', 'track': {'artist': 'Radiohead', 'title': 'Nude'}}
+CLEAR = {'event': 'clear'}
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+def test_stdout_sink_writes_json_lines():
+    stream = io.StringIO()
+    sink = StdoutSink(stream)
+    sink.publish(PRESENCE)
+    sink.publish(CLEAR)
+    assert [json.loads(line) for line in stream.getvalue().splitlines()] == [PRESENCE, CLEAR]
+
+def test_file_sink_appends(tmp_path):
+    path = str(tmp_path / 'out' / 'events.jsonl')
+    sink = FileSink(path)
+    sink.publish(PRESENCE)
+    sink.publish(CLEAR)
+    sink.close()
+    assert read_lines(path) == [PRESENCE, CLEAR]
+
+def test_file_sink_latest_keeps_one_event(tmp_path):
+    path = str(tmp_path / 'now.json')
+    sink = FileSink(path, mode='latest')
+    sink.publish(PRESENCE)
+    sink.publish(CLEAR)
+    assert read_lines(path) == [CLEAR]
+    assert not os.path.exists(f'{path}.tmp')
+
+def test_file_sink_rejects_unknown_mode(tmp_path):
+    with pytest.raises(ValueError):
+        FileSink(str(tmp_path / 'events.jsonl'), mode='rotate')
+
+def receive_line(client):
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = client.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return json.loads(data)
+
+def test_socket_sink_sends_latest_event_then_updates():
+    sink = SocketSink('127.0.0.1:0')
+    try:
+        port = sink._server.getsockname()[1]
+        sink.publish(PRESENCE)
+        with socket.create_connection(('127.0.0.1', port), timeout=5) as client:
+            assert receive_line(client) == PRESENCE
+            # The client is registered under the same lock as the latest event is sent
+            sink.publish(CLEAR)
+            assert receive_line(client) == CLEAR
+    finally:
+        sink.close()
+
+def test_create_sinks_expands_username_and_skips_failures(tmp_path):
+    config = {
+        'STDOUT': False,
+        'FILE': {'PATH': str(tmp_path / '{username}.jsonl')},
+        'SOCKET': {}, # no ADDRESS
+    }
+    sinks = create_sinks(config, username='thom')
+    try:
+        assert [sink.name for sink in sinks] == ['file']
+        assert sinks[0].path == str(tmp_path / 'thom.jsonl')
+    finally:
+        for sink in sinks:
+            sink.close()
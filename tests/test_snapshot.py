@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from core.application import App
+from utils.snapshot import SNAPSHOT_VERSION, read_snapshot, write_snapshot
+
+class RecordingRPC:
+    def __init__(self):
+        self.restored = None
+
+    def restore_state(self, state, with_stats=True):
+        self.restored = (state, with_stats)
+
+def make_app(path, username='benchuser'):
+    # Only the attributes restore_snapshot() uses; App() would start the tray
+    app = App.__new__(App)
+    app.snapshot_path = str(path)
+    app.username = username
+    app.rpc = RecordingRPC()
+    app.cached_track_data = None
+    return app
+
+def track_state(info=None):
+    return {
+        'username': 'benchuser',
+        'track': {'name': 'Radiohead - Reckoner',
+                  'info': info or ['Reckoner', 'Radiohead', 'In Rainbows', None, 290000]},
+        'rpc': {'display_options': {'show_username': False}},
+    }
+
+def test_write_then_read_round_trip(tmp_path):
+    path = tmp_path / 'state.json'
+    assert write_snapshot(str(path), {'username': 'benchuser'})
+    snapshot = read_snapshot(str(path))
+    assert snapshot['version'] == SNAPSHOT_VERSION
+    assert snapshot['username'] == 'benchuser'
+    assert not (tmp_path / 'state.json.tmp').exists()
+
+def test_other_versions_and_broken_json_are_ignored(tmp_path):
+    path = tmp_path / 'state.json'
+    path.write_text(json.dumps({'version': SNAPSHOT_VERSION + 1}))
+    assert read_snapshot(str(path)) is None
+    path.write_text('{"version": 1, "track"')
+    assert read_snapshot(str(path)) is None
+
+def test_recent_snapshot_restores_track_and_state(tmp_path):
+    path = tmp_path / 'state.json'
+    write_snapshot(str(path), track_state())
+    app = make_app(path)
+    app.restore_snapshot()
+    assert app.cached_track_data == ('Radiohead - Reckoner', ('Reckoner', 'Radiohead', 'In Rainbows', None, 290000))
+    assert app.rpc.restored == ({'display_options': {'show_username': False}}, True)
+
+def test_other_user_keeps_options_only(tmp_path):
+    path = tmp_path / 'state.json'
+    write_snapshot(str(path), track_state())
+    app = make_app(path, username='someone_else')
+    app.restore_snapshot()
+    assert app.cached_track_data is None
+    assert app.rpc.restored[1] is False
+
+@pytest.mark.parametrize('broken', [
+    {'track': {'info': ['Reckoner', 'Radiohead', None, None, 0]}},  # no name
+    {'track': {'name': 'Radiohead - Reckoner', 'info': ['Reckoner']}},  # truncated info
+    {'track': {'name': 'Radiohead - Reckoner', 'info': 5}},
+    {'track': ['Radiohead - Reckoner']},
+    {'saved_at': 'yesterday'},
+    {'rpc': ['not', 'an', 'object']},
+])
+def test_malformed_snapshot_is_dropped(tmp_path, broken):
+    path = tmp_path / 'state.json'
+    state = track_state()
+    state.update(broken)
+    write_snapshot(str(path), state)
+    if 'saved_at' in broken:
+        # write_snapshot stamps saved_at itself
+        data = json.loads(path.read_text())
+        data['saved_at'] = broken['saved_at']
+        path.write_text(json.dumps(data))
+    app = make_app(path)
+    app.restore_snapshot()
+    assert app.cached_track_data is None
+    assert app.rpc.restored is None
+
+def test_rpc_ignores_malformed_state():
+    from api.discord.rpc import DiscordRPC
+
+    rpc = DiscordRPC()
+    rpc.restore_state({'display_options': ['show_username'], 'user_data': 'Bench User', 'library_data': {'artist_count': 3}})
+    assert rpc.cached_user_data is None
+    rpc.restore_state({'display_options': {'show_username': False, 'unknown': True},
+                       'user_data': {'display_name': 'Bench User'}, 'library_data': {'artist_count': 3},
+                       'stats_track': 'Radiohead - Reckoner'})
+    assert rpc.show_username is False
+    assert rpc.cached_library_data == {'artist_count': 3}
+    assert rpc.last_fetched_track == 'Radiohead - Reckoner'
@@ -0,0 +1,21 @@
+import subprocess
+import sys
+
+from utils.metrics import metrics
+from utils.startup import StartupTimer
+
+def test_milestones_are_recorded_once():
+    timer = StartupTimer()
+    first = timer.mark('test_ready')
+    assert first is not None and first >= 0
+    assert timer.mark('test_ready') is None
+    assert timer.marks == {'test_ready': first}
+    _, _, count = metrics.histogram('stage_seconds', ('stage', 'startup_test_ready')).snapshot()
+    assert count >= 1
+
+def test_application_import_leaves_heavy_modules_unloaded():
+    # A fresh interpreter: this test process has imported most of them already
+    heavy = ('bs4', 'requests', 'pylast', 'httpx', 'pypresence', 'pystray', 'PIL', 'tkinter', 'http.server')
+    code = f"import sys, core.application; print(','.join(m for m in {heavy!r} if m in sys.modules))"
+    loaded = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.strip()
+    assert loaded == ''
@@ -0,0 +1,72 @@
+import json
+import socket
+
+import pytest
+
+from core.status_server import StatusServer
+
+@pytest.fixture
+def server():
+    server = StatusServer('127.0.0.1:0', allowed_origins=['https://overlay.example'])
+    yield server
+    server.close()
+
+def request(server, path='/status', headers=None):
+    """Sends a GET with exactly the given headers. Returns (status, headers, body) of the response head."""
+    headers = {'Host': f'127.0.0.1:{server.port}', **(headers or {})}
+    lines = [f'GET {path} HTTP/1.1'] + [f'{key}: {value}' for key, value in headers.items() if value is not None]
+    with socket.create_connection(('127.0.0.1', server.port), timeout=5) as connection:
+        connection.sendall(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        data = b''
+        while b'\r\n\r\n' not in data:
+            chunk = connection.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        head, _, body = data.partition(b'\r\n\r\n')
+        if path == '/status':
+            length = int(dict(line.split(': ', 1) for line in head.decode().split('\r\n')[1:]).get('Content-Length', 0))
+            while len(body) < length:
+                body += connection.recv(4096)
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    response_headers = dict(line.split(': ', 1) for line in header_lines)
+    return int(status_line.split()[1]), response_headers, body
+
+def test_status_without_origin_is_served_without_cors(server):
+    server.publish({'event': 'presence', 'track': 'Radiohead - Reckoner'})
+    status, headers, body = request(server)
+    assert status == 200
+    assert 'Access-Control-Allow-Origin' not in headers
+    assert json.loads(body)['track'] == 'Radiohead - Reckoner'
+
+@pytest.mark.parametrize('origin', ['http://localhost:3000', 'http://127.0.0.1:8080', 'https://overlay.example'])
+def test_local_and_allowed_origins_get_cors(server, origin):
+    status, headers, _ = request(server, headers={'Origin': origin})
+    assert status == 200
+    assert headers['Access-Control-Allow-Origin'] == origin
+
+@pytest.mark.parametrize('origin', ['https://evil.example', 'null', 'http://localhost.evil.example'])
+def test_other_origins_are_refused(server, origin):
+    status, headers, body = request(server, headers={'Origin': origin})
+    assert status == 403
+    assert 'Access-Control-Allow-Origin' not in headers
+    assert b'track' not in body
+
+def test_rebound_host_is_refused(server):
+    status, _, _ = request(server, headers={'Host': f'evil.example:{server.port}'})
+    assert status == 403
+
+def test_websocket_upgrade_checks_the_origin(server):
+    upgrade = {'Upgrade': 'websocket', 'Connection': 'Upgrade', 'Sec-WebSocket-Key': 'dGhlIHNhbXBsZSBub25jZQ==',
+               'Sec-WebSocket-Version': '13'}
+    status, _, _ = request(server, '/ws', {**upgrade, 'Origin': 'https://evil.example'})
+    assert status == 403
+    status, headers, _ = request(server, '/ws', {**upgrade, 'Origin': 'http://localhost'})
+    assert status == 101
+    assert headers['Sec-WebSocket-Accept'] == 's3pPLMBiTxaQ9kYGzzhZRbK+xOo='
+
+def test_event_stream_names_the_allowed_origin(server):
+    status, headers, _ = request(server, '/events', {'Origin': 'https://overlay.example'})
+    assert status == 200
+    assert headers['Content-Type'] == 'text/event-stream'
+    assert headers['Access-Control-Allow-Origin'] == 'https://overlay.example'
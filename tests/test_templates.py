@@ -0,0 +1,93 @@
+import pytest
+
+from api.discord.templates import DEFAULTS, PresenceTemplates, Template, TemplateError
+
+def render(source, **context):
+    return Template(source).render(context)
+
+def test_fields_are_filled_in():
+    assert render('{title} by {artist}', title='Nude', artist='Radiohead') == 'Nude by Radiohead'
+
+def test_missing_field_renders_nothing():
+    assert render('Scrobbles: {scrobbles}', scrobbles=None) is None
+    assert render('Tags: {tags}', tags=[]) is None
+    assert render('Tags: {tags}', tags=['rock', 'alternative']) == 'Tags: rock, alternative'
+
+def test_zero_is_a_value_but_not_a_condition():
+    assert render('Scrobbles: {artist_scrobbles}', artist_scrobbles=0) == 'Scrobbles: 0'
+    assert render('{?artist_scrobbles}Scrobbles: {artist_scrobbles}', artist_scrobbles=0) is None
+
+def test_conditions_and_negations():
+    assert render('{?loved}Loved', loved=True) == 'Loved'
+    assert render('{?loved}Loved', loved=False) is None
+    assert render('{!display_name}@{username}', display_name='Thom', username='thom') is None
+    assert render('{!display_name}@{username}', display_name=None, username='thom') == '@thom'
+
+def test_escapes_are_literal():
+    assert render('{{title}} [[{title}]]', title='Nude') == '{title} [Nude]'
+    # Braces in values are not format fields
+    assert render('{title}', title='{artist}') == '{artist}'
+
+def test_optional_part_is_left_out_when_a_field_is_missing():
+    source = '{artist}[ - {album}]'
+    assert render(source, artist='Radiohead', album='In Rainbows') == 'Radiohead - In Rainbows'
+    assert render(source, artist='Radiohead', album=None) == 'Radiohead'
+
+def test_nested_optionals():
+    source = '{title}[ ({artist_scrobbles}[/{track_scrobbles}])]'
+    assert render(source, title='Nude', artist_scrobbles=5, track_scrobbles=2) == 'Nude (5/2)'
+    assert render(source, title='Nude', artist_scrobbles=5, track_scrobbles=None) == 'Nude (5)'
+    assert render(source, title='Nude', artist_scrobbles=None, track_scrobbles=2) == 'Nude'
+    assert Template(source).fields == {'title', 'artist_scrobbles', 'track_scrobbles'}
+
+@pytest.mark.parametrize('source', [
+    '{nope}',
+    '{?nope}',
+    '[{nope}]',
+    '{title',
+    'title}',
+    '[{title}',
+    '{title}]',
+    '[[{title}]',
+])
+def test_invalid_templates_raise(source):
+    with pytest.raises(TemplateError):
+        Template(source)
+
+def test_default_state_is_the_artist():
+    context = {'artist': 'Radiohead', 'album': 'In Rainbows'}
+    assert Template(DEFAULTS['STATE']).render({**context, 'time_remaining': True}) == 'Radiohead'
+
+def test_state_can_add_album_while_time_is_shown():
+    state = Template('{artist}[{?time_remaining} - {album}]')
+    context = {'artist': 'Radiohead', 'album': 'In Rainbows'}
+    assert state.render({**context, 'time_remaining': True}) == 'Radiohead - In Rainbows'
+    assert state.render({**context, 'time_remaining': False}) == 'Radiohead'
+    assert state.render({**context, 'time_remaining': True, 'album': None}) == 'Radiohead'
+
+def test_render_lines_leaves_out_empty_lines():
+    lines = [Template('{display_name} (@{username})'), Template('{!display_name}@{username}'),
+             Template('Scrobbles: {scrobbles}')]
+    context = {'display_name': None, 'username': 'thom', 'scrobbles': 12}
+    assert PresenceTemplates.render_lines(lines, context) == {1: '@thom', 2: 'Scrobbles: 12'}
+
+def test_invalid_config_falls_back_to_default():
+    templates = PresenceTemplates.from_config({'DETAILS': '{nope}', 'SMALL_TEXT': ['{artist'], 'STATE': '{album}'})
+    assert templates.details.source == DEFAULTS['DETAILS']
+    assert [template.source for template in templates.small_text] == DEFAULTS['SMALL_TEXT']
+    assert templates.state.source == '{album}'
+    assert 'header_status' in templates.sources
+
+def test_default_state_and_large_text_fallback():
+    from api.discord.rpc import DiscordRPC
+
+    rpc = DiscordRPC()
+    rpc.start_time = 0
+    artwork = 'https://example.com/cover.png'
+    # Without stats, the large text falls back to the album name
+    assets = rpc._build_update_assets('thom', 'Nude', 'Radiohead', 'In Rainbows', artwork, 200, {}, {})
+    assert (assets['state'], assets['large_text']) == ('Radiohead', 'In Rainbows')
+    assets = rpc._build_update_assets('thom', 'Nude', 'Radiohead', 'In Rainbows', artwork, 200, {}, {'artist_count': 5})
+    assert assets['state'] == 'Radiohead'
+    assets = rpc._build_update_assets('thom', 'Nude', 'Radiohead', 'None', artwork, 200, {}, {})
+    assert (assets['state'], assets['large_text']) == ('Radiohead', 'Listening now')
@@ -0,0 +1,41 @@
+import json
+
+from utils.tracing import JsonlWriter, Span
+
+def test_to_dict_copies_attributes():
+    span = Span('cycle', {'track': 'Radiohead - Reckoner'}, 0.0)
+    child = Span('enrich', {}, 0.0)
+    span.children.append(child)
+    data = span.to_dict(0.0)
+
+    span.set('late', True)
+    child.add('retries')
+    span.children.append(Span('late_stage', {}, 0.0))
+
+    assert data['attributes'] == {'track': 'Radiohead - Reckoner'}
+    assert 'attributes' not in data['children'][0]
+    assert len(data['children']) == 1
+
+class Unserializable:
+    def __str__(self):
+        raise RuntimeError('dictionary changed size during iteration')
+
+def test_writer_survives_a_failing_record(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    writer = JsonlWriter(str(path), max_bytes=0, backups=0)
+    writer.submit({'name': 'first', 'bad': Unserializable()})
+    writer.submit({'name': 'second'})
+    writer.close()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line['name'] for line in lines] == ['second']
+
+def test_writer_rotates_by_size(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    writer = JsonlWriter(str(path), max_bytes=50, backups=2)
+    for index in range(10):
+        writer.submit({'name': f'record-{index}', 'padding': 'x' * 40})
+    writer.close()
+    assert (tmp_path / 'traces.jsonl.1').exists()
+    assert (tmp_path / 'traces.jsonl.2').exists()
+    assert not (tmp_path / 'traces.jsonl.3').exists()
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import threading
+import time
+
+from constants.project import HTTP_KEEP_WARM, HTTP_KEEPALIVE, HTTP_TIMEOUT
+from utils.metrics import metrics
+
+logger = logging.getLogger('http')
+
+# Seconds after their last real request that hosts are kept warm, about a few tracks
+WARM_PERIOD = 15 * 60
+
+def http2_available():
+    """True if the h2 package, which HTTP/2 support needs, is installed."""
+    try:
+        import h2 # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+class AsyncResponse:
+    """The subset of requests.Response used by get_response/get_dom."""
+
+    def __init__(self, url, status_code, content, http_version):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.http_version = http_version
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f'{self.status_code} for url: {self.url}')
+
+class AsyncHTTPClient:
+    """
+    One pool of HTTP/2 connections for page fetches and pylast calls.
+
+    An asyncio loop on its own thread drives a single async transport.
+    Callers stay synchronous: get() and the transport mounted on the pylast
+    network hand their request to the loop and wait for the response. The
+    requests of one track change (the profile page, the library pages and
+    the web-service calls, made by concurrent enrichment threads) are thus
+    multiplexed as streams over one connection per host instead of taking
+    one connection each.
+
+    Idle connections are kept for `keepalive` seconds. With keep_warm, a
+    host that has been idle for half that long gets a HEAD request, so the
+    connection made for one track change is still open for the next one
+    instead of paying for another TLS handshake. These requests go through
+    before_request like any other, and hosts are only kept warm for
+    WARM_PERIOD seconds after their last real request.
+
+    Without the h2 package the same pool speaks HTTP/1.1 with keep-alive.
+    """
+
+    def __init__(self, max_connections=8, keepalive=HTTP_KEEPALIVE, timeout=HTTP_TIMEOUT, before_request=None,
+                 keep_warm=HTTP_KEEP_WARM):
+        """
+        Args:
+            max_connections (int): Connections per pool, used by HTTP/1.1 only.
+            keepalive (float): Seconds idle connections are kept; 0 disables the warming requests.
+            timeout (float): Seconds to wait for each response.
+            before_request (callable): Called with each request on the caller's thread, e.g. a rate limit.
+            keep_warm (bool): Send HEAD requests to keep idle connections open.
+        """
+        import pylast
+        self.httpx = pylast.httpx # the HTTP client module pylast itself uses
+        self.http2 = http2_available()
+        self.keepalive = keepalive
+        self.keep_warm = keep_warm
+        self.timeout = timeout
+        self.before_request = before_request
+        self._transport = self.httpx.AsyncHTTPTransport(
+            verify=pylast.SSL_CONTEXT,
+            http2=self.http2,
+            limits=self.httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                     keepalive_expiry=keepalive or None),
+        )
+        self._client = self.httpx.AsyncClient(transport=self._transport, timeout=timeout, follow_redirects=True)
+        self._warm_task = None
+        self._last_used = {} # origin -> time.monotonic() of its last response
+        self._last_requested = {} # origin -> time.monotonic() of its last response to a caller
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name='http-client', daemon=True)
+        self._thread.start()
+        if not self.http2:
+            logger.warning("HTTP/2 needs the h2 package (pip install h2); using HTTP/1.1 keep-alive")
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        if self.keep_warm and self.keepalive:
+            self._warm_task = self._loop.create_task(self._keep_warm())
+        self._loop.run_forever()
+        self._loop.close()
+
+    def _submit(self, coroutine, timeout=None):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        try:
+            return future.result((timeout or self.timeout) + 5)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def _received(self, url, http_version, warming=False):
+        origin = (url.scheme, url.host, url.port)
+        self._last_used[origin] = time.monotonic()
+        if not warming:
+            self._last_requested[origin] = self._last_used[origin]
+        metrics.inc('http_responses_total', ('version', http_version))
+
+    async def _get(self, url, timeout=None):
+        response = await self._client.get(url, timeout=timeout or self.timeout)
+        self._received(response.url, response.http_version)
+        return AsyncResponse(str(response.url), response.status_code, response.content, response.http_version)
+
+    def get(self, url, timeout=None):
+        """
+        Fetches url. A drop-in for requests.get in set_http_get().
+
+        Args:
+            timeout (float): Seconds to wait for the response; the client's timeout if None.
+
+        Raises:
+            requests.RequestException: If the request fails.
+        """
+        import requests
+
+        if self.before_request:
+            self.before_request(url)
+        try:
+            return self._submit(self._get(url, timeout), timeout)
+        except (self.httpx.HTTPError, TimeoutError) as e:
+            raise requests.ConnectionError(f'{type(e).__name__}: {e}') from e
+
+    async def _send(self, request):
+        response = await self._transport.handle_async_request(request)
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        http_version = response.extensions.get('http_version', b'HTTP/1.1').decode('ascii')
+        self._received(request.url, http_version)
+        return self.httpx.Response(response.status_code, headers=response.headers, content=content,
+                                   extensions=response.extensions, request=request)
+
+    def mount(self, network):
+        """Sends every web-service call of a pylast network through this client."""
+        client = self
+
+        class BridgeTransport(self.httpx.BaseTransport):
+            def handle_request(self, request):
+                if client.before_request:
+                    client.before_request(request)
+                return client._submit(client._send(request))
+
+            def close(self):
+                # pylast closes its client after every call; the connections belong to the AsyncHTTPClient
+                pass
+
+        network.proxy = {'all://': BridgeTransport()}
+        return network
+
+    async def _keep_warm(self):
+        while True:
+            await asyncio.sleep(self.keepalive / 4)
+            now = time.monotonic()
+            for origin, last_used in list(self._last_used.items()):
+                if now - last_used < self.keepalive / 2 or now - self._last_requested[origin] > WARM_PERIOD:
+                    continue
+                scheme, host, port = origin
+                url = self.httpx.URL(scheme=scheme, host=host, port=port, path='/')
+                if self.before_request:
+                    # It may block, e.g. waiting for the rate limit, so it runs off the loop
+                    await self._loop.run_in_executor(None, self.before_request, str(url))
+                try:
+                    response = await self._client.head(url, follow_redirects=False)
+                    self._received(url, response.http_version, warming=True)
+                    logger.debug("Kept the connection to %s warm", host)
+                except self.httpx.HTTPError as e:
+                    # The next request reconnects; stop warming until then
+                    self._last_used.pop(origin, None)
+                    logger.debug("Could not keep the connection to %s warm: %s", host, e)
+
+    async def _shutdown(self):
+        if self._warm_task:
+            self._warm_task.cancel()
+        await self._client.aclose()
+
+    def close(self):
+        """Closes the connections and stops the loop thread."""
+        if self._loop.is_closed():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        try:
+            future.result(2)
+        except Exception as e:
+            logger.debug("HTTP client shutdown: %s", e)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(2)
@@ -0,0 +1,293 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import weakref
+
+from constants.project import CACHE_MEMORY_BUDGET
+from utils.clock import clock
+from utils.metrics import metrics
+
+logger = logging.getLogger('cache')
+
+# Puts between re-measuring the registered slots
+SLOT_REFRESH_PUTS = 64
+
+# Share of the budget the evictable caches keep even when the slots alone exceed it
+MIN_CACHE_SHARE = 0.25
+
+def estimate_size(value, _depth=0):
+    """
+    Roughly estimates the memory held by a value, in bytes.
+
+    Follows containers and object attributes a few levels deep; shared
+    objects are counted every time they are reached, which errs on the
+    large side.
+    """
+    size = sys.getsizeof(value, 64)
+    if _depth >= 4 or isinstance(value, (str, bytes, bytearray, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, dict):
+        return size + sum(estimate_size(key, _depth + 1) + estimate_size(item, _depth + 1) for key, item in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(estimate_size(item, _depth + 1) for item in value)
+    attributes = getattr(value, '__dict__', None)
+    if attributes is not None:
+        return size + estimate_size(attributes, _depth + 1)
+    return size
+
+class _Entry:
+    __slots__ = ('value', 'size', 'cost', 'priority', 'sequence')
+
+class ManagedCache:
+    """
+    A key-value cache whose memory is accounted for by a CacheManager.
+
+    Entries carry a cost, roughly the seconds it takes to rebuild them (a
+    web request, a database read). When the manager is over budget it
+    evicts the entries with the least cost per byte that were not used
+    recently, across all of its caches.
+    """
+
+    def __init__(self, manager, name, cost=1.0):
+        self.manager = manager
+        self.name = name
+        self.cost = cost
+        self._entries = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.backing_hits = 0 # memory misses served by a backing store, e.g. a database
+        self.evictions = 0
+
+    def get(self, key, default=None, count_miss=True):
+        """
+        Returns the value for key, counting a hit or a miss.
+
+        Args:
+            count_miss (bool): False leaves a miss to be counted by backing_lookup(), for caches that mirror a store.
+        """
+        with self.manager.lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if count_miss:
+                    self.misses += 1
+                return default
+            self.hits += 1
+            self.manager._touch(self, key, entry)
+            return entry.value
+
+    def put(self, key, value, cost=None, size=None):
+        """
+        Stores a value, then evicts across all caches if over budget.
+
+        Args:
+            cost (float): Seconds to rebuild the entry; the cache's default cost if None.
+            size (int): Bytes held by the entry; estimated if None.
+        """
+        entry = _Entry()
+        entry.value = value
+        entry.size = max(1, size if size is not None else estimate_size(value))
+        entry.cost = self.cost if cost is None else cost
+        with self.manager.lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self.bytes -= previous.size
+                self.manager.bytes -= previous.size
+            self._entries[key] = entry
+            self.bytes += entry.size
+            self.manager.bytes += entry.size
+            self.manager._touch(self, key, entry)
+        self.manager._after_put()
+
+    def backing_lookup(self, found):
+        """Counts a lookup that missed memory and went to the backing store: a backing hit if found, else a miss."""
+        with self.manager.lock:
+            if found:
+                self.backing_hits += 1
+            else:
+                self.misses += 1
+
+    def pop(self, key, default=None):
+        with self.manager.lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self.bytes -= entry.size
+            self.manager.bytes -= entry.size
+            return entry.value
+
+    def clear(self):
+        with self.manager.lock:
+            self.manager.bytes -= self.bytes
+            self.bytes = 0
+            self._entries.clear()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'backing_hits': self.backing_hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / (lookups + self.backing_hits), 3) if lookups + self.backing_hits else None,
+            'evictions': self.evictions,
+        }
+
+class CacheManager:
+    """
+    Holds every cache of the process to one memory budget.
+
+    Evictable caches are created with cache(). Eviction is GreedyDual-Size:
+    an entry's priority is the inflation value L plus its cost per byte,
+    refreshed on every use; the lowest priority is evicted and becomes the
+    new L, so entries that are not used age out even if they are costly.
+
+    Values that are held in attributes rather than in a cache, such as the
+    current track's stats, are registered with register_slots(). They are
+    measured and reported, and count against the budget, but are never
+    evicted; when they alone exceed the budget, the caches still keep
+    MIN_CACHE_SHARE of it.
+    """
+
+    def __init__(self, budget=CACHE_MEMORY_BUDGET):
+        self.budget = budget
+        self.lock = threading.RLock()
+        self.bytes = 0 # Bytes held by evictable entries
+        self.slot_bytes = 0 # Bytes held by registered slots at the last measurement
+        self._caches = []
+        self._slots = {} # name -> list of (weakref to owner, attribute names)
+        self._heap = []
+        self._sequence = itertools.count()
+        self._inflation = 0.0
+        self._puts = 0
+
+    def cache(self, name, cost=1.0):
+        """Creates an evictable cache registered with this manager."""
+        cache = ManagedCache(self, name, cost)
+        with self.lock:
+            self._caches.append(cache)
+        return cache
+
+    def register_slots(self, name, owner, attributes):
+        """Accounts for owner's attributes under name, for as long as owner lives."""
+        with self.lock:
+            self._slots.setdefault(name, []).append((weakref.ref(owner), tuple(attributes)))
+
+    def _touch(self, cache, key, entry):
+        entry.priority = self._inflation + entry.cost / entry.size
+        entry.sequence = next(self._sequence)
+        heapq.heappush(self._heap, (entry.priority, entry.sequence, cache, key))
+        # Stale heap items are skipped on eviction; rebuild once they dominate
+        if len(self._heap) > 4 * max(64, sum(len(cache._entries) for cache in self._caches)):
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self._heap = [(entry.priority, entry.sequence, cache, key)
+                      for cache in self._caches for key, entry in cache._entries.items()]
+        heapq.heapify(self._heap)
+
+    def _after_put(self):
+        # Called without the lock: measuring walks every registered value, and would block every cache meanwhile
+        with self.lock:
+            self._puts += 1
+            measure = self._puts % SLOT_REFRESH_PUTS == 1
+        if measure:
+            self._measure_slots()
+        with self.lock:
+            self._evict()
+
+    def _evict(self):
+        # Evicting cannot shrink the slots: cap it at what the caches hold beyond their share
+        limit = max(self.budget - self.slot_bytes, self.budget * MIN_CACHE_SHARE)
+        while self.bytes > limit and self._heap:
+            priority, sequence, cache, key = heapq.heappop(self._heap)
+            entry = cache._entries.get(key)
+            if entry is None or entry.sequence != sequence:
+                continue # Superseded by a later use or removed
+            del cache._entries[key]
+            cache.bytes -= entry.size
+            self.bytes -= entry.size
+            cache.evictions += 1
+            self._inflation = priority
+            metrics.inc('cache_evictions_total', ('cache', cache.name))
+
+    def _measure_slots(self):
+        # Only the owner list is read under the lock; the values are measured outside it
+        with self.lock:
+            slots = {}
+            for name, owners in self._slots.items():
+                owners[:] = [(ref, attributes) for ref, attributes in owners if ref() is not None]
+                slots[name] = list(owners)
+        usage = {}
+        for name, owners in slots.items():
+            entries = size = 0
+            for ref, attributes in owners:
+                owner = ref()
+                if owner is None:
+                    continue
+                for attribute in attributes:
+                    value = getattr(owner, attribute, None)
+                    if not value:
+                        continue
+                    try:
+                        size += estimate_size(value)
+                    except RuntimeError: # changed size while it was measured; counted next time
+                        continue
+                    entries += 1
+            usage[name] = {'entries': entries, 'bytes': size, 'pinned': True}
+        with self.lock:
+            self.slot_bytes = sum(item['bytes'] for item in usage.values())
+        return usage
+
+    def stats(self):
+        """Returns the budget, the totals and the per-cache entries, bytes, hit rates and evictions."""
+        slots = self._measure_slots()
+        with self.lock:
+            caches = {}
+            for cache in self._caches:
+                stats = cache.stats()
+                merged = caches.get(cache.name)
+                if merged is None:
+                    caches[cache.name] = stats
+                    continue
+                for field in ('entries', 'bytes', 'hits', 'backing_hits', 'misses', 'evictions'):
+                    merged[field] += stats[field]
+                lookups = merged['hits'] + merged['backing_hits'] + merged['misses']
+                merged['hit_rate'] = round(merged['hits'] / lookups, 3) if lookups else None
+            caches.update(slots)
+            hits = sum(cache.hits for cache in self._caches)
+            lookups = hits + sum(cache.backing_hits + cache.misses for cache in self._caches)
+            return {
+                'budget_bytes': self.budget,
+                'used_bytes': self.bytes + self.slot_bytes,
+                'hit_rate': round(hits / lookups, 3) if lookups else None,
+                'evictions': sum(cache.evictions for cache in self._caches),
+                'caches': caches,
+            }
+
+    def dump(self, path):
+        """Writes stats() as JSON. Returns the path, or None if it could not be written."""
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump({'time': clock.time(), **self.stats()}, file, indent=2)
+        except OSError as e:
+            logger.error(f"Could not write cache stats to {path}: {e}")
+            return None
+        logger.info(f"Cache stats written to {path}")
+        return path
+
+cache_manager = CacheManager()
@@ -0,0 +1,104 @@
+import datetime
+import threading
+import time
+
+class SystemClock:
+    """Wall-clock time and real sleeping."""
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def now(self):
+        return datetime.datetime.now()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout):
+        return event.wait(timeout)
+
+class VirtualClock(SystemClock):
+    """
+    An accelerated clock for replay and soak runs.
+
+    Sleeps and event waits take 1/speed of their real duration, but advance
+    virtual time by the full amount. Time spent computing is counted as is,
+    so cycle work is not inflated by the speed factor. Overlapping sleeps on
+    several threads advance virtual time to the latest wake-up target
+    rather than adding up.
+    """
+
+    def __init__(self, speed=100.0, start=None):
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._origin_real = time.monotonic()
+        self._origin_wall = time.time() if start is None else start
+        self._skipped = 0.0
+
+    def _skip(self, start, requested, elapsed_real):
+        with self._lock:
+            target = start + min(requested, elapsed_real * self.speed)
+            self._skipped = max(self._skipped, target - (time.monotonic() - self._origin_real))
+
+    def elapsed(self):
+        """Virtual seconds since the clock was created."""
+        return time.monotonic() - self._origin_real + self._skipped
+
+    def time(self):
+        return self._origin_wall + self.elapsed()
+
+    def monotonic(self):
+        return self._origin_real + self.elapsed()
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self.time())
+
+    def sleep(self, seconds):
+        start, real_start = self.elapsed(), time.monotonic()
+        time.sleep(seconds / self.speed)
+        self._skip(start, seconds, time.monotonic() - real_start)
+
+    def wait(self, event, timeout):
+        start, real_start = self.elapsed(), time.monotonic()
+        result = event.wait(None if timeout is None else timeout / self.speed)
+        if timeout is not None:
+            self._skip(start, timeout, time.monotonic() - real_start)
+        return result
+
+class Clock:
+    """
+    Process-wide clock used for timestamps, TTLs and pacing.
+
+    Delegates to a SystemClock unless another implementation (e.g. a
+    VirtualClock for replays) is installed.
+    """
+
+    def __init__(self):
+        self._impl = SystemClock()
+
+    def install(self, impl):
+        self._impl = impl
+        return impl
+
+    def reset(self):
+        self._impl = SystemClock()
+
+    def time(self):
+        return self._impl.time()
+
+    def monotonic(self):
+        return self._impl.monotonic()
+
+    def now(self):
+        return self._impl.now()
+
+    def sleep(self, seconds):
+        self._impl.sleep(seconds)
+
+    def wait(self, event, timeout):
+        return self._impl.wait(event, timeout)
+
+clock = Clock()
@@ -0,0 +1,58 @@
+import logging
+
+logger = logging.getLogger('http')
+
+def create_session(pool_size):
+    """
+    Creates a requests Session whose connection pool is sized for pool_size concurrent fetches.
+
+    Sharing one Session keeps connections to www.last.fm alive between page fetches.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def pool_network(network, max_connections, before_request=None):
+    """
+    Makes every web-service call of a pylast network share pooled connections.
+
+    pylast opens a new client, and so a new connection, for every call and
+    mounts `network.proxy` on it. Wrapping the mounted transports (or a new
+    pooled one) in a transport that ignores close() keeps the pool alive
+    across calls. before_request, if given, is called with each request,
+    e.g. to apply a rate limit.
+    """
+    import pylast
+    httpx = pylast.httpx # the HTTP client module pylast itself uses
+
+    class PersistentTransport(httpx.BaseTransport):
+        def __init__(self, inner):
+            self.pooled_inner = inner
+
+        def handle_request(self, request):
+            if before_request:
+                before_request(request)
+            return self.pooled_inner.handle_request(request)
+
+        def close(self):
+            # pylast closes its client after every call; keep the pool alive
+            pass
+
+    mounts = network.proxy or {
+        'all://': httpx.HTTPTransport(
+            verify=pylast.SSL_CONTEXT,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+    }
+    # Pooling again replaces the previous wrapper instead of stacking another one
+    network.proxy = {
+        pattern: PersistentTransport(getattr(transport, 'pooled_inner', transport))
+        for pattern, transport in mounts.items()
+    }
+    logger.debug("pylast network pooled over %s", list(network.proxy))
+    return network
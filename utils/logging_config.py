@@ -1,6 +1,10 @@
+import atexit
+import json
 import logging
-import sys
+import logging.handlers
 import os
+import queue
+import sys
 
 class ColoredFormatter(logging.Formatter):
     """Custom logging formatter for vibrant and readable terminal output."""
@@ -57,8 +61,66 @@ class ColoredFormatter(logging.Formatter):
             
         return log_fmt
 
-def setup_logging(level=logging.INFO):
-    """Configures the enhanced logging for the application."""
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, for log shippers and files."""
+
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on the queue without formatting them.
+
+    The stock QueueHandler formats every record on the calling thread.
+    Records only cross threads here, never processes, so formatting (and
+    the %-interpolation of lazy log arguments) is left to the listener
+    thread. Objects passed as log arguments must not be mutated afterwards.
+    """
+
+    def prepare(self, record):
+        return record
+
+FORMATTERS = {'text': ColoredFormatter, 'json': JsonFormatter}
+
+_listener = None
+
+def shutdown_logging():
+    """Writes out queued records and stops the logging thread. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def setup_logging(level=logging.INFO, stream=None, console_format='text',
+                  file_path=None, file_format='json', max_bytes=5 * 1024 * 1024, backups=3):
+    """
+    Configures the enhanced logging for the application.
+
+    Logs go to stdout unless another stream is given (headless mode uses
+    stderr so the stdout sink only carries JSON lines), and optionally to a
+    size-rotated file. Callers only put records on a queue; a background
+    listener formats and writes them, so a slow console never stalls the
+    RPC worker.
+
+    Args:
+        level (int): Root logging level.
+        stream: Console stream, stdout by default.
+        console_format (str): 'text' for the colored format or 'json'.
+        file_path (str): Optional log file, rotated at max_bytes with backups old files.
+        file_format (str): 'json' or 'text' for the log file.
+    """
+    global _listener
     
     # Enable ANSI escape sequences on Windows if possible
     if sys.platform == 'win32':
@@ -68,14 +130,28 @@ def setup_logging(level=logging.INFO):
     logger.setLevel(level)
     
     # Remove existing handlers to avoid double logging
+    shutdown_logging()
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
         
     # Create console handler with our custom formatter
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(ColoredFormatter())
-    
-    logger.addHandler(console_handler)
+    console_handler = logging.StreamHandler(stream or sys.stdout)
+    console_handler.setFormatter(FORMATTERS.get(console_format, ColoredFormatter)())
+    handlers = [console_handler]
+
+    if file_path:
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            file_path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        file_handler.setFormatter(FORMATTERS.get(file_format, JsonFormatter)())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
     
     # Silence noisy external libraries
     logging.getLogger("httpcore").setLevel(logging.WARNING)
@@ -87,3 +163,6 @@ def setup_logging(level=logging.INFO):
     logging.getLogger("asyncio").setLevel(logging.WARNING)
 
     return logger
+
+# Flush queued records on a normal exit
+atexit.register(shutdown_logging)
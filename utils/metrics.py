@@ -0,0 +1,161 @@
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger('metrics')
+
+METRIC_PREFIX = 'lastfm_rpc'
+
+# Latency buckets in seconds, tuned for network fetches and IPC calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Counter:
+    """A monotonically increasing counter."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+class Histogram:
+    """A fixed-bucket latency histogram (cumulative on export, like Prometheus)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+class MetricsRegistry:
+    """
+    Holds every counter and histogram of the application.
+
+    Metrics are keyed by name and an optional single label, e.g. the
+    'stage_seconds' histogram is labelled by stage name.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def counter(self, name, label=None):
+        key = (name, label)
+        metric = self._counters.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._counters.setdefault(key, Counter())
+        return metric
+
+    def histogram(self, name, label=None):
+        key = (name, label)
+        metric = self._histograms.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._histograms.setdefault(key, Histogram())
+        return metric
+
+    def inc(self, name, label=None, amount=1):
+        """Increments a counter, e.g. inc('cache_hits_total', ('cache', 'artwork'))."""
+        self.counter(name, label).inc(amount)
+
+    def observe_stage(self, stage, seconds):
+        """Records the duration of a pipeline stage."""
+        self.histogram('stage_seconds', ('stage', stage)).observe(seconds)
+
+    def mean_ms(self, *stages):
+        """Returns the mean duration in milliseconds over the given stages, or None."""
+        total, count = 0.0, 0
+        for stage in stages:
+            metric = self._histograms.get(('stage_seconds', ('stage', stage)))
+            if metric is not None:
+                _, stage_sum, stage_count = metric.snapshot()
+                total += stage_sum
+                count += stage_count
+        return round(total / count * 1000) if count else None
+
+    def render_prometheus(self):
+        """Renders all metrics in the Prometheus text exposition format."""
+        lines = []
+        seen = set()
+
+        def labels(label, extra=None):
+            pairs = [label] if label else []
+            if extra:
+                pairs.append(extra)
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}' if pairs else ''
+
+        for (name, label), metric in sorted(self._counters.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            full_name = f'{METRIC_PREFIX}_{name}'
+            if full_name not in seen:
+                seen.add(full_name)
+                lines.append(f'# TYPE {full_name} counter')
+            lines.append(f'{full_name}{labels(label)} {metric.value}')
+
+        for (name, label), metric in sorted(self._histograms.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            full_name = f'{METRIC_PREFIX}_{name}'
+            if full_name not in seen:
+                seen.add(full_name)
+                lines.append(f'# TYPE {full_name} histogram')
+            counts, total, count = metric.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{full_name}_bucket{labels(label, ("le", bound))} {cumulative}')
+            lines.append(f'{full_name}_sum{labels(label)} {total}')
+            lines.append(f'{full_name}_count{labels(label)} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """
+    Serves /metrics on localhost from a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server, or None if it could not bind.
+    """
+    # http.server is only imported when the endpoint is enabled
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would flood the console otherwise
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logger.error(f"Could not start metrics endpoint on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
+
+metrics = MetricsRegistry()
@@ -0,0 +1,121 @@
+import logging
+import signal
+import threading
+
+from constants.project import PARSING_WORKERS
+from utils.metrics import metrics
+from utils.tracing import tracer
+
+logger = logging.getLogger('parsing')
+
+def html_document(content):
+    """Parses raw HTML bytes with BeautifulSoup."""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(content, 'html.parser')
+
+def _init_worker():
+    # Ctrl+C is handled by the main process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import bs4 # noqa: F401 (loaded once per worker, not on the first page)
+
+def _noop():
+    return None
+
+class ParsingPool:
+    """
+    Runs page extractors either in the calling thread or in worker processes.
+
+    An extractor is a module-level function that takes the raw page bytes
+    and returns a small, picklable result (a dict or a count). With workers,
+    only those bytes and results cross the process boundary, so BeautifulSoup
+    never holds the GIL of the main process and several pages are parsed on
+    several cores. Without workers, or if the pool cannot be started or
+    breaks, extractors run in the calling thread as before.
+    """
+
+    def __init__(self, workers=PARSING_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return 'process' if self.workers > 0 else 'thread'
+
+    def start(self):
+        """Starts the worker processes ahead of the first page, so they are warm when it arrives."""
+        executor = self._get_executor()
+        if executor is not None:
+            for _ in range(self.workers):
+                executor.submit(_noop)
+
+    def _get_executor(self):
+        if self.workers <= 0:
+            return None
+        with self._lock:
+            if self._executor is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                try:
+                    # spawn: forking a process that already runs threads is unsafe
+                    self._executor = ProcessPoolExecutor(
+                        self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker)
+                except (OSError, ValueError) as e:
+                    self._fall_back(e)
+                    return None
+                logger.info(f"Parsing pages in {self.workers} worker processes")
+            return self._executor
+
+    def _fall_back(self, error):
+        logger.warning(f"Parsing pool unavailable, parsing in-thread: {error}")
+        metrics.inc('parsing_fallbacks_total')
+        self.workers = 0
+
+    def parse(self, extractor, content):
+        """
+        Runs extractor(content) on the configured backend.
+
+        Args:
+            extractor (callable): A module-level function taking the page bytes.
+            content (bytes): The raw page.
+
+        Returns:
+            The extractor's result.
+        """
+        with tracer.span('parse', backend=self.backend):
+            executor = self._get_executor()
+            if executor is not None:
+                from concurrent.futures import CancelledError
+                from concurrent.futures.process import BrokenProcessPool
+                future = None
+                try:
+                    future = executor.submit(extractor, content)
+                except BrokenProcessPool as e:
+                    self._discard(executor, e)
+                except RuntimeError:
+                    pass # shut down since _get_executor() returned it
+                if future is not None:
+                    # Errors raised by the extractor itself propagate, as they would in-thread
+                    try:
+                        return future.result()
+                    except BrokenProcessPool as e:
+                        self._discard(executor, e)
+                    except CancelledError:
+                        pass # shut down while the page was queued
+            return extractor(content)
+
+    def _discard(self, executor, error):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self._fall_back(error)
+
+    def shutdown(self):
+        """Stops the workers. Later pages are parsed in-thread."""
+        with self._lock:
+            self.workers = 0
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+parsing_pool = ParsingPool()
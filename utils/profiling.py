@@ -0,0 +1,162 @@
+import collections
+import cProfile
+import datetime
+import io
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+
+from constants.project import DIAGNOSTICS_DIR, PROFILING_SAMPLE_INTERVAL
+
+logger = logging.getLogger('profiling')
+
+class StackSampler:
+    """
+    Statistical sampler for a single thread.
+
+    Periodically captures the target thread's stack and counts identical
+    stacks, which is written out in the folded format understood by
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id, interval=PROFILING_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(self._frame_label(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(labels))] += 1
+
+    def write_folded(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+class Profiler:
+    """
+    Starts and stops profiling of the RPC worker thread at runtime.
+
+    The tray only flips the requested state; the worker calls checkpoint()
+    at the start of each cycle so cProfile is enabled and disabled on the
+    worker thread itself. While active, a stack sampler and tracemalloc run
+    alongside. stop() ends profiling from any thread, for the exit path.
+    Reports are written to the diagnostics folder on stop:
+    a .pstats file, a text summary, a .folded flamegraph input and an
+    allocation diff between the start and stop snapshots.
+    """
+
+    def __init__(self, output_dir=DIAGNOSTICS_DIR):
+        self.output_dir = output_dir
+        self.requested = False
+        self.active = False
+        self._profile = None
+        self._sampler = None
+        self._baseline = None
+        self._owns_tracemalloc = False
+        self._lock = threading.Lock()
+
+    def toggle(self):
+        """Requests profiling on or off. Takes effect at the worker's next checkpoint."""
+        self.requested = not self.requested
+        return self.requested
+
+    def checkpoint(self):
+        """Applies the requested state. Must be called from the thread to be profiled."""
+        with self._lock:
+            if self.requested and not self.active:
+                self._start()
+            elif not self.requested and self.active:
+                self._stop()
+
+    def stop(self):
+        """Stops profiling right away and writes the reports, e.g. on exit when the worker will not reach another checkpoint."""
+        with self._lock:
+            self.requested = False
+            if self.active:
+                self._stop()
+
+    @staticmethod
+    def _take_snapshot():
+        # Leave out tracemalloc's own bookkeeping
+        return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+
+    def _start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._owns_tracemalloc = True
+        self._baseline = self._take_snapshot()
+
+        self._sampler = StackSampler(threading.get_ident())
+        self._sampler.start()
+
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        self.active = True
+        logger.info("Profiling started on the RPC worker thread.")
+
+    def _stop(self):
+        self._profile.disable()
+        self._sampler.stop()
+        snapshot = self._take_snapshot()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+        self.active = False
+
+        try:
+            base = self._write_reports(snapshot)
+            logger.info(f"Profiling stopped. Reports written to {base}.*")
+        except OSError as e:
+            logger.error(f"Could not write profiling reports: {e}")
+        finally:
+            self._profile = None
+            self._sampler = None
+            self._baseline = None
+
+    def _write_reports(self, snapshot):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        base = os.path.join(self.output_dir, f'profile-{stamp}')
+
+        # Deterministic profile (load with pstats, snakeviz, gprof2dot...)
+        import pstats
+        self._profile.dump_stats(f'{base}.pstats')
+        summary = io.StringIO()
+        pstats.Stats(self._profile, stream=summary).sort_stats('cumulative').print_stats(40)
+        with open(f'{base}.txt', 'w', encoding='utf-8') as file:
+            file.write(summary.getvalue())
+
+        # Sampled stacks (flamegraph.pl / speedscope)
+        self._sampler.write_folded(f'{base}.folded')
+
+        # Allocation growth since profiling started
+        with open(f'{base}-alloc.txt', 'w', encoding='utf-8') as file:
+            for stat in snapshot.compare_to(self._baseline, 'lineno')[:50]:
+                file.write(f'{stat}\n')
+        return base
+
+profiler = Profiler()
@@ -0,0 +1,47 @@
+import threading
+
+from utils.clock import clock
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by every outgoing request.
+
+    acquire() reserves tokens at once and sleeps off any debt, so callers
+    are served in arrival order and never spin. The bucket also counts the
+    tokens it handed out, which callers use to measure request costs.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.consumed = 0
+        self._tokens = self.capacity
+        self._updated = clock.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = clock.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        """
+        Takes tokens, waiting until they are available.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            self.consumed += tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            clock.sleep(wait)
+        return wait
+
+    def has_tokens(self, tokens=1):
+        """True if tokens are available right now, without taking them. Lets low-priority work use spare capacity only."""
+        with self._lock:
+            self._refill()
+            return self._tokens >= tokens
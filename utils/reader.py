@@ -1,9 +1,15 @@
+import functools
+import json
 import logging
+import os
 import sys
-from typing import Tuple, Dict
+from typing import Tuple, Dict, Optional
 
 import yaml
 
+# libyaml's loader is several times faster when PyYAML was built with it
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 def load_yaml_file(file_path: str) -> dict:
     """
     Load a YAML file and return its contents as a dictionary.
@@ -13,7 +19,7 @@ def load_yaml_file(file_path: str) -> dict:
     """
     try:
         with open(file_path, 'r', encoding='utf-8') as file:
-            return yaml.safe_load(file)
+            return yaml.load(file, Loader=_YamlLoader)
     except yaml.YAMLError:
         logging.error(f"Error loading YAML file: {file_path}")
         sys.exit(1)
@@ -21,6 +27,16 @@ def load_yaml_file(file_path: str) -> dict:
         logging.error(f"File not found: {file_path}")
         sys.exit(1)
 
+@functools.lru_cache(maxsize=None)
+def load_config_file(config_path: str = "config.yaml") -> dict:
+    """
+    Load the configuration file once; later calls return the parsed contents.
+    
+    :param config_path: Path to the configuration YAML file.
+    :return: Contents of the configuration file, empty if the file is empty.
+    """
+    return load_yaml_file(config_path) or {}
+
 def load_config(config_path: str = "config.yaml") -> Tuple[str, str, str, str]:
     """
     Load the configuration file and return the required values.
@@ -28,7 +44,7 @@ def load_config(config_path: str = "config.yaml") -> Tuple[str, str, str, str]:
     :param config_path: Path to the configuration YAML file.
     :return: A tuple containing username, API key, API secret, and app language.
     """
-    config = load_yaml_file(config_path)
+    config = load_config_file(config_path)
     try:
         username = config.get('USER', {}).get('USERNAME')
         api_key = config.get('API', {}).get('KEY')
@@ -45,19 +61,85 @@ def load_config(config_path: str = "config.yaml") -> Tuple[str, str, str, str]:
         logging.error(f"Error validating configuration: {e}")
         sys.exit(1)
 
-def load_translations(app_lang: str, translations_path: str) -> Dict[str, str]:
+def load_section(section: str, config_path: str = "config.yaml") -> dict:
+    """
+    Load an optional section of the configuration file.
+    
+    :param section: Top-level key of the section, e.g. 'METRICS'.
+    :param config_path: Path to the configuration YAML file.
+    :return: The section as a dictionary, empty if it is not present.
+    """
+    return load_config_file(config_path).get(section) or {}
+
+def _read_translation_cache(cache_path: str, source_stamp: list) -> Optional[Dict[str, str]]:
+    """
+    Read a precompiled translation cache if it was built from the current translations file.
+    
+    :param cache_path: Path to the JSON cache file.
+    :param source_stamp: [mtime_ns, size] of the translations file.
+    :return: The cached translations, or None if the cache is missing or stale.
+    """
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as file:
+            cached = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if cached.get('source') != source_stamp:
+        return None
+    return cached.get('translations')
+
+def _write_translation_cache(cache_path: str, source_stamp: list, translations: Dict[str, str]) -> None:
+    """
+    Write the translations of one language to a JSON cache file.
+    
+    :param cache_path: Path to the JSON cache file.
+    :param source_stamp: [mtime_ns, size] of the translations file.
+    :param translations: Translations of the active language.
+    """
+    try:
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{cache_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'source': source_stamp, 'translations': translations}, file, ensure_ascii=False)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        logging.debug(f"Could not write translation cache {cache_path}: {e}")
+
+def load_translations(app_lang: str, translations_path: str, cache_dir: Optional[str] = None) -> Dict[str, str]:
     """
     Load the translations file and return the translations for the specified language.
     
+    When cache_dir is given, the active language is kept in a small JSON file
+    there and the YAML file is only parsed again after it changes.
+    
     :param app_lang: Language code for the translations.
     :param translations_path: Path to the translations YAML file.
+    :param cache_dir: Directory for the precompiled translation cache, or None to always parse the YAML file.
     :return: A dictionary containing translations for the specified language.
     """
+    cache_path = None
+    if cache_dir:
+        try:
+            stat = os.stat(translations_path)
+            source_stamp = [stat.st_mtime_ns, stat.st_size]
+            cache_path = os.path.join(cache_dir, f"translations-{app_lang}.json")
+        except OSError:
+            pass # Reported by load_yaml_file below
+    if cache_path:
+        cached = _read_translation_cache(cache_path, source_stamp)
+        if cached is not None:
+            logging.info('Translations have been successfully loaded from the cache.')
+            return cached
+
     translations = load_yaml_file(translations_path)
     try:
         language_translations = translations[app_lang]
         logging.info('Translations have been successfully loaded from the file.')
-        return language_translations
     except KeyError:
         logging.error(f"Translations file missing specified language: {app_lang}")
         sys.exit(1)
+    if cache_path:
+        _write_translation_cache(cache_path, source_stamp, language_translations)
+    return language_translations
@@ -0,0 +1,143 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('recording')
+
+RECORDING_VERSION = 1
+
+class RecordingPresence:
+    """Wraps a pypresence Presence and records every call with its duration."""
+
+    def __init__(self, presence, recorder):
+        self._presence = presence
+        self._recorder = recorder
+
+    def _call(self, op, method, *args, **kwargs):
+        start = time.perf_counter()
+        error = None
+        try:
+            return getattr(self._presence, method)(*args, **kwargs)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self._recorder.record('discord', op=op, elapsed=round(time.perf_counter() - start, 4), error=error,
+                                  details=kwargs.get('details'), state=kwargs.get('state'))
+
+    def connect(self):
+        return self._call('connect', 'connect')
+
+    def update(self, **kwargs):
+        return self._call('update', 'update', **kwargs)
+
+    def clear(self, *args, **kwargs):
+        return self._call('clear', 'clear', *args, **kwargs)
+
+    def close(self):
+        return self._call('close', 'close')
+
+class Recorder:
+    """
+    Captures the Last.fm and Discord interactions of a live session.
+
+    Every event is one JSON line in a gzip file, timestamped relative to the
+    start of the recording. Page bodies are stored once per distinct content
+    and referenced by hash, which keeps hours-long sessions small.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self._origin = 0.0
+        self._blobs = set()
+        self.path = None
+
+    @property
+    def active(self):
+        return self._file is not None
+
+    def start(self, path, **header):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._file = gzip.open(path, 'wt', encoding='utf-8')
+            self._origin = time.monotonic()
+            self._blobs.clear()
+            self.path = path
+        self.record('header', version=RECORDING_VERSION, started=time.time(), **header)
+        logger.info(f"Recording session to {path}")
+
+    def stop(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                logger.info(f"Recording saved to {self.path}")
+
+    def record(self, kind, **data):
+        if self._file is None:
+            return
+        line = {'t': round(time.monotonic() - self._origin, 3), 'kind': kind}
+        line.update(data)
+        self._write(line)
+
+    def record_http(self, url, status_code, content, elapsed):
+        """Records a page fetch. The body is stored once and referenced by its hash."""
+        if self._file is None:
+            return
+        blob_id = hashlib.sha1(content).hexdigest()
+        if blob_id not in self._blobs:
+            self._blobs.add(blob_id)
+            # latin-1 maps bytes to code points one to one, so bodies round-trip exactly
+            self._write({'kind': 'blob', 'id': blob_id, 'data': content.decode('latin-1')})
+        self.record('http', url=url, status=status_code, blob=blob_id, elapsed=round(elapsed, 4))
+
+    def wrap_presence(self, presence):
+        return RecordingPresence(presence, self)
+
+    def _write(self, line):
+        with self._lock:
+            if self._file is not None:
+                self._file.write(json.dumps(line, ensure_ascii=False, default=str) + '\n')
+
+def load_recording(path):
+    """
+    Reads a recording into lookup tables for replay.
+
+    Returns:
+        dict: 'polls' as a time-ordered list of (t, track or None),
+        'track_info' keyed by track, 'http' keyed by URL (status, body),
+        'discord' events, 'duration' in seconds and the 'header'.
+    """
+    blobs = {}
+    recording = {'header': {}, 'polls': [], 'track_info': {}, 'http': {}, 'discord': [], 'duration': 0.0}
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        try:
+            for raw in file:
+                line = json.loads(raw)
+                kind = line['kind']
+                recording['duration'] = max(recording['duration'], line.get('t', 0.0))
+                if kind == 'blob':
+                    blobs[line['id']] = line['data'].encode('latin-1')
+                elif kind == 'header':
+                    recording['header'] = line
+                elif kind == 'poll':
+                    recording['polls'].append((line['t'], line['track']))
+                elif kind == 'track_info':
+                    recording['track_info'][line['track']] = line['info']
+                elif kind == 'http':
+                    recording['http'][line['url']] = (line['status'], blobs[line['blob']])
+                elif kind == 'discord':
+                    recording['discord'].append(line)
+        except (EOFError, json.JSONDecodeError):
+            # The app was killed mid-write; keep everything up to the damaged tail
+            logger.warning(f"Recording {path} is truncated, replaying the readable part")
+    return recording
+
+recorder = Recorder()
@@ -1,12 +1,34 @@
+from __future__ import annotations
+
 import logging
 import time
+from typing import TYPE_CHECKING
+
+from constants.project import RETRY_INTERVAL, MAX_RETRIES, HTTP_TIMEOUT
+from utils.metrics import metrics
+from utils.tracing import tracer
+from utils.clock import clock
+from utils.recording import recorder
+
+# requests and bs4 are imported on first use so they stay off the startup path
+if TYPE_CHECKING:
+    import requests
+    from bs4 import BeautifulSoup
 
-import requests
-from bs4 import BeautifulSoup
+def _requests_get(url, timeout=HTTP_TIMEOUT):
+    import requests
+    return requests.get(url, timeout=timeout)
 
-from constants.project import RETRY_INTERVAL, MAX_RETRIES
+# Performs the actual GET request. Replaceable for replays and benchmarks.
+_http_get = _requests_get
 
-def get_response(url: str, retry_interval: int = RETRY_INTERVAL, max_retries: int = MAX_RETRIES) -> requests.Response:
+def set_http_get(func):
+    """Replaces the function used to perform GET requests, called as func(url, timeout). Pass None to restore requests.get."""
+    global _http_get
+    _http_get = func or _requests_get
+
+def get_response(url: str, retry_interval: int = RETRY_INTERVAL, max_retries: int = MAX_RETRIES,
+                 timeout: float = HTTP_TIMEOUT) -> requests.Response:
     """
     Connects to the specified URL and retries until a successful response is received or the max retries limit is reached.
     
@@ -14,6 +36,7 @@ def get_response(url: str, retry_interval: int = RETRY_INTERVAL, max_retries: in
         url (str): The URL to send the request to.
         retry_interval (int): The time interval (in seconds) between retries. Default is 2 seconds.
         max_retries (int): The maximum number of retries before giving up. Default is 10 retries.
+        timeout (float): Seconds to wait for the server on each try.
     
     Returns:
         requests.Response: The response object from the request.
@@ -21,16 +44,27 @@ def get_response(url: str, retry_interval: int = RETRY_INTERVAL, max_retries: in
     Raises:
         requests.RequestException: If the request fails after the specified number of retries.
     """
+    import requests
+
     retries = 0
     while retries < max_retries:
         try:
-            response = requests.get(url)
+            metrics.inc('http_requests_total')
+            start = time.perf_counter()
+            response = _http_get(url, timeout)
             response.raise_for_status()
+            recorder.record_http(url, response.status_code, response.content, time.perf_counter() - start)
+            tracer.current().add('bytes_received', len(response.content))
             return response
         except requests.RequestException as e:
             retries += 1
+            if retries >= max_retries:
+                logging.warning(f"Request failed ({e})")
+                break
+            metrics.inc('http_retries_total')
+            tracer.current().add('retries')
             logging.warning(f"Request failed ({e}), retrying {retries}/{max_retries} in {retry_interval} seconds...")
-            time.sleep(retry_interval)
+            clock.sleep(retry_interval)
     
     logging.error(f"Failed to retrieve URL after {max_retries} retries: {url}")
     raise requests.RequestException(f"Failed to retrieve URL after {max_retries} retries: {url}")
@@ -45,4 +79,7 @@ def get_dom(response: requests.Response) -> BeautifulSoup:
     Returns:
         BeautifulSoup: The parsed HTML content.
     """
-    return BeautifulSoup(response.content, 'html.parser')
\ No newline at end of file
+    from utils.parsing import html_document
+
+    with tracer.span('parse'):
+        return html_document(response.content)
\ No newline at end of file
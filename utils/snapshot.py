@@ -0,0 +1,55 @@
+import json
+import logging
+import os
+import threading
+
+from utils.clock import clock
+
+logger = logging.getLogger('snapshot')
+
+SNAPSHOT_VERSION = 1
+
+_write_lock = threading.Lock()
+
+def read_snapshot(path):
+    """
+    Reads the last saved application state.
+
+    Returns:
+        dict: The snapshot, or None if it is missing, unreadable or from another version.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            snapshot = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable state snapshot {path}: {e}")
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+def write_snapshot(path, state):
+    """
+    Atomically writes the application state, stamped with the version and save time.
+
+    Returns:
+        bool: Whether the snapshot was written.
+    """
+    snapshot = {'version': SNAPSHOT_VERSION, 'saved_at': clock.time()}
+    snapshot.update(state)
+    with _write_lock:
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f'{path}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump(snapshot, file, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Could not save state snapshot {path}: {e}")
+            return False
+    logger.debug("State snapshot saved to %s", path)
+    return True
@@ -0,0 +1,39 @@
+import logging
+import threading
+import time
+
+from utils.metrics import metrics
+
+logger = logging.getLogger('startup')
+
+class StartupTimer:
+    """
+    Measures how long the app takes to become useful after launch.
+
+    Times are relative to the first import of this module, which main.py
+    does before anything else, so only interpreter startup is left out.
+    Each milestone is logged once and exported as a 'startup_<name>' stage.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.marks = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        """
+        Records the first occurrence of a milestone. Later calls are ignored.
+
+        Returns:
+            float: Seconds since launch, or None if the milestone was already recorded.
+        """
+        with self._lock:
+            if name in self.marks:
+                return None
+            elapsed = time.perf_counter() - self.origin
+            self.marks[name] = elapsed
+        metrics.observe_stage(f'startup_{name}', elapsed)
+        logger.info(f"Startup: {name.replace('_', ' ')} after {elapsed * 1000:.0f} ms")
+        return elapsed
+
+startup = StartupTimer()
@@ -0,0 +1,223 @@
+import contextvars
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from constants.project import (
+    TRACING_ENABLED, TRACING_PATH, TRACING_SAMPLE_RATE, TRACING_SLOW_ONLY_MS,
+    TRACING_MAX_BYTES, TRACING_BACKUPS
+)
+from utils.metrics import metrics
+
+logger = logging.getLogger('tracing')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    """A timed unit of work inside a trace. Attributes are free-form JSON values."""
+
+    __slots__ = ('name', 'attributes', 'children', 'start', 'duration')
+
+    def __init__(self, name, attributes, start):
+        self.name = name
+        self.attributes = attributes
+        self.children = []
+        self.start = start
+        self.duration = 0.0
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def add(self, key, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self, origin):
+        data = {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round(self.duration * 1000, 3),
+        }
+        # Copies: stages that finish late may still change the span on pool threads
+        attributes = dict(self.attributes)
+        children = list(self.children)
+        if attributes:
+            data['attributes'] = attributes
+        if children:
+            data['children'] = [child.to_dict(origin) for child in children]
+        return data
+
+class _NoopSpan:
+    """Stands in for a span when the current cycle is not being traced."""
+
+    __slots__ = ()
+
+    def set(self, key, value):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class JsonlWriter:
+    """
+    Appends JSON records to a size-rotated file from a background thread.
+
+    Records are queued without blocking; if the writer falls behind, new
+    records are dropped and counted rather than stalling the caller.
+    """
+
+    def __init__(self, path, max_bytes, backups, max_queue=1000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, record):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='trace-writer', daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=2):
+        """Flushes pending records and stops the writer thread."""
+        if self._thread is not None:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                return
+            self._thread.join(timeout)
+
+    def _rotate(self, file):
+        file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f'{self.path}.{index}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.path}.{index + 1}')
+        if self.backups > 0:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+        return open(self.path, 'a', encoding='utf-8')
+
+    def _run(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            file = open(self.path, 'a', encoding='utf-8')
+        except OSError as e:
+            logger.error(f"Could not open trace file {self.path}: {e}")
+            return
+
+        with file:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                try:
+                    file.write(json.dumps(record, default=str) + '\n')
+                    if self._queue.empty():
+                        file.flush()
+                    if self.max_bytes and file.tell() >= self.max_bytes:
+                        file = self._rotate(file)
+                except Exception as e:
+                    # One bad record must not stop the writer
+                    logger.error(f"Error writing trace record: {e}")
+            file.flush()
+
+class Tracer:
+    """
+    Builds per-cycle traces of nested spans.
+
+    Every span also records its duration in the 'stage_seconds' metric, so
+    stages are measured even when the cycle itself is not sampled.
+    """
+
+    def __init__(self, enabled=TRACING_ENABLED, path=TRACING_PATH, sample_rate=TRACING_SAMPLE_RATE,
+                 slow_only_ms=TRACING_SLOW_ONLY_MS, max_bytes=TRACING_MAX_BYTES, backups=TRACING_BACKUPS):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_only_ms = slow_only_ms
+        self.writer = JsonlWriter(path, max_bytes, backups)
+
+    def _should_record(self):
+        if not self.enabled:
+            return False
+        # In slow-only mode every cycle is recorded; the export decision happens at the end
+        return self.slow_only_ms > 0 or random.random() < self.sample_rate
+
+    @contextmanager
+    def trace(self, name, **attributes):
+        """Opens the root span of a new trace (one per worker cycle)."""
+        if _current_span.get() is not None or not self._should_record():
+            with self.span(name, **attributes) as span:
+                yield span
+            return
+
+        root = Span(name, attributes, time.perf_counter())
+        token = _current_span.set(root)
+        timestamp = datetime.datetime.now().isoformat(timespec='milliseconds')
+        try:
+            yield root
+        except BaseException as e:
+            root.set('error', type(e).__name__)
+            raise
+        finally:
+            root.duration = time.perf_counter() - root.start
+            _current_span.reset(token)
+            metrics.observe_stage(name, root.duration)
+            if root.duration * 1000 >= self.slow_only_ms:
+                record = root.to_dict(root.start)
+                record['trace_id'] = uuid.uuid4().hex
+                record['timestamp'] = timestamp
+                self.writer.submit(record)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Times a stage as a child of the current span (if a trace is active)."""
+        parent = _current_span.get()
+        start = time.perf_counter()
+        if parent is None:
+            try:
+                yield NOOP_SPAN
+            finally:
+                metrics.observe_stage(name, time.perf_counter() - start)
+            return
+
+        span = Span(name, attributes, start)
+        parent.children.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set('error', type(e).__name__)
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            _current_span.reset(token)
+            metrics.observe_stage(name, span.duration)
+
+    def current(self):
+        """Returns the innermost active span, or a no-op span outside of traces."""
+        return _current_span.get() or NOOP_SPAN
+
+    def close(self):
+        self.writer.close()
+
+tracer = Tracer()